@@ -1,70 +1,122 @@
 import pathlib
 import utils
-from docx import Document
 from docx.shared import Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from math import ceil
-from PIL import Image
+import io
 import os
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+import functools
+from png_cache import ConversionCache
+from policy_files import PolicyFiles
+from shortbaseline import ShortBaseline
+import manifest
+import profiling
+import eps_raster
+import imaging
+
+# 縮圖的解析度設定
+THUMBNAIL_DPI = 150
+THUMBNAIL_HEIGHT_CM = 3.8
+
+# 要貼進干涉圖表格的影像 (BMP 一組、GeoTIFF 一組)
+IMAGE_PATTERNS = ['*.tflt.filt.de.bmp', '*.tflt.filt.de.geo.tif']
+
+def _make_tc_borders(is_top, is_left, is_bottom, is_right):
+    thin_border = {"sz": 4, "val": "single", "color": "auto"}
+    thick_border = {"sz": 12, "val": "single", "color": "auto"}
+
+    tcBorders = OxmlElement('w:tcBorders')
+    for tag, is_thick in (('w:top', is_top), ('w:left', is_left),
+                          ('w:bottom', is_bottom), ('w:right', is_right)):
+        border_el = OxmlElement(tag)
+        for key, val in (thick_border if is_thick else thin_border).items():
+            border_el.set(qn(f'w:{key}'), str(val))
+        tcBorders.append(border_el)
+    return tcBorders
+
+def _set_row_borders(tr, is_top, is_bottom, templates):
+    """
+    Replaces the borders of every cell of tr with a copy of one of the 16
+    prebuilt w:tcBorders elements, cached in templates by cell position.
+    """
+    tcBorders_tag = qn('w:tcBorders')
+    cells = tr.tc_lst
+    last_col = len(cells) - 1
+    for j, tc in enumerate(cells):
+        tcPr = tc.get_or_add_tcPr()
+        for border in tcPr.findall(tcBorders_tag):
+            tcPr.remove(border)
+
+        position = (is_top, j == 0, is_bottom, j == last_col)
+        template = templates.get(position)
+        if template is None:
+            template = templates[position] = _make_tc_borders(*position)
+        tcPr.append(deepcopy(template))
 
 def set_table_borders(table):
     """
     Applies specific border styling to a table:
     - Thick outer borders
     - Thin inner borders
+    Assumes the table has no merged cells.
     """
-    # Define border styles
-    thin_border = {"sz": 4, "val": "single", "color": "auto"}
-    thick_border = {"sz": 12, "val": "single", "color": "auto"}
+    templates = {}
+    rows = table._tbl.tr_lst
+    for i, tr in enumerate(rows):
+        _set_row_borders(tr, i == 0, i == len(rows) - 1, templates)
 
-    # Iterate through each cell to set borders
-    for i, row in enumerate(table.rows):
-        for j, cell in enumerate(row.cells):
-            tcPr = cell._tc.get_or_add_tcPr()
-            tcBorders = OxmlElement('w:tcBorders')
-
-            # Clear existing borders
-            for border in tcPr.findall(qn('w:tcBorders')):
-                tcPr.remove(border)
-
-            # Determine border type based on cell position
-            is_top = (i == 0)
-            is_left = (j == 0)
-            is_bottom = (i == len(table.rows) - 1)
-            is_right = (j == len(row.cells) - 1)
-
-            # Top border
-            top_border = thick_border if is_top else thin_border
-            border_el = OxmlElement('w:top')
-            for key, val in top_border.items():
-                border_el.set(qn(f'w:{key}'), str(val))
-            tcBorders.append(border_el)
-
-            # Left border
-            left_border = thick_border if is_left else thin_border
-            border_el = OxmlElement('w:left')
-            for key, val in left_border.items():
-                border_el.set(qn(f'w:{key}'), str(val))
-            tcBorders.append(border_el)
-
-            # Bottom border
-            bottom_border = thick_border if is_bottom else thin_border
-            border_el = OxmlElement('w:bottom')
-            for key, val in bottom_border.items():
-                border_el.set(qn(f'w:{key}'), str(val))
-            tcBorders.append(border_el)
-
-            # Right border
-            right_border = thick_border if is_right else thin_border
-            border_el = OxmlElement('w:right')
-            for key, val in right_border.items():
-                border_el.set(qn(f'w:{key}'), str(val))
-            tcBorders.append(border_el)
-            
-            tcPr.append(tcBorders)
+def write_table_rows(table, rows_text, template_row_index=1):
+    """
+    Replaces every row after the header with one row per entry of rows_text,
+    in a single lxml pass. Each row is a copy of the template row with its
+    cell content reset to one centered paragraph holding the given text, and
+    the thick-outside/thin-inside borders of set_table_borders already set.
+    The header row is centered and bordered as well.
+    """
+    tbl = table._tbl
+    trs = tbl.tr_lst
+    if len(trs) <= template_row_index:
+        table.add_row()
+        trs = tbl.tr_lst
+    header_tr = trs[0]
+    template_tr = trs[template_row_index]
+
+    # 原型列: 保留列高與儲存格格式，內容換成置中的空段落
+    prototype = deepcopy(template_tr)
+    for attr in list(prototype.attrib):
+        if attr.startswith('{http://schemas.microsoft.com/office/word/2010/wordml}'):
+            del prototype.attrib[attr]
+    for tc in prototype.tc_lst:
+        for child in list(tc):
+            if child.tag != qn('w:tcPr'):
+                tc.remove(child)
+        p = tc.add_p()
+        p.get_or_add_pPr().jc_val = WD_ALIGN_PARAGRAPH.CENTER
+        p.add_r()
+
+    for tr in trs[1:]:
+        tbl.remove(tr)
+
+    border_templates = {}
+    for p in header_tr.iter(qn('w:p')):
+        p.get_or_add_pPr().jc_val = WD_ALIGN_PARAGRAPH.CENTER
+    _set_row_borders(header_tr, True, not rows_text, border_templates)
+
+    middle_row = deepcopy(prototype)
+    _set_row_borders(middle_row, False, False, border_templates)
+    last_row = deepcopy(prototype)
+    _set_row_borders(last_row, False, True, border_templates)
+
+    for r_idx, row_text in enumerate(rows_text):
+        tr = deepcopy(last_row if r_idx == len(rows_text) - 1 else middle_row)
+        for tc, txt in zip(tr.tc_lst, row_text):
+            if txt:
+                tc[-1][-1].add_t(txt)
+        tbl.append(tr)
 
 def fill_cell(cell, txt):
     # This function seems to assume there is a run already.
@@ -80,23 +132,135 @@ def delete_paragraph(paragraph):
     p._p = p._element = None
 
 
+def encode_thumbnail(image_path, target_h_cm, memory_budget=imaging.DEFAULT_MEMORY_BUDGET):
+    """
+    Opens a BMP image, resizes it based on a target physical height and a set DPI,
+    and encodes it as a PNG in memory. Avoids upscaling.
+    Images whose decoded pixels exceed memory_budget are read at reduced resolution.
+    Returns an imaging.EncodedImage, or None for images without height.
+    """
+    with imaging.open_image(image_path) as img:
+        w, h = img.size
+        if h == 0: return None # Avoid division by zero for invalid images
+        aspect_ratio = w / h
+
+        # Convert target height to pixels based on DPI (1 inch = 2.54 cm)
+        target_h_px = int((target_h_cm / 2.54) * THUMBNAIL_DPI)
+        target_w_px = int(target_h_px * aspect_ratio)
+
+        # Resize the image only if it's larger than the target
+        if w > target_w_px:
+            # 使用 LANCZOS 濾波器以獲得較好的縮圖品質 (舊版 Pillow 相容)
+            img = imaging.resize_within_budget(img, image_path, (target_w_px, target_h_px), memory_budget)
+        # If the original image is smaller, just convert it
+
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', dpi=(THUMBNAIL_DPI, THUMBNAIL_DPI))
+        return imaging.EncodedImage(os.path.basename(image_path) + '.png', buffer.getvalue(),
+                                    img.width, img.height, THUMBNAIL_DPI)
+
+def convert_image(image_path, png_path, target_h_cm, memory_budget=imaging.DEFAULT_MEMORY_BUDGET, write_png=True):
+    """
+    Process-pool friendly wrapper around encode_thumbnail.
+    Returns (encoded, error) where error is None on success, so one broken
+    image does not abort the whole batch. The PNG is written to png_path
+    only when write_png is set.
+    """
+    try:
+        encoded = encode_thumbnail(image_path, target_h_cm, memory_budget)
+        if encoded is None:
+            return None, '影像高度為 0'
+        if write_png:
+            with open(png_path, 'wb') as f:
+                f.write(encoded.blob)
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+    return encoded, None
+
+def convert_images(image_paths, memory_budget=imaging.DEFAULT_MEMORY_BUDGET):
+    """
+    Converts a chunk of images in memory and returns one (encoded, error)
+    pair per path, like convert_image. Used by deliver.py to spread the
+    thumbnails of every policy over one shared pool.
+    """
+    return [convert_image(image_path, None, THUMBNAIL_HEIGHT_CM, memory_budget, write_png=False)
+            for image_path in image_paths]
+
+def conversion_cache_dir(policy_dir):
+    return os.path.join(policy_dir, 'tmp', 'converted_pngs', '.cache')
+
+def thumbnail_cache_key(entry, memory_budget=imaging.DEFAULT_MEMORY_BUDGET):
+    """
+    Conversion cache key of the thumbnail of a policy_files.FileEntry.
+    memory_budget is part of the key since it decides whether large images
+    are read at reduced resolution.
+    """
+    return ConversionCache.make_key(entry.path, source_stat=entry, target_h_cm=THUMBNAIL_HEIGHT_CM,
+                                    dpi=THUMBNAIL_DPI, memory_budget=memory_budget)
+
+def image_filename(image):
+    """
+    Returns the file name of a converted image, given either its path or an
+    imaging.EncodedImage.
+    """
+    if isinstance(image, imaging.EncodedImage):
+        return image.filename
+    return os.path.basename(image)
+
+
+def generate_image_pages(prototype, table_num):
+    """
+    Yields the body elements of table_num image pages, each a fresh copy of
+    the elements of prototype (see Policy._image_page_prototype).
+    """
+    for _ in range(table_num):
+        for element in prototype:
+            yield deepcopy(element)
+
+
 class Policy:
 
-    def __init__(self, policy_dir, index, areas=None):
+    def __init__(self, policy_dir, index, areas=None, convert_workers=1,
+                 use_cache=True, cache_max_bytes=512 * 1024 * 1024,
+                 memory_budget=imaging.DEFAULT_MEMORY_BUDGET, in_memory_images=False, keep_pngs=False,
+                 files=None):
         self.index = index
         self.areas = areas
         self.policy_dir = policy_dir
 
+        # 資料夾內容索引，所有檔案查詢都從這裡取得，不再逐一 stat
+        self.files = files if files is not None else PolicyFiles(policy_dir)
+
+        # 基線圖 EPS 轉檔的背景 process 及快取位置
+        self._eps_process = None
+        self._eps_started = False
+        self.eps_cache_dir = os.path.join(policy_dir, 'tmp', 'eps_cache')
+
+        # 影像標頭資訊 (尺寸、位元深度、DPI)，依 mtime 保存在 tmp 中重複使用
+        self.image_index = imaging.ImageMetadataIndex(os.path.join(policy_dir, 'tmp', 'image_metadata.json'))
+
+        # 影像轉檔使用的 process 數量，1 代表不開 process pool
+        self.convert_workers = convert_workers
+        self.conversion_failures = []
+        self.memory_budget = memory_budget
+
+        # in_memory_images 時縮圖以 imaging.EncodedImage 直接貼進文件，
+        # 只有 keep_pngs 時才另外寫到 tmp\converted_pngs 方便除錯
+        self.in_memory_images = in_memory_images
+        self.keep_pngs = keep_pngs
+
+        # 轉檔快取，None 代表每次都重新轉檔
+        self.conversion_cache = None
+        if use_cache:
+            self.conversion_cache = ConversionCache(conversion_cache_dir(policy_dir), max_bytes=cache_max_bytes)
+
         # 把 baseline 開出來
-        self.shortbaseline = []
-        with open(policy_dir + '\\postprocessing\\shortbaseline') as f:
-            for line in f:
-                self.shortbaseline.append(line.split('\t'))
+        self.shortbaseline = ShortBaseline.load(policy_dir + '\\postprocessing\\shortbaseline')
 
         # 開啟對應的範例
         self.policy_length = len(self.shortbaseline)
         try:
-            self.document = Document("templates\\baseline.docx")
+            self.document = utils.load_template("templates\\baseline.docx")
         except Exception as e:
             raise FileNotFoundError("找不到 'templates\\baseline.docx' 範本檔案，請從 'templates' 資料夾中任選一個 .docx 檔案，並將其改名為 'baseline.docx'") from e
 
@@ -104,15 +268,13 @@ class Policy:
         """
         Finds the first available image and returns its aspect ratio.
         """
-        for idx, row in enumerate(self.shortbaseline):
-            day1, day2, distance, period = self.shortbaseline[idx]
-            filename = day1 + '-' + day2 + '.tflt.filt.de'
-            bmp_path = self.policy_dir + '\\postprocessing\\detrend_obs_file\\' + filename + '.bmp'
-            if os.path.isfile(bmp_path):
-                with Image.open(bmp_path) as img:
-                    w, h = img.size
-                    if h > 0:
-                        return w / h
+        for pair in self.shortbaseline:
+            filename = pair.name + '.tflt.filt.de'
+            entry = self.files.get('postprocessing/detrend_obs_file/' + filename + '.bmp')
+            if entry is not None and not entry.is_dir:
+                info = self.image_index.lookup_entry(entry)
+                if info is not None and info.height > 0:
+                    return info.width / info.height
         return 1.0 # Default to square if no image is found
 
     def _get_layout_params(self):
@@ -170,55 +332,83 @@ class Policy:
         return (best_layout['cell_per_row'], best_layout['cell_size'])
 
     def check_bmp_path(self):
-        for idx, row in enumerate(self.shortbaseline):
-            day1, day2, distance, period = self.shortbaseline[idx]
+        for pair in self.shortbaseline:
 
             # 檢查檔案名
-            filename = day1 + '-' + day2 + '.tflt.filt.de'
+            filename = pair.name + '.tflt.filt.de'
             bmp_path = self.policy_dir + '\\postprocessing\\detrend_obs_file\\' + filename + '.bmp'
-            if not os.path.isfile(bmp_path):
+            entry = self.files.get('postprocessing/detrend_obs_file/' + filename + '.bmp')
+            if entry is None or entry.is_dir:
                 print(filename, '被列於 shortbaseline 檔案但對應的', bmp_path, '並不存在')
                 #return bmp_path
+                continue
 
+            # 只讀標頭檢查影像是否可用
+            info = self.image_index.lookup_entry(entry)
+            if info is None or info.width == 0 or info.height == 0:
+                print(bmp_path, '無法讀取影像標頭或影像大小為 0')
 
+
+    def start_eps_rasterization(self):
+        """
+        Starts rasterizing shortbaseline_plot.eps in a background process so
+        Ghostscript runs while images are converted and tables are filled.
+        export_eps_to_png waits for it.
+        """
+        plot = 'shortbaseline_plot.eps'
+        self.image_path = self.policy_dir + '\\' + 'shortbaseline_plot.png'
+        self._eps_process = eps_raster.start_rasterize(
+            self.policy_dir + '\\' + plot, self.image_path, scale=3, cache_dir=self.eps_cache_dir)
+        self._eps_started = True
+
+    def stop_eps_rasterization(self):
+        """
+        Terminates the background rasterization if it is still running, e.g.
+        when building the document failed before export_eps_to_png.
+        """
+        if self._eps_process is not None:
+            self._eps_process.terminate()
+            self._eps_process.wait()
+            self._eps_process = None
+        self._eps_started = False
+
+    @profiling.profiled()
     def export_eps_to_png(self):
 
         plot = 'shortbaseline_plot.eps'
-        eps_image = Image.open( self.policy_dir + '\\' + plot)
-        eps_image.load(scale=3)
         self.image_path = self.policy_dir + '\\' + 'shortbaseline_plot.png'
-        eps_image.save(self.image_path)
+        if not self._eps_started:
+            eps_raster.rasterize(self.policy_dir + '\\' + plot, self.image_path, scale=3, cache_dir=self.eps_cache_dir)
+        elif self._eps_process is not None:
+            returncode = self._eps_process.wait()
+            self._eps_process = None
+            if returncode != 0:
+                raise RuntimeError('無法將 ' + self.policy_dir + '\\' + plot + ' 轉為 png')
+        self._eps_started = False
 
     def extract_dates(self):
-        days = []
-        for data_row in self.shortbaseline:
-            day1, day2, distance, period = data_row
-            if day1 not in days:
-                days.append(day1)
-            if day2 not in days:
-                days.append(day2)
-        days.sort()
-        return days
+        # 載入時已排序並去除重複
+        return list(self.shortbaseline.dates)
    
     def fill_dates(self):
 
         # 填寫下降軌雷達列表中的圖幅編號
         cell = self.document.tables[0].rows[1].cells[1]
-        dates = self.extract_dates()
+        dates = self.shortbaseline.dates
         fill_cell(cell, '、'.join(dates) + '。')
 
 
     def fill_years(self, bmp_filepaths, tif_filepaths):
 
         def minmax_days_from_img_filepaths(img_filepaths):
-            img_filenames = [os.path.basename(path).split('.')[0] for path in img_filepaths]
+            img_filenames = [image_filename(path).split('.')[0] for path in img_filepaths]
             day_pairs = [filename.split('-') for filename in img_filenames]
             days = [day for day_pair in day_pairs for day in day_pair]
             return min(days), max(days)
 
         # paragraphs[6].runs[2] 是 '取代ALOS-2雷達衛星years之時空基線圖裡的年份' 中間的 years
-        dates = self.extract_dates()
-        shortbaseline_day_range = "{d1}-{d2}".format(d1=str(dates[0]), d2=str(dates[-1]))
+        dates = self.shortbaseline.dates
+        shortbaseline_day_range = "{d1}-{d2}".format(d1=dates[0], d2=dates[-1])
         baseline_image_title_years = self.document.paragraphs[6].runs[2]
         baseline_image_title_years.text = shortbaseline_day_range
 
@@ -260,109 +450,40 @@ class Policy:
             areas[i] = '\n' + areas[i]
         area_run.text = '、'.join(areas) + '。'
 
+    @profiling.profiled()
     def fill_image_metadata(self):
         table = self.document.tables[1]
-    
-        row_number = ceil(self.policy_length / 2)
-
-        # 動態增刪表格列
-        current_rows = len(table.rows) - 1
-        
-        template_row = None
-        if current_rows > 0 and len(table.rows) > 1:
-            template_row = table.rows[1]
-
-        if row_number > current_rows:
-            for _ in range(row_number - current_rows):
-                new_row = table.add_row()
-                if template_row:
-                    # 套用列高
-                    new_row.height = template_row.height
-                    new_row.height_rule = template_row.height_rule
-                    # 複製儲存格格式 (包含底色)
-                    for i, template_cell in enumerate(template_row.cells):
-                        new_cell = new_row.cells[i]
-                        new_tcPr = deepcopy(template_cell._tc.get_or_add_tcPr())
-                        p = new_cell._tc.get_or_add_tcPr()
-                        p.getparent().replace(p, new_tcPr)
-
-        elif row_number < current_rows:
-            for i in range(current_rows - row_number):
-                row_to_remove = table.rows[current_rows - i]
-                row_to_remove._element.getparent().remove(row_to_remove._element)
-
-        # 清空可能存在的舊資料
-        for r_idx in range(1, len(table.rows)):
-            for c_idx in range(len(table.columns)):
-                fill_cell(table.rows[r_idx].cells[c_idx], "")
-
-        # 開始填表 (左半)
-        for idx in range(row_number):
-            if idx >= len(self.shortbaseline): break
-            day1, day2, distance, period = self.shortbaseline[idx]
-            cells = table.rows[idx+1].cells
-            fill_cell(cells[0], str(idx + 1)) # 填寫 NO
-            fill_cell(cells[1], day1 + '-' + day2)
-            fill_cell(cells[2], str(round(float(distance), 3)))
-            fill_cell(cells[3], period.strip())
-
-        # 繼續填表 (右半)
-        for idx in range(row_number, len(self.shortbaseline)):
-            day1, day2, distance, period = self.shortbaseline[idx]
-            row_index_in_table = idx - row_number + 1
-            cells = table.rows[row_index_in_table].cells
-            fill_cell(cells[4], str(idx + 1)) # 填寫 NO
-            fill_cell(cells[5], day1 + '-' + day2)
-            fill_cell(cells[6], str(round(float(distance), 3)))
-            fill_cell(cells[7], period.strip())
-
-        # 將表格內所有文字置中
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # 套用邊框樣式
-        set_table_borders(table)
-
-    def _resize_and_save_image(self, bmp_path, png_path, target_h_cm):
-        """
-        Opens a BMP image, resizes it based on a target physical height and a set DPI,
-        and saves it as a PNG. Avoids upscaling.
-        """
-        with Image.open(bmp_path) as img:
-            w, h = img.size
-            if h == 0: return # Avoid division by zero for invalid images
-            aspect_ratio = w / h
-
-            # Define a reasonable DPI for document images
-            DPI = 150
-            
-            # Convert target height to pixels based on DPI (1 inch = 2.54 cm)
-            target_h_px = int((target_h_cm / 2.54) * DPI)
-            target_w_px = int(target_h_px * aspect_ratio)
-
-            # Resize the image only if it's larger than the target
-            if w > target_w_px:
-                # 使用 LANCZOS 濾波器以獲得較好的縮圖品質 (舊版 Pillow 相容)
-                img_resized = img.resize((target_w_px, target_h_px), Image.LANCZOS)
-                img_resized.save(png_path)
-            else:
-                # If the original image is smaller, just convert and save
-                img.save(png_path)
-
 
+        row_number = ceil(self.policy_length / 2)
+        column_number = len(table._tbl.tblGrid.gridCol_lst)
+
+        # 左半填前一半的影像對，右半接著填剩下的
+        rows_text = [[''] * column_number for _ in range(row_number)]
+        for idx, pair in enumerate(self.shortbaseline):
+            row_text = rows_text[idx % row_number]
+            offset = 0 if idx < row_number else 4
+            row_text[offset + 0] = str(idx + 1) # 填寫 NO
+            row_text[offset + 1] = pair.name
+            row_text[offset + 2] = str(round(pair.distance, 3))
+            row_text[offset + 3] = pair.period
+
+        # 一次建好所有資料列，並設定置中及邊框樣式
+        write_table_rows(table, rows_text)
+
+    @profiling.profiled()
     def fill_image_table(self, start_table_index, image_paths):
 
         cell_per_row = 4
         img_num_per_table = 20
 
+        # document.tables 每次存取都會重建清單，先取一次
+        tables = self.document.tables
         for idx, image_path in enumerate(image_paths):
             table_index = start_table_index + idx // img_num_per_table
             fill_index = idx % img_num_per_table
-            table = self.document.tables[table_index]
+            table = tables[table_index]
 
-            filename = os.path.basename(image_path)
+            filename = image_filename(image_path)
             date_str = filename.split('.', 1)[0]
 
             row_idx = (fill_index // cell_per_row) * 2
@@ -375,64 +496,138 @@ class Policy:
             cell = table.rows[row_idx + 1].cells[col_idx]
             cell._element.clear_content()
             p = cell.add_paragraph()
-            p.add_run().add_picture(image_path, height=Cm(3.8))
+            if not isinstance(image_path, imaging.EncodedImage):
+                image_path = self._load_converted_png(image_path)
+            utils.add_encoded_picture(p.add_run(), image_path, height=Cm(THUMBNAIL_HEIGHT_CM))
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
 
-    def _preprocess_images(self, search_dir, file_pattern):
-        import glob
-
-        # 根據參數掃描資料夾取得所有影像
-        search_path = os.path.join(self.policy_dir, search_dir)
-        image_paths = glob.glob(os.path.join(search_path, file_pattern))
-        image_paths.sort() # 確保順序一致
+    def _load_converted_png(self, png_path):
+        """
+        Reads a converted thumbnail and its header facts, so add_picture
+        does not need to parse the image again.
+        """
+        with open(png_path, 'rb') as f:
+            blob = f.read()
+        info = imaging.probe_image_header(io.BytesIO(blob))
+        dpi = info.dpi[0] if info.dpi else 72
+        return imaging.EncodedImage(os.path.basename(png_path), blob, info.width, info.height, dpi)
 
-        png_paths = []
+    def _preprocess_images(self, search_dir, file_pattern):
+        return self._preprocess_image_batches(search_dir, [file_pattern])[0]
 
+    @profiling.profiled('preprocess_images')
+    def _preprocess_image_batches(self, search_dir, file_patterns):
+        """
+        Converts every image matching each pattern into a PNG thumbnail.
+        All batches are submitted together so a process pool stays busy across
+        BMP and GeoTIFF files. Returns one sorted list per pattern, holding PNG
+        paths, or imaging.EncodedImage objects when in_memory_images is set;
+        images that fail to convert are reported and left out.
+        """
+        # 根據參數從資料夾索引取得所有影像
         tmp_path = os.path.join(self.policy_dir, 'tmp', 'converted_pngs')
-        pathlib.Path(tmp_path).mkdir(parents=True, exist_ok=True)
-        for idx, image_path in enumerate(image_paths):
-            filename = os.path.basename(image_path)
-            png_filename = filename + '.png'
-            png_path = os.path.join(tmp_path, png_filename)
-            target_h_cm = 3.8
-            self._resize_and_save_image(image_path, png_path, target_h_cm)
-            png_paths.append(png_path)
-
-        return png_paths
-
+        write_pngs = not self.in_memory_images or self.keep_pngs
+        if write_pngs:
+            pathlib.Path(tmp_path).mkdir(parents=True, exist_ok=True)
+        target_h_cm = THUMBNAIL_HEIGHT_CM
+
+        batches = []
+        entries = {}
+        for file_pattern in file_patterns:
+            jobs = []
+            for entry in self.files.glob(search_dir, file_pattern): # 已依路徑排序，確保順序一致
+                info = self.image_index.lookup_entry(entry)
+                if info is not None and info.height == 0:
+                    print('警告: 無法轉換', entry.path, '(影像高度為 0)')
+                    self.conversion_failures.append((entry.path, '影像高度為 0'))
+                    continue
+                png_path = os.path.join(tmp_path, entry.name + '.png')
+                entries[png_path] = entry
+                jobs.append((entry.path, png_path))
+            batches.append(jobs)
+
+        # 快取命中的影像直接取用，不必重新轉檔
+        cache = self.conversion_cache
+        converted = {}
+        all_jobs = []
+        cache_keys = {}
+        for image_path, png_path in (job for jobs in batches for job in jobs):
+            if cache is not None:
+                key = thumbnail_cache_key(entries[png_path], self.memory_budget)
+                blob = cache.read(key)
+                if blob is not None:
+                    converted[png_path] = imaging.EncodedImage.from_png_blob(
+                        os.path.basename(png_path), blob, THUMBNAIL_DPI)
+                    if write_pngs:
+                        with open(png_path, 'wb') as f:
+                            f.write(blob)
+                    continue
+                cache_keys[png_path] = key
+            all_jobs.append((image_path, png_path))
+
+        if self.convert_workers > 1 and len(all_jobs) > 1:
+            with ProcessPoolExecutor(max_workers=self.convert_workers) as executor:
+                futures = [executor.submit(convert_image, image_path, png_path, target_h_cm,
+                                           self.memory_budget, write_pngs)
+                           for image_path, png_path in all_jobs]
+                results = [future.result() for future in futures]
+        else:
+            results = [convert_image(image_path, png_path, target_h_cm, self.memory_budget, write_pngs)
+                       for image_path, png_path in all_jobs]
+
+        for (image_path, png_path), (encoded, error) in zip(all_jobs, results):
+            if error is not None:
+                print('警告: 無法轉換', image_path, '(' + error + ')')
+                self.conversion_failures.append((image_path, error))
+                continue
+            converted[png_path] = encoded
+            if cache is not None:
+                cache.write(cache_keys[png_path], encoded.blob)
+
+        if cache is not None:
+            cache.save()
+        self.image_index.save()
+
+        if self.in_memory_images:
+            return [[converted[png_path] for _, png_path in jobs if png_path in converted]
+                    for jobs in batches]
+        return [[png_path for _, png_path in jobs if png_path in converted]
+                for jobs in batches]
+
+
+    @profiling.profiled()
+    def _image_page_prototype(self, anchor_text):
+        """
+        Returns deep copies of the body elements from the paragraph holding
+        anchor_text to the end: the image page title, its 4x10
+        caption/picture table, the paragraph after it and the section
+        properties that start the next page. Returns None when the anchor is
+        missing.
+        """
+        body_elements = list(self.document.element.body)
+        for i, element in enumerate(body_elements):
+            if element.tag != qn('w:p'):
+                continue
+            if anchor_text in ''.join(t.text or '' for t in element.iter(qn('w:t'))):
+                return [deepcopy(el) for el in body_elements[i:]]
+        return None
 
     def duplicate_required_tables(self, table_num, anchor_text):
+        """
+        Appends table_num image pages to the document, generated in one pass
+        from a single XML prototype of the page, with the same output as
+        copying the document from the anchor to the end once per table.
+        """
         if table_num <= 0:
             return
 
         #anchor_text = 'ALOS-2各期雷達影像對干涉圖'
-        all_body_elements = self.document.element.body[:]
-        start_index = -1
-
-        # 尋找錨點
-        for i, p in enumerate(self.document.paragraphs):
-            if anchor_text in p.text:
-                try:
-                    p_element = p._p
-                    start_index = all_body_elements.index(p_element)
-                    break
-                except ValueError:
-                    # This can happen if the paragraph element is not a direct child of the body
-                    # We might need a more robust way to find the element's index if this fails.
-                    continue
-        
-        if start_index != -1:
-            # 獲取從錨點開始到結尾的所有元素
-            elements_to_duplicate = all_body_elements[start_index:]
-            
-            # 根據 table_num 決定要複製幾次
-            for _ in range(table_num):
-                for element in elements_to_duplicate:
-                    new_element = deepcopy(element)
-                    self.document.element.body.append(new_element)
-        else:
+        prototype = self._image_page_prototype(anchor_text)
+        if prototype is None:
             print(f"警告：在文件中未找到指定的錨點文字 '{anchor_text}'，無法複製表格。")
+            return
+        self.document.element.body.extend(generate_image_pages(prototype, table_num))
 
 
     def add_plot(self):
@@ -440,55 +635,166 @@ class Policy:
         image_paragraph.clear()
         image_paragraph.add_run().add_picture(self.image_path, width=Cm(15.53))
 
-    def export_parital_docx(self, add_page_break=True):
-
-        # 統計要貼的圖片，取得檔名及日期
-        detrend_obs_path = 'postprocessing/detrend_obs_file'
-        converted_bmp_img = self._preprocess_images(search_dir=detrend_obs_path, file_pattern='*.tflt.filt.de.bmp')
-        converted_tif_img = self._preprocess_images(search_dir=detrend_obs_path, file_pattern='*.tflt.filt.de.geo.tif')
-        bmp_tables_num = len(converted_bmp_img) // 20 + 1
-        tif_tables_num = len(converted_tif_img) // 20 + 1
+    def build_document(self, add_page_break=True):
+        """
+        Fills self.document with this policy's pages and returns it without
+        writing anything to disk.
+        """
 
-        # 會先修改影像的標題再搜尋這個標題複製頁面
-        # 只好先把這個標題 image_table_title 存下來
-        # 正式的方法當然是去生成表格但是暫時不想面對要生成表格要設定的數字
-        # 所以採用這種複製已經調好的頁面的方式
-        image_table_title = self.fill_years(converted_bmp_img, converted_tif_img)
+        # 基線圖轉檔在背景進行，與影像轉檔及填表同時跑
+        self.start_eps_rasterization()
+        try:
+            # 統計要貼的圖片，取得檔名及日期
+            detrend_obs_path = 'postprocessing/detrend_obs_file'
+            converted_bmp_img, converted_tif_img = self._preprocess_image_batches(
+                search_dir=detrend_obs_path,
+                file_patterns=IMAGE_PATTERNS)
+            bmp_tables_num = len(converted_bmp_img) // 20 + 1
+            tif_tables_num = len(converted_tif_img) // 20 + 1
+
+            # 會先修改影像的標題再搜尋這個標題複製頁面
+            # 只好先把這個標題 image_table_title 存下來
+            # 正式的方法當然是去生成表格但是暫時不想面對要生成表格要設定的數字
+            # 所以採用這種複製已經調好的頁面的方式
+            image_table_title = self.fill_years(converted_bmp_img, converted_tif_img)
+
+            self.fill_dates()
+            self.fill_index()
+            self.fill_areas()
+            self.fill_image_metadata()
+
+
+
+            # 根據要貼的圖片數量複製最後一頁的表格
+            print(f"在 {detrend_obs_path} 下找到 {len(converted_bmp_img)} 張 .bmp 圖檔及 {len(converted_tif_img)} 張 .tif 圖檔")
+            print(f"加入 {bmp_tables_num} + {tif_tables_num} 張表格")
+            self.duplicate_required_tables(bmp_tables_num + tif_tables_num - 1, image_table_title)
+
+            # 填入第一張圖表 (BMP)
+            self.fill_image_table(start_table_index=2, image_paths=converted_bmp_img)
+        
+            # 填入第二張圖表 (GeoTIFF)
+            self.fill_image_table(start_table_index=2 + bmp_tables_num, image_paths=converted_tif_img)
+
+            self.export_eps_to_png()
+            self.add_plot()
+            if add_page_break:
+                self.document.add_page_break()
+            return self.document
+        finally:
+            # 中途失敗時不留下背景的轉檔程序
+            self.stop_eps_rasterization()
 
-        self.fill_dates()
-        self.fill_index()
-        self.fill_areas()
-        self.fill_image_metadata()
+    def export_parital_docx(self, add_page_break=True):
+        self.build_document(add_page_break)
 
+        tmp_path = os.path.join(self.policy_dir, 'tmp')
+        pathlib.Path(tmp_path).mkdir(parents=True, exist_ok=True)
+        doc_path = os.path.join(tmp_path, f'baseline-{self.index}.docx')
+        # 中間檔很快就會被讀回來合併，不壓縮
+        utils.save_docx(self.document, doc_path, profile='fast')
 
+        return doc_path
 
-        # 根據要貼的圖片數量複製最後一頁的表格
-        print(f"在 {detrend_obs_path} 下找到 {len(converted_bmp_img)} 張 .bmp 圖檔及 {len(converted_tif_img)} 張 .tif 圖檔")
-        print(f"加入 {bmp_tables_num} + {tif_tables_num} 張表格")
-        self.duplicate_required_tables(bmp_tables_num + tif_tables_num - 1, image_table_title)
 
-        # 填入第一張圖表 (BMP)
-        self.fill_image_table(start_table_index=2, image_paths=converted_bmp_img)
-        
-        # 填入第二張圖表 (GeoTIFF)
-        self.fill_image_table(start_table_index=2 + bmp_tables_num, image_paths=converted_tif_img)
 
-        self.export_eps_to_png()
-        self.add_plot()
-        if add_page_break:
-            self.document.add_page_break()
-            
-        doc_path = os.path.join(self.policy_dir, 'tmp', f'baseline-{self.index}.docx')
-        self.document.save(doc_path)
+def partial_docx_inputs(files):
+    """
+    Returns the input files of one policy's partial docx (shortbaseline, EPS,
+    interferograms and the template) and the FileEntry objects already known
+    for them, for manifest.is_up_to_date.
+    """
+    entries = [files.get(path) for path in ('postprocessing/shortbaseline', 'shortbaseline_plot.eps')]
+    entries = [entry for entry in entries if entry is not None]
+    for pattern in IMAGE_PATTERNS:
+        entries += files.glob('postprocessing/detrend_obs_file', pattern)
+    inputs = [entry.path for entry in entries] + ['templates\\baseline.docx']
+    return inputs, manifest.known_stats(entries)
+
+def build_partial_docx(policy_dir, index, add_page_break, purge_cache=False, incremental=False,
+                       keep_partial=True, as_bytes=False, **policy_kwargs):
+    """
+    Builds one policy's pages. Kept at module level so it can run in a worker
+    process.
+
+    With keep_partial (or incremental) set, tmp/baseline-{index}.docx is
+    written and its path returned; with incremental set, the previous output
+    is reused when its manifest still matches the inputs and settings.
+    Otherwise nothing is written and the Document is returned, or the bytes
+    of the .docx with as_bytes set (Document objects cannot be pickled back
+    from a worker).
+    """
+    with profiling.stage('build_partial_docx', policy=os.path.basename(policy_dir)):
+        doc_path = os.path.join(policy_dir, 'tmp', f'baseline-{index}.docx')
+        if incremental:
+            files = policy_kwargs.setdefault('files', PolicyFiles(policy_dir))
+            inputs, stats = partial_docx_inputs(files)
+            settings = {'generator': 'baseline', 'index': index, 'add_page_break': add_page_break,
+                        'areas': policy_kwargs.get('areas'), 'thumbnail_dpi': THUMBNAIL_DPI,
+                        'thumbnail_height_cm': THUMBNAIL_HEIGHT_CM,
+                        'memory_budget': policy_kwargs.get('memory_budget', imaging.DEFAULT_MEMORY_BUDGET)}
+            if manifest.is_up_to_date(doc_path, inputs, settings, stats):
+                print('輸入未變更，沿用', doc_path)
+                return doc_path
+
+        policy = Policy(policy_dir=policy_dir, index=index, **policy_kwargs)
+        if purge_cache:
+            cache = policy.conversion_cache or ConversionCache(conversion_cache_dir(policy_dir))
+            cache.purge()
+
+        if not (keep_partial or incremental):
+            document = policy.build_document(add_page_break=add_page_break)
+            return utils.docx_bytes(document) if as_bytes else document
 
+        doc_path = policy.export_parital_docx(add_page_break=add_page_break)
+        if incremental:
+            manifest.write_manifest(doc_path, inputs, settings, stats)
         return doc_path
 
 
-
 if __name__ == '__main__':
 
-    import sys
-    policy_path = sys.argv[1]
+    import argparse
+    parser = argparse.ArgumentParser(description='雷達影像基線資訊報表產生器')
+    parser.add_argument('policy_path', help='包含 Policy* 資料夾的路徑')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='同時處理 Policy 資料夾的 process 數量，0 代表使用全部 CPU (預設 1)')
+    parser.add_argument('--convert-workers', type=int, default=1,
+                        help='影像轉檔使用的 process 數量，0 代表使用全部 CPU (預設 1)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用轉檔快取，每張影像都重新轉檔')
+    parser.add_argument('--purge-cache', action='store_true',
+                        help='執行前清空每個 Policy 的轉檔快取')
+    parser.add_argument('--cache-size-mb', type=int, default=512,
+                        help='每個 Policy 轉檔快取的容量上限 (MB，預設 512)')
+    parser.add_argument('--memory-budget-mb', type=int, default=256,
+                        help='單張影像解碼的記憶體上限，超過時以降低解析度的方式讀取 (MB，預設 256)')
+    parser.add_argument('--in-memory-images', action='store_true',
+                        help='縮圖直接在記憶體中貼進文件，不寫入 tmp\\converted_pngs')
+    parser.add_argument('--keep-pngs', action='store_true',
+                        help='搭配 --in-memory-images 時仍輸出縮圖 PNG 以便除錯')
+    parser.add_argument('--incremental', action='store_true',
+                        help='輸入檔、範本及設定都沒變的 Policy 沿用上次的 tmp\\baseline-N.docx')
+    parser.add_argument('--keep-partials', action='store_true',
+                        help='除錯用：仍輸出每個 Policy 的 tmp\\baseline-N.docx (--incremental 時一律輸出)')
+    parser.add_argument('--no-open', action='store_true',
+                        help='完成後不要自動打開輸出的 docx (批次或效能測試用)')
+    parser.add_argument('--profile', action='store_true',
+                        help='記錄各階段的時間與記憶體，輸出到 tmp\\profile-baseline.json 及 .trace.json')
+    parser.add_argument('--concat-engine', choices=['composer', 'package'], default='composer',
+                        help='合併 docx 的方式：docxcompose 或較快的套件層級合併 (utils.PackageComposer)')
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    policy_path = args.policy_path
+    workers = args.workers or os.cpu_count()
+    convert_workers = args.convert_workers or os.cpu_count()
+    if workers > 1 and convert_workers > 1:
+        # 已經按 Policy 平行處理，就不在 worker 裡再開 process pool
+        print('注意: 使用 --workers 時影像轉檔改為單一 process')
+        convert_workers = 1
+
     print('=== 雷達影像基線資訊報表產生器 ===')
     print('啟動中...')
     print('正在 ' + policy_path + ' 位置下尋找 Policy 資料夾... ', end='')
@@ -500,23 +806,54 @@ if __name__ == '__main__':
         print(p.split('\\')[-1])
 
     print('開始處理:')
-    doc_paths = []
+    policy_kwargs = dict(convert_workers=convert_workers,
+                         use_cache=not args.no_cache,
+                         cache_max_bytes=args.cache_size_mb * 1024 * 1024,
+                         memory_budget=args.memory_budget_mb * 1024 * 1024,
+                         in_memory_images=args.in_memory_images,
+                         keep_pngs=args.keep_pngs,
+                         incremental=args.incremental,
+                         keep_partial=args.keep_partials,
+                         purge_cache=args.purge_cache)
+    jobs = []
     for index, policy_dir in enumerate(policies):
-        # 如果沒有 postprocessing 資料夾的話，這筆 Policy 會被跳過
-        if os.path.isdir(policy_dir + '\\postprocessing'):
-            print('processing', policy_dir, '...', end = '')
-
-        # 創一個 Policy 物件
+        # 編號及最後一頁不換頁都由資料夾順序決定，與處理完成的先後無關
         doc_index = index+1
-        policy = Policy(policy_dir=policy_dir, index=doc_index)
-        
-        # 輸出 docx，最後一頁不要換頁
         add_page_break = (doc_index != len(policies))
-        doc_path = policy.export_parital_docx(add_page_break=add_page_break)
-        print('done')
-        doc_paths.append(doc_path)
+        jobs.append((policy_dir, doc_index, add_page_break))
+
+    def build_parallel():
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 開啟 --profile 時，worker 的紀錄隨結果一起傳回
+            submit = functools.partial(executor.submit, profiling.run_profiled, build_partial_docx) \
+                if profiling.enabled() else functools.partial(executor.submit, build_partial_docx)
+            futures = [submit(policy_dir, doc_index, add_page_break, as_bytes=True, **policy_kwargs)
+                       for policy_dir, doc_index, add_page_break in jobs]
+            # 依照編號順序收集結果，每份完成就先併入輸出文件
+            for (policy_dir, _, _), future in zip(jobs, futures):
+                result = future.result()
+                if profiling.enabled():
+                    result, events = result
+                    profiling.add_events(events)
+                print('done', policy_dir)
+                yield result
+
+    def build_serial():
+        for policy_dir, doc_index, add_page_break in jobs:
+            # 如果沒有 postprocessing 資料夾的話，這筆 Policy 會被跳過
+            if os.path.isdir(policy_dir + '\\postprocessing'):
+                print('processing', policy_dir, '...', end = '')
+
+            # 產生頁面，最後一頁不要換頁
+            document = build_partial_docx(policy_dir, doc_index, add_page_break, **policy_kwargs)
+            print('done')
+            yield document
 
     # 組合所有頁面並打開檔案
     output_path = policy_path + "\\doc\\基線.docx"
-    utils.concatenate_docx(doc_paths, output_path)
-    os.system('start ' + output_path)
+    partials = build_parallel() if workers > 1 and len(jobs) > 1 else build_serial()
+    utils.concatenate_docx(partials, output_path, engine=args.concat_engine)
+    if args.profile:
+        print('效能紀錄:', *profiling.write_report(os.path.join(policy_path, 'tmp', 'profile-baseline')))
+    if not args.no_open:
+        os.system('start ' + output_path)
@@ -0,0 +1,88 @@
+"""
+Compares the docxcompose engine of utils.concatenate_docx with the
+package-level engine (utils.PackageComposer) on synthetic image-heavy
+baseline partials.
+
+    python benchmarks\bench_concatenate.py --partials 10 50 100
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from docx import Document
+from docx.shared import Cm
+from PIL import Image
+
+import utils
+
+
+def make_png(seed, size=256):
+    pixels = np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    stream = io.BytesIO()
+    Image.fromarray(pixels).save(stream, 'PNG')
+    return stream.getvalue()
+
+
+def make_partials(directory, count, images_per_partial, distinct_images):
+    """
+    Saves count copies of the baseline template with their image table
+    filled. Images repeat every distinct_images, like the shared plots of
+    real partials, so deduplication has something to do.
+    """
+    blobs = [make_png(seed) for seed in range(distinct_images)]
+    paths = []
+    for index in range(count):
+        document = utils.load_template('templates/baseline.docx')
+        cells = [cell for row in document.tables[-1].rows for cell in row.cells]
+        for image_index in range(images_per_partial):
+            blob = blobs[(index * images_per_partial + image_index) % distinct_images]
+            cell = cells[image_index % len(cells)]
+            cell.paragraphs[0].add_run().add_picture(io.BytesIO(blob), height=Cm(3.8))
+        document.add_page_break()
+        path = os.path.join(directory, 'baseline-{}.docx'.format(index))
+        document.save(path)
+        paths.append(path)
+    return paths
+
+
+def summarize(path):
+    document = Document(path)
+    with zipfile.ZipFile(path) as package:
+        media = sum(1 for name in package.namelist() if name.startswith('word/media/'))
+    return len(document.tables), len(document.inline_shapes), media
+
+
+def run(engine, paths, output_path):
+    start = time.perf_counter()
+    utils.concatenate_docx(paths, output_path, engine=engine)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='concatenate_docx benchmark')
+    parser.add_argument('--partials', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--images', type=int, default=20, help='images per partial')
+    parser.add_argument('--distinct', type=int, default=200, help='distinct images in total')
+    args = parser.parse_args()
+
+    print('{:>8} {:>14} {:>13} {:>8} {:>10} {}'.format(
+        'partials', 'composer (s)', 'package (s)', 'speedup', 'size (MB)', 'tables/shapes/media'))
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.partials:
+            paths = make_partials(directory, count, args.images, args.distinct)
+            composer_path = os.path.join(directory, 'composer.docx')
+            package_path = os.path.join(directory, 'package.docx')
+            slow = run('composer', paths, composer_path)
+            fast = run('package', paths, package_path)
+            print('{:>8} {:>14.2f} {:>13.2f} {:>7.1f}x {:>4.1f}/{:<5.1f} {} vs {}'.format(
+                count, slow, fast, slow / fast,
+                os.path.getsize(composer_path) / 2 ** 20, os.path.getsize(package_path) / 2 ** 20,
+                summarize(composer_path), summarize(package_path)))
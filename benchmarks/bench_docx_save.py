@@ -0,0 +1,79 @@
+"""
+Times document.save against the utils.save_docx profiles on a baseline
+report with many thumbnails.
+
+    python benchmarks\bench_docx_save.py --images 100 200 400
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from docx import Document
+from docx.shared import Cm
+from PIL import Image
+
+import utils
+
+
+def make_thumbnail(seed, size=(340, 450)):
+    """
+    An interferogram-like PNG: smooth fringes plus noise, so it compresses
+    about as well as the real thumbnails.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size[0], 0:size[1]]
+    phase = np.sin((x * rng.uniform(0.02, 0.1) + y * rng.uniform(0.02, 0.1)))
+    noise = rng.normal(0, 0.2, size)
+    gray = ((phase + noise + 1.5) / 3 * 255).clip(0, 255).astype(np.uint8)
+    stream = io.BytesIO()
+    Image.fromarray(np.stack([gray, 255 - gray, gray // 2], axis=-1)).save(stream, 'PNG')
+    return stream.getvalue()
+
+
+def make_report(images):
+    document = utils.load_template('templates/baseline.docx')
+    cells = [cell for row in document.tables[-1].rows for cell in row.cells]
+    for index in range(images):
+        if index and index % len(cells) == 0:
+            document.add_page_break()
+            cells = [cell for row in document.add_table(rows=10, cols=4).rows for cell in row.cells]
+        cells[index % len(cells)].paragraphs[0].add_run().add_picture(
+            io.BytesIO(make_thumbnail(index)), height=Cm(3.8))
+    return document
+
+
+def best_time(save, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        save()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='save_docx benchmark')
+    parser.add_argument('--images', type=int, nargs='+', default=[100, 200, 400])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>6} {:>10} {:>15} {:>12} {:>12}'.format('images', 'profile', 'save (ms)', 'size (MB)', 'reopens'))
+    with tempfile.TemporaryDirectory() as directory:
+        for images in args.images:
+            document = make_report(images)
+            runs = [('document.save', lambda path: document.save(path))]
+            for profile in ('deflate', 'media', 'fast'):
+                runs.append((profile, lambda path, profile=profile: utils.save_docx(document, path, profile)))
+            for name, save in runs:
+                path = os.path.join(directory, '{}-{}.docx'.format(images, name))
+                elapsed = best_time(lambda: save(path), args.repeat)
+                reopened = len(Document(path).inline_shapes) == len(document.inline_shapes)
+                print('{:>6} {:>10} {:>15.1f} {:>12.2f} {:>12}'.format(
+                    images, name, elapsed * 1000, os.path.getsize(path) / 2 ** 20, str(reopened)))
@@ -0,0 +1,190 @@
+"""
+End-to-end benchmark of the report scripts on synthetic Policy folders
+(see synth.py). Each stage runs as its own process and is timed together
+with the peak memory of that process.
+
+    python benchmarks\bench_end_to_end.py --tiers small medium --json results.jsonl
+    python benchmarks\bench_end_to_end.py --tiers 4,40,1024 --baseline-args "--in-memory-images"
+
+Tiers are policies x pairs per policy x interferogram size (pixels). With
+--json every measurement is appended as one JSON line, and the table shows
+the change against the previous record of the same tier and stage.
+Peak memory covers the main process of each stage; processes started by
+--workers / --convert-workers are not included on Windows.
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synth
+
+TIERS = {
+    'small': (2, 10, 256),
+    'medium': (4, 40, 1024),
+    'large': (8, 100, 2048),
+}
+
+STAGES = ['baseline', 'coherence', 'coregistration', 'concatenate']
+
+
+def _peak_rss_windows(process):
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(int(process._handle), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def run_process(command, log_path):
+    """
+    Runs command from the repository folder and returns (seconds, peak RSS
+    in bytes or None). The output goes to log_path.
+    """
+    with open(log_path, 'w', encoding='utf-8', errors='replace') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=REPO_DIR, stdout=log, stderr=subprocess.STDOUT)
+        if os.name == 'nt':
+            returncode = process.wait()
+            elapsed = time.perf_counter() - start
+            peak = _peak_rss_windows(process)
+        else:
+            # wait4 回傳這個子行程 (含其已結束的子行程) 的資源用量
+            _, status, usage = os.wait4(process.pid, 0)
+            elapsed = time.perf_counter() - start
+            returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status >> 8
+            process.returncode = returncode
+            # Linux 的 ru_maxrss 單位是 KB，macOS 是 byte
+            peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    if returncode != 0:
+        raise RuntimeError('{} 失敗 (exit {})，請看 {}'.format(' '.join(command), returncode, log_path))
+    return elapsed, peak
+
+
+def stage_commands(stage, data_dir, args):
+    python = sys.executable
+    if stage == 'baseline':
+        # 保留中間檔給 concatenate 這一段使用
+        return [python, 'baseline.py', data_dir, '--no-open', '--keep-partials'] + shlex.split(args.baseline_args)
+    if stage == 'coherence':
+        return [python, 'coherence.py', data_dir, '--no-open'] + shlex.split(args.coherence_args)
+    if stage == 'coregistration':
+        return [python, 'coregistration.py', data_dir, '--no-open'] + shlex.split(args.coregistration_args)
+    partials = sorted(os.path.join(policy_dir, 'tmp', name)
+                      for policy_dir in synth_policy_dirs(data_dir)
+                      for name in os.listdir(os.path.join(policy_dir, 'tmp'))
+                      if name.startswith('baseline-') and name.endswith('.docx'))
+    code = ('import sys, utils; '
+            'utils.concatenate_docx(sys.argv[3:], sys.argv[1], engine=sys.argv[2])')
+    output_path = os.path.join(data_dir, 'doc', 'concatenate-bench.docx')
+    return [python, '-c', code, output_path, args.concat_engine] + partials
+
+
+def synth_policy_dirs(data_dir):
+    return sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir) if name.startswith('Policy'))
+
+
+def stage_items(stage, policies, pairs):
+    """
+    Returns (work items, unit) used for the throughput column.
+    """
+    if stage == 'baseline':
+        return policies * pairs * 2, 'images'
+    if stage == 'concatenate':
+        return policies, 'partials'
+    return policies, 'policies'
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(json_path):
+    previous = {}
+    if json_path and os.path.isfile(json_path):
+        with open(json_path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    previous[(record['tier'], record['stage'])] = record
+    return previous
+
+
+def parse_tier(text):
+    if text in TIERS:
+        return text, TIERS[text]
+    policies, pairs, size = (int(x) for x in text.split(','))
+    return '{}x{}x{}'.format(policies, pairs, size), (policies, pairs, size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='報表產生器端對端效能測試')
+    parser.add_argument('--tiers', nargs='+', default=['small'],
+                        help='預設的規模 ({}) 或 "policies,pairs,size"'.format(', '.join(TIERS)))
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--data-dir', help='放測試資料的資料夾 (預設使用暫存資料夾，結束後刪除)')
+    parser.add_argument('--json', help='把結果附加到這個 JSON lines 檔，並與上一筆比較')
+    parser.add_argument('--baseline-args', default='', help='額外傳給 baseline.py 的參數')
+    parser.add_argument('--coherence-args', default='', help='額外傳給 coherence.py 的參數')
+    parser.add_argument('--coregistration-args', default='', help='額外傳給 coregistration.py 的參數')
+    parser.add_argument('--concat-engine', choices=['composer', 'package'], default='composer')
+    args = parser.parse_args()
+
+    previous = load_previous(args.json)
+    commit = git_commit()
+    print('{:<14} {:<15} {:>10} {:>12} {:>16} {:>10}'.format(
+        'tier', 'stage', 'time (s)', 'peak (MB)', 'throughput', 'vs last'))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for tier in args.tiers:
+            name, (policies, pairs, image_size) = parse_tier(tier)
+            data_dir = os.path.join(args.data_dir or tmp_dir, name)
+            if not os.path.isdir(data_dir):
+                synth.make_dataset(data_dir, policies, pairs, image_size)
+
+            for stage in args.stages:
+                command = stage_commands(stage, data_dir, args)
+                log_path = os.path.join(data_dir, 'bench-{}.log'.format(stage))
+                elapsed, peak = run_process(command, log_path)
+                items, unit = stage_items(stage, policies, pairs)
+
+                record = {'tier': name, 'stage': stage, 'seconds': round(elapsed, 3),
+                          'peak_mb': round(peak / 2 ** 20, 1) if peak else None,
+                          'items': items, 'unit': unit, 'commit': commit,
+                          'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+                last = previous.get((name, stage))
+                change = '{:+.0%}'.format(elapsed / last['seconds'] - 1) if last else ''
+                print('{:<14} {:<15} {:>10.2f} {:>12} {:>16} {:>10}'.format(
+                    name, stage, elapsed, record['peak_mb'] or '-',
+                    '{:.1f} {}/s'.format(items / elapsed, unit), change))
+
+                if args.json:
+                    with open(args.json, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -0,0 +1,113 @@
+"""
+Times Policy.fill_image_metadata (bulk row writer) against the previous
+row-by-row python-docx implementation on synthetic shortbaseline inputs.
+
+    python benchmarks\bench_image_metadata.py --pairs 50 200 1000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from copy import deepcopy
+from math import ceil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+import utils
+from baseline import Policy, fill_cell, set_table_borders
+from shortbaseline import ShortBaseline
+
+
+def synthetic_shortbaseline(pairs):
+    start = datetime.date(2015, 1, 1)
+    lines = []
+    for i in range(pairs):
+        day1 = start + datetime.timedelta(days=14 * i)
+        day2 = day1 + datetime.timedelta(days=14 * (1 + i % 3))
+        lines.append('\t'.join([day1.strftime('%Y%m%d'), day2.strftime('%Y%m%d'),
+                                str(12.3456 * (i % 17) - 80), str((day2 - day1).days)]) + '\n')
+    return ShortBaseline.from_lines(lines)
+
+
+def make_policy(pairs):
+    policy = Policy.__new__(Policy)
+    policy.document = utils.load_template('templates/baseline.docx')
+    policy.shortbaseline = synthetic_shortbaseline(pairs)
+    policy.policy_length = len(policy.shortbaseline)
+    return policy
+
+
+def fill_image_metadata_rowwise(policy):
+    """
+    The row-by-row implementation fill_image_metadata used before the bulk writer.
+    """
+    table = policy.document.tables[1]
+    row_number = ceil(policy.policy_length / 2)
+    current_rows = len(table.rows) - 1
+    template_row = table.rows[1] if current_rows > 0 else None
+
+    if row_number > current_rows:
+        for _ in range(row_number - current_rows):
+            new_row = table.add_row()
+            if template_row:
+                new_row.height = template_row.height
+                new_row.height_rule = template_row.height_rule
+                for i, template_cell in enumerate(template_row.cells):
+                    new_tcPr = deepcopy(template_cell._tc.get_or_add_tcPr())
+                    p = new_row.cells[i]._tc.get_or_add_tcPr()
+                    p.getparent().replace(p, new_tcPr)
+    elif row_number < current_rows:
+        for i in range(current_rows - row_number):
+            row_to_remove = table.rows[current_rows - i]
+            row_to_remove._element.getparent().remove(row_to_remove._element)
+
+    for r_idx in range(1, len(table.rows)):
+        for c_idx in range(len(table.columns)):
+            fill_cell(table.rows[r_idx].cells[c_idx], "")
+
+    for idx, pair in enumerate(policy.shortbaseline):
+        if idx < row_number:
+            cells, offset = table.rows[idx + 1].cells, 0
+        else:
+            cells, offset = table.rows[idx - row_number + 1].cells, 4
+        fill_cell(cells[offset + 0], str(idx + 1))
+        fill_cell(cells[offset + 1], pair.name)
+        fill_cell(cells[offset + 2], str(round(pair.distance, 3)))
+        fill_cell(cells[offset + 3], pair.period)
+
+    for row in table.rows:
+        for cell in row.cells:
+            for paragraph in cell.paragraphs:
+                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    set_table_borders(table)
+
+
+def best_time(func, pairs, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        policy = make_policy(pairs)
+        start = time.perf_counter()
+        func(policy)
+        best = min(best, time.perf_counter() - start)
+    return best, policy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='fill_image_metadata benchmark')
+    parser.add_argument('--pairs', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>6} {:>14} {:>10} {:>8} {}'.format('pairs', 'row-wise (ms)', 'bulk (ms)', 'speedup', 'same text'))
+    for pairs in args.pairs:
+        slow, slow_policy = best_time(fill_image_metadata_rowwise, pairs, args.repeat)
+        fast, fast_policy = best_time(Policy.fill_image_metadata, pairs, args.repeat)
+        same = ([[c.text for c in r.cells] for r in slow_policy.document.tables[1].rows] ==
+                [[c.text for c in r.cells] for r in fast_policy.document.tables[1].rows])
+        print('{:>6} {:>14.1f} {:>10.1f} {:>7.1f}x {}'.format(
+            pairs, slow * 1000, fast * 1000, slow / fast, same))
@@ -0,0 +1,92 @@
+"""
+Startup time of the report scripts. Every entry point is started in a
+fresh interpreter with `--help` (argparse exits before any work;
+diagnosis.py finds no Policy folder) under `python -X importtime`, so the
+time is what a user waits before the first file is touched.
+
+    python benchmarks\\bench_startup.py
+    python benchmarks\\bench_startup.py --repeat 10 --top 5
+
+The last two rows import matplotlib with an empty MPLCONFIGDIR (the font
+cache is built from scratch) and with one warmed by `python plotting.py`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ['baseline.py', 'coherence.py', 'coregistration.py', 'deliver.py', 'diagnosis.py']
+
+WARM_FONTS = 'import plotting; plotting.warm_font_cache()'
+
+
+def parse_importtime(text):
+    """
+    Returns {module: cumulative seconds} of the top-level imports reported
+    by -X importtime.
+    """
+    imports = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # 巢狀的 import 以兩個空白縮排
+        if name[1:2] != ' ':
+            imports[name.strip()] = int(cumulative) / 1e6
+    return imports
+
+
+def run(arguments, env=None):
+    """
+    Runs python -X importtime with arguments from the repository folder and
+    returns (seconds, top-level imports).
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, cwd=REPO_DIR, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             encoding='utf-8', errors='replace')
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError('{} 失敗:\n{}'.format(' '.join(arguments), process.stderr[-2000:]))
+    return elapsed, parse_importtime(process.stderr)
+
+
+def measure(label, arguments, repeat, top, env_factory=None):
+    times = []
+    imports = {}
+    for _ in range(repeat):
+        env = env_factory() if env_factory else None
+        elapsed, imports = run(arguments, env)
+        times.append(elapsed)
+    heaviest = sorted(imports.items(), key=lambda item: -item[1])[:top]
+    print('{:<22} {:>9.0f} {:>9.0f}   {}'.format(
+        label, min(times) * 1000, statistics.median(times) * 1000,
+        ', '.join('{} {:.0f}'.format(name, seconds * 1000) for name, seconds in heaviest)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='報表程式啟動時間測試')
+    parser.add_argument('--repeat', type=int, default=5, help='每個程式啟動的次數 (預設 5)')
+    parser.add_argument('--top', type=int, default=3, help='列出最花時間的幾個 import (預設 3)')
+    args = parser.parse_args()
+
+    print('{:<22} {:>9} {:>9}   {}'.format('entry point', 'min (ms)', 'med (ms)', 'heaviest imports (ms)'))
+    for script in ENTRY_POINTS:
+        measure(script, [script, '--help'], args.repeat, args.top)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        count = iter(range(args.repeat))
+
+        def empty_config():
+            return dict(os.environ, MPLCONFIGDIR=os.path.join(tmp_dir, 'cold-{}'.format(next(count))))
+
+        measure('matplotlib (cold)', ['-c', WARM_FONTS], args.repeat, args.top, empty_config)
+
+        warm_env = dict(os.environ, MPLCONFIGDIR=os.path.join(tmp_dir, 'warm'))
+        run(['-c', WARM_FONTS], warm_env)
+        measure('matplotlib (warm)', ['-c', WARM_FONTS], args.repeat, args.top, lambda: warm_env)
@@ -0,0 +1,82 @@
+"""
+Times baseline.set_table_borders against the previous per-cell
+implementation (kept below as set_table_borders_per_cell) and checks that
+both produce the same table XML.
+
+    python benchmarks\bench_table_borders.py --rows 25 100 400
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from lxml import etree
+
+from baseline import set_table_borders
+
+
+def set_table_borders_per_cell(table):
+    """
+    The implementation set_table_borders used before the single-pass
+    version: every cell goes through python-docx's table.rows / row.cells
+    and gets freshly built border elements.
+    """
+    thin_border = {"sz": 4, "val": "single", "color": "auto"}
+    thick_border = {"sz": 12, "val": "single", "color": "auto"}
+
+    for i, row in enumerate(table.rows):
+        for j, cell in enumerate(row.cells):
+            tcPr = cell._tc.get_or_add_tcPr()
+            tcBorders = OxmlElement('w:tcBorders')
+
+            for border in tcPr.findall(qn('w:tcBorders')):
+                tcPr.remove(border)
+
+            is_top = (i == 0)
+            is_left = (j == 0)
+            is_bottom = (i == len(table.rows) - 1)
+            is_right = (j == len(row.cells) - 1)
+
+            for tag, is_thick in (('w:top', is_top), ('w:left', is_left),
+                                  ('w:bottom', is_bottom), ('w:right', is_right)):
+                border_el = OxmlElement(tag)
+                for key, val in (thick_border if is_thick else thin_border).items():
+                    border_el.set(qn(f'w:{key}'), str(val))
+                tcBorders.append(border_el)
+
+            tcPr.append(tcBorders)
+
+
+def make_table(rows, cols):
+    return Document().add_table(rows=rows, cols=cols)
+
+
+def best_time(func, rows, cols, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        table = make_table(rows, cols)
+        start = time.perf_counter()
+        func(table)
+        best = min(best, time.perf_counter() - start)
+    return best, table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='set_table_borders benchmark')
+    parser.add_argument('--rows', type=int, nargs='+', default=[25, 100, 400])
+    parser.add_argument('--cols', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>6} {:>15} {:>12} {:>8} {}'.format('rows', 'per cell (ms)', 'current (ms)', 'speedup', 'same XML'))
+    for rows in args.rows:
+        slow, slow_table = best_time(set_table_borders_per_cell, rows, args.cols, args.repeat)
+        fast, fast_table = best_time(set_table_borders, rows, args.cols, args.repeat)
+        same = etree.tostring(slow_table._tbl) == etree.tostring(fast_table._tbl)
+        print('{:>6} {:>15.1f} {:>12.1f} {:>7.1f}x {}'.format(
+            rows, slow * 1000, fast * 1000, slow / fast, same))
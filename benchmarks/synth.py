@@ -0,0 +1,168 @@
+"""
+Generates synthetic Policy* folders holding the inputs read by baseline.py,
+coherence.py, coregistration.py and diagnosis.py, so the scripts can be
+benchmarked without real ALOS-2 data.
+
+    python benchmarks\synth.py D:\tmp\synthetic --policies 4 --pairs 40 --image-size 1024
+
+Each Policy folder gets:
+    postprocessing\shortbaseline
+    postprocessing\detrend_obs_file\<day1>-<day2>.tflt.filt.de.bmp / .geo.tif
+    shortbaseline_plot.eps
+    Report_3coregistration_Error.txt
+    coherence_phase\ifg_coh_filt_coh_compare
+"""
+import argparse
+import datetime
+import os
+
+import numpy as np
+from PIL import Image
+
+# 兩次拍攝的間隔天數，與 ALOS-2 的回訪週期相同
+REVISIT_DAYS = 14
+
+
+def make_dates(count, start=datetime.date(2015, 1, 6)):
+    return [start + datetime.timedelta(days=REVISIT_DAYS * i) for i in range(count)]
+
+
+def make_pairs(pairs):
+    """
+    Returns pairs (date1, date2) connecting each date with its next one,
+    two and three acquisitions later, like a short baseline network.
+    """
+    dates = make_dates(pairs // 3 + 4)
+    result = []
+    for step in range(1, len(dates)):
+        for i in range(len(dates) - step):
+            if len(result) == pairs:
+                return sorted(result)
+            result.append((dates[i], dates[i + step]))
+    return sorted(result)
+
+
+def _day(date):
+    return date.strftime('%Y%m%d')
+
+
+def write_shortbaseline(path, pairs, rng):
+    with open(path, 'w') as f:
+        for date1, date2 in pairs:
+            distance = rng.uniform(-300, 300)
+            f.write('{}\t{}\t{:.4f}\t{}\n'.format(_day(date1), _day(date2), distance, (date2 - date1).days))
+
+
+def interferogram(size, rng):
+    """
+    An RGB fringe pattern with noise, roughly as compressible as a real
+    wrapped-phase interferogram.
+    """
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    cx, cy = rng.uniform(0, size, 2)
+    phase = np.hypot(x - cx, y - cy) * rng.uniform(0.02, 0.08) + x * rng.uniform(0, 0.02)
+    phase += rng.normal(0, 0.3, (size, size)).astype(np.float32)
+    hue = (np.mod(phase, 2 * np.pi) / (2 * np.pi) * 255).astype(np.uint8)
+    hsv = np.stack([hue, np.full_like(hue, 200), np.full_like(hue, 230)], axis=-1)
+    return Image.fromarray(hsv, 'HSV').convert('RGB')
+
+
+def write_interferograms(directory, pairs, image_size, rng):
+    os.makedirs(directory, exist_ok=True)
+    for date1, date2 in pairs:
+        name = '{}-{}'.format(_day(date1), _day(date2))
+        image = interferogram(image_size, rng)
+        image.save(os.path.join(directory, name + '.tflt.filt.de.bmp'))
+        image.save(os.path.join(directory, name + '.tflt.filt.de.geo.tif'))
+
+
+def write_eps(path, pairs, rng):
+    """
+    A small time/baseline network plot drawn directly in PostScript.
+    """
+    width, height = 480, 360
+    days = [(date - pairs[0][0]).days for pair in pairs for date in pair]
+    span = max(max(days), 1)
+    positions = {}
+    lines = ['%!PS-Adobe-3.0 EPSF-3.0',
+             '%%BoundingBox: 0 0 {} {}'.format(width, height),
+             '0.5 setlinewidth']
+    for date1, date2 in pairs:
+        for date in (date1, date2):
+            if date not in positions:
+                positions[date] = (40 + (date - pairs[0][0]).days / span * (width - 80),
+                                   40 + rng.uniform(0, height - 80))
+        (x1, y1), (x2, y2) = positions[date1], positions[date2]
+        lines.append('newpath {:.1f} {:.1f} moveto {:.1f} {:.1f} lineto stroke'.format(x1, y1, x2, y2))
+    for x, y in positions.values():
+        lines.append('newpath {:.1f} {:.1f} 3 0 360 arc fill'.format(x, y))
+    lines += ['showpage', '%%EOF']
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_coregistration_report(path, pairs, rng):
+    """
+    Two lines per acquisition, the second coregistration pass first, in
+    the layout parsed by coregistration.extract_data.
+    """
+    dates = sorted({date for pair in pairs for date in pair})
+    with open(path, 'w') as f:
+        for date in dates:
+            for error_scale in (0.15, 0.3):
+                f.write('./TCP_TW_4/M_Ss/{}/coreg.log range: {:.4f} azimuth: {:.4f}\n'.format(
+                    _day(date), abs(rng.normal(0, error_scale)), abs(rng.normal(0, error_scale))))
+
+
+def write_coherence(path, points, rng):
+    before = rng.beta(2, 3, points)
+    after = np.clip(before * 0.7 + 0.3 + rng.normal(0, 0.05, points), 0, 1)
+    x = rng.integers(0, 10000, points)
+    y = rng.integers(0, 10000, points)
+    with open(path, 'w') as f:
+        for row in zip(x, y, before, after):
+            f.write('{}\t{}\t{:.6f}\t{:.6f}\n'.format(*row))
+
+
+def make_policy(policy_dir, pairs, image_size, coherence_points, seed):
+    rng = np.random.default_rng(seed)
+    pair_dates = make_pairs(pairs)
+
+    postprocessing = os.path.join(policy_dir, 'postprocessing')
+    os.makedirs(postprocessing, exist_ok=True)
+    write_shortbaseline(os.path.join(postprocessing, 'shortbaseline'), pair_dates, rng)
+    write_interferograms(os.path.join(postprocessing, 'detrend_obs_file'), pair_dates, image_size, rng)
+    write_eps(os.path.join(policy_dir, 'shortbaseline_plot.eps'), pair_dates, rng)
+    write_coregistration_report(os.path.join(policy_dir, 'Report_3coregistration_Error.txt'), pair_dates, rng)
+
+    coherence_dir = os.path.join(policy_dir, 'coherence_phase')
+    os.makedirs(coherence_dir, exist_ok=True)
+    write_coherence(os.path.join(coherence_dir, 'ifg_coh_filt_coh_compare'), coherence_points, rng)
+
+
+def make_dataset(root, policies, pairs, image_size, coherence_points=20000, seed=0):
+    """
+    Creates root/Policy01 ... and returns their paths. The same arguments
+    always produce the same files.
+    """
+    policy_dirs = []
+    for index in range(policies):
+        policy_dir = os.path.join(root, 'Policy{:02d}'.format(index + 1))
+        make_policy(policy_dir, pairs, image_size, coherence_points, seed + index)
+        policy_dirs.append(policy_dir)
+    return policy_dirs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='產生測試用的 Policy 資料夾')
+    parser.add_argument('root', help='輸出的路徑，Policy 資料夾會建立在這裡')
+    parser.add_argument('--policies', type=int, default=2)
+    parser.add_argument('--pairs', type=int, default=20, help='每個 Policy 的干涉對數量')
+    parser.add_argument('--image-size', type=int, default=512, help='干涉圖的邊長 (pixel)')
+    parser.add_argument('--coherence-points', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for policy_dir in make_dataset(args.root, args.policies, args.pairs, args.image_size,
+                                   args.coherence_points, args.seed):
+        print(policy_dir)
@@ -1,110 +1,93 @@
-from docx import Document
-from docx.shared import Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+import os
+import json
+from collections import namedtuple
 
+# numpy、matplotlib 及 docx 都到用到時才載入，讓程式盡快啟動
+import plotting
 
-import os, pathlib
-import numpy as np
-from numpy.polynomial.polynomial import polyfit
+# 一個 Policy 的圖檔路徑及 coherence_data.CoherenceStats.as_dict() 的統計值
+CoherenceChart = namedtuple('CoherenceChart', ['img_path', 'stats'])
 
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-plt.rcParams["figure.figsize"] = (6,6)
-
-#以下設定Times New Roman字體
-#plt.rcParams["font.family"] = "Times New Roman"
-#以下處理標楷體字體
-plt.rcParams['font.sans-serif'] = ['DFKai-SB']#['Microsoft JhengHei'] 
-plt.rcParams['axes.unicode_minus'] = False
+# 點數超過這個值時改畫密度圖，逐點畫圈太慢而且只會糊成一片
+DENSITY_THRESHOLD = 200000
+# 密度圖在 0~1 之間分成幾格
+DENSITY_BINS = 300
 
 
 
 def extract_data(coherence_file):
-    before = []
-    after = []
-    with open(coherence_file) as f:
-        for index, line in enumerate(f.readlines()):
-            before.append(float(line.split('\t')[-2].strip()))
-            after.append(float(line.split('\t')[-1].strip()))
- 
-    return before, after        
-
-
-def export_result(coherence_file, policy_path, index):
-    
-    before, after = extract_data(coherence_file)
-     
-    plt.scatter(before, after, facecolors='none', edgecolors='b')
-    plt.xlabel("濾波前同調性", fontsize=18)
-    plt.ylabel("濾波後同調性", fontsize=18)
-    plt.title("濾波前後同調性比較圖 (" + str(index) + ')', fontsize=20)
-    plt.xlim(0, 1)
-    plt.xticks([0, 0.5, 1])
-    plt.minorticks_on()
-    plt.ylim(0, 1)
-    plt.yticks([0, 0.5, 1])
-    plt.grid(which='minor',alpha=0.3)
-    plt.grid(which='major',alpha=0.6, linewidth=1.5)
-    
-    b, m = polyfit(before, after,1)
-    ggg = [min(before), max(before)]
-    plt.plot(ggg, b + m * np.array(ggg), color='black', linestyle='--', dashes=(5, 5))
-
-    #plt.show()
-    img_path = policy_path + '\\coherence.png'
-    plt.savefig(img_path, dpi=100)
-    plt.clf()
-    return img_path
-
-
-
-if __name__ == '__main__':
-
-    import sys
-    policy_path = sys.argv[1]
-    print('=== 同調性報表產生器 ===')
-    print('啟動中...')
-    print('正在 ' + policy_path + ' 位置下尋找 Policy 資料夾... ', end='')
-
-    import glob
-    policies = glob.glob(policy_path + '\Policy*')
-    print('共找到 ', len(policies), ' 組資料如下')
-
-    policies = [p.split('\\')[-1] for p in policies]
-    for p in policies:
-        print(p)
-
-    print('開始處理:')
-
-    import os
-
-    pic_groups = [[]]
-    for index, policy_dir in enumerate(policies):
-        # 如果沒有 ifg_coh_filt_coh_compare 檔案的話，這筆 Policy 會被跳過
-
-        coherence_file = policy_path + '\\' + policy_dir + '\\coherence_phase\\ifg_coh_filt_coh_compare'
-        if not os.path.isfile(coherence_file):
-            print('找不到 ifg_coh_filt_coh_compare, 跳過', policy_dir)
-            continue
-        
-        print('開始處理', policy_dir, '...')#, end = '')
-
-        img_path = export_result(coherence_file, policy_path + '\\' + policy_dir, index+1)
-
-        # 將輸出的圖片六張一組分開
-        if len(pic_groups[-1]) == 6:
-            pic_groups.append([img_path])
+    """
+    Returns the coherence before and after filtering as float32 arrays.
+    """
+    from coherence_data import read_coherence
+    before, after, _ = read_coherence(coherence_file)
+    return before, after
+
+
+def export_result(coherence_file, policy_path, index, density_threshold=DENSITY_THRESHOLD, max_markers=None):
+    """
+    Draws the chart into <policy_path>\\coherence.png and returns its path
+    with the statistics of the data (see coherence_data.CoherenceStats).
+
+    Up to density_threshold points are drawn as hollow markers (at most
+    max_markers of them, picked deterministically, when set); above it the
+    points are binned into a 2D histogram drawn as one image. Axes, grid
+    and regression line are the same either way.
+    """
+    import numpy as np
+    from coherence_data import decimate, density_grid, read_coherence
+
+    before, after, stats = read_coherence(coherence_file)
+    if stats.count == 0:
+        raise ValueError(coherence_file + ' 沒有資料')
+
+    #以下設定Times New Roman字體
+    #plotting.rc(plotting.ENGLISH_FONT)
+    #以下處理標楷體字體
+    with plotting.rc(plotting.CHINESE_FONT):
+        fig = plotting.new_figure((6, 6))
+        ax = fig.add_subplot(111)
+        if stats.count > density_threshold:
+            from matplotlib.colors import LogNorm
+            counts = density_grid(before, after, DENSITY_BINS)
+            # 沒有點的格子留白；下限低於 1，只有一個點的格子也看得出藍色
+            ax.imshow(np.ma.masked_equal(counts, 0), origin='lower', extent=(0, 1, 0, 1), aspect='auto',
+                      cmap='Blues', norm=LogNorm(vmin=0.2, vmax=max(counts.max(), 1)), interpolation='nearest')
         else:
-            pic_groups[-1].append(img_path)
-
-    # 產生暫存資料夾
-    tmp_path = policy_path + '\\tmp'
-    pathlib.Path(tmp_path).mkdir(parents=True, exist_ok=True)
-
-    # 將圖片一張一張貼進表格
-    doc_paths = []
+            if max_markers:
+                before, after = decimate(before, after, max_markers)
+            ax.scatter(before, after, facecolors='none', edgecolors='b')
+        ax.set_xlabel("濾波前同調性", fontsize=18)
+        ax.set_ylabel("濾波後同調性", fontsize=18)
+        ax.set_title("濾波前後同調性比較圖 (" + str(index) + ')', fontsize=20)
+        ax.set_xlim(0, 1)
+        ax.set_xticks([0, 0.5, 1])
+        ax.minorticks_on()
+        ax.set_ylim(0, 1)
+        ax.set_yticks([0, 0.5, 1])
+        ax.grid(which='minor',alpha=0.3)
+        ax.grid(which='major',alpha=0.6, linewidth=1.5)
+
+        # 回歸線在讀檔時已一併算好
+        b, m = stats.intercept, stats.slope
+        ggg = [stats.min_before, stats.max_before]
+        ax.plot(ggg, b + m * np.array(ggg), color='black', linestyle='--', dashes=(5, 5))
+
+        img_path = policy_path + '\\coherence.png'
+        fig.savefig(img_path, dpi=100)
+    return img_path, stats.as_dict()
+
+
+def build_documents(pic_groups):
+    """
+    Yields one Document per group of up to six charts, filled into the
+    coherence template.
+    """
+    from docx.shared import Cm
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from utils import load_template
     for doc_index, pic_group in enumerate(pic_groups):
-        doc = Document('templates\\coherence.docx')
+        doc = load_template('templates\\coherence.docx')
         table = doc.tables[0]
 
         # 改編號
@@ -135,13 +118,125 @@ if __name__ == '__main__':
         if doc_index != len(pic_groups) - 1:
             doc.add_page_break()
 
+        yield doc
+
+
+def render_policy_chart(policy_path, policy_dir, index, incremental=False,
+                        density_threshold=DENSITY_THRESHOLD, max_markers=None):
+    """
+    Renders <policy_dir>\\coherence.png for one Policy folder under
+    policy_path; index is its 1-based number in the chart title. Returns a
+    CoherenceChart, or None when the folder has no ifg_coh_filt_coh_compare.
+    The statistics are also kept in coherence.stats.json for --incremental.
+    Module level so the delivery scheduler can run it in a worker process.
+    """
+    import manifest
+    import profiling
+
+    # 如果沒有 ifg_coh_filt_coh_compare 檔案的話，這筆 Policy 會被跳過
+    coherence_file = policy_path + '\\' + policy_dir + '\\coherence_phase\\ifg_coh_filt_coh_compare'
+    if not os.path.isfile(coherence_file):
+        print('找不到 ifg_coh_filt_coh_compare, 跳過', policy_dir)
+        return None
+
+    print('開始處理', policy_dir, '...')#, end = '')
+
+    img_path = policy_path + '\\' + policy_dir + '\\coherence.png'
+    stats_path = policy_path + '\\' + policy_dir + '\\coherence.stats.json'
+    settings = {'generator': 'coherence', 'index': index,
+                'density_threshold': density_threshold, 'max_markers': max_markers}
+    if incremental and manifest.is_up_to_date(img_path, [coherence_file], settings):
+        try:
+            with open(stats_path, encoding='utf-8') as f:
+                stats = json.load(f)
+            print('輸入未變更，沿用', img_path)
+            return CoherenceChart(img_path, stats)
+        except (OSError, ValueError):
+            # 舊版沒有留下統計值，重畫一次
+            pass
+
+    with profiling.stage('render_chart', policy=policy_dir):
+        img_path, stats = export_result(coherence_file, policy_path + '\\' + policy_dir, index,
+                                        density_threshold, max_markers)
+        with open(stats_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=1)
+        if incremental:
+            manifest.write_manifest(img_path, [coherence_file], settings)
+    print('    {count} 點，相關係數 {correlation:.3f}，回歸線 y = {slope:.3f}x + {intercept:.3f}'.format(**stats))
+    return CoherenceChart(img_path, stats)
+
+
+def export_report(charts, output_path, engine='composer', partials_dir=None):
+    """
+    Pastes the CoherenceCharts (None entries are skipped) six per page and writes the
+    report to output_path. With partials_dir set, every page group is also
+    saved there as coherence-N.docx for debugging.
+    """
+    import utils
+
+    # 將輸出的圖片六張一組分開
+    documents = build_documents(utils.group_items([c.img_path for c in charts if c is not None], 6))
+    if partials_dir is not None:
+        documents = utils.save_partials(documents, partials_dir, 'coherence')
+    utils.concatenate_docx(documents, output_path, engine=engine)
+    return output_path
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='同調性報表產生器')
+    parser.add_argument('policy_path', help='包含 Policy* 資料夾的路徑')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='同時繪製圖表的 process 數量，0 代表使用全部 CPU (預設 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='輸入檔與設定都沒變的 Policy 沿用上次的 coherence.png')
+    parser.add_argument('--keep-partials', action='store_true',
+                        help='除錯用：仍輸出 tmp\\coherence-N.docx')
+    parser.add_argument('--no-open', action='store_true',
+                        help='完成後不要自動打開輸出的 docx (批次或效能測試用)')
+    parser.add_argument('--profile', action='store_true',
+                        help='記錄各階段的時間與記憶體，輸出到 tmp\\profile-coherence.json 及 .trace.json')
+    parser.add_argument('--concat-engine', choices=['composer', 'package'], default='composer',
+                        help='合併 docx 的方式：docxcompose 或較快的套件層級合併 (utils.PackageComposer)')
+    parser.add_argument('--density-threshold', type=int, default=DENSITY_THRESHOLD,
+                        help='點數超過此值時改畫密度圖 (預設 {})'.format(DENSITY_THRESHOLD))
+    parser.add_argument('--max-markers', type=int, default=None,
+                        help='逐點畫圈時最多畫幾個點，超過時以固定的亂數種子抽樣 (預設全部)')
+    args = parser.parse_args()
+
+    import profiling
+    if args.profile:
+        profiling.enable()
+    policy_path = args.policy_path
+    print('=== 同調性報表產生器 ===')
+    print('啟動中...')
+    print('正在 ' + policy_path + ' 位置下尋找 Policy 資料夾... ', end='')
+
+    import glob
+    policies = glob.glob(policy_path + '\Policy*')
+    print('共找到 ', len(policies), ' 組資料如下')
 
-        doc_path = tmp_path + '\\coherence-' + str(doc_index) + '.docx'
-        doc_paths.append(doc_path)
-        doc.save(doc_path)
-        
-    # 組合全部的 docx
-    from utils import concatenate_docx
+    policies = [p.split('\\')[-1] for p in policies]
+    for p in policies:
+        print(p)
+
+    print('開始處理:')
+
+    import os
+    import utils
+    # 各 Policy 的圖可以平行繪製，結果依資料夾順序排好再六張一頁
+    charts = utils.map_in_order(render_policy_chart,
+                                [(policy_path, policy_dir, index + 1, args.incremental,
+                                  args.density_threshold, args.max_markers)
+                                 for index, policy_dir in enumerate(policies)],
+                                args.workers or os.cpu_count())
+
+    # 將圖片一張一張貼進表格，每組頁面直接併入輸出文件
     output_path = policy_path + "\\doc\\coherence.docx"
-    concatenate_docx(doc_paths, output_path)
-    os.system('start ' + output_path)
\ No newline at end of file
+    export_report(charts, output_path, engine=args.concat_engine,
+                  partials_dir=policy_path + '\\tmp' if args.keep_partials else None)
+    if args.profile:
+        print('效能紀錄:', *profiling.write_report(policy_path + '\\tmp\\profile-coherence'))
+    if not args.no_open:
+        os.system('start ' + output_path)
@@ -0,0 +1,181 @@
+"""
+Reads coherence_phase\\ifg_coh_filt_coh_compare (one sampled pixel per
+line, the last two columns being the coherence before and after
+filtering) in chunks into float32 arrays, and keeps the summary
+statistics of the pairs up to date while the chunks come in.
+"""
+import math
+from itertools import islice
+
+import numpy as np
+
+# 每次讀入的行數，約 10 MB 的文字
+CHUNK_LINES = 256 * 1024
+
+
+def _parse_chunk(lines, columns, source, first_line):
+    """
+    Returns the last two columns of lines as float32 arrays. source and
+    first_line (the line number of lines[0]) name the offending line when
+    a line cannot be read.
+    """
+    fields = ''.join(lines).split()
+    if len(fields) == columns * len(lines):
+        try:
+            return (np.array(fields[columns - 2::columns], dtype=np.float32),
+                    np.array(fields[columns - 1::columns], dtype=np.float32))
+        except ValueError:
+            # 有無法轉換的欄位，逐行找出是哪一行
+            pass
+
+    # 有空行或欄位數不一致時，逐行取空白分隔的最後兩欄
+    before = []
+    after = []
+    for line_number, line in enumerate(lines, first_line):
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            if len(fields) < 2:
+                raise ValueError('少於兩欄')
+            before.append(float(fields[-2]))
+            after.append(float(fields[-1]))
+        except ValueError as e:
+            raise ValueError('{} 第 {} 行格式錯誤: {!r} ({})'.format(source, line_number, line.rstrip('\n'), e)) from e
+    return np.array(before, dtype=np.float32), np.array(after, dtype=np.float32)
+
+
+def iter_chunks(coherence_file, chunk_lines=CHUNK_LINES):
+    """
+    Yields (before, after) float32 arrays of at most chunk_lines pixels.
+    Raises ValueError naming the file and line for lines without two
+    numeric columns.
+    """
+    with open(coherence_file) as f:
+        columns = None
+        first_line = 1
+        while True:
+            lines = list(islice(f, chunk_lines))
+            if not lines:
+                return
+            if columns is None:
+                first = next((line for line in lines if line.strip()), None)
+                if first is None:
+                    first_line += len(lines)
+                    continue
+                columns = len(first.split())
+            yield _parse_chunk(lines, columns, coherence_file, first_line)
+            first_line += len(lines)
+
+
+class CoherenceStats:
+    """
+    Count, means, standard deviations, correlation and least-squares line
+    (the same as polyfit(before, after, 1)) of the coherence pairs. The
+    chunks are merged with the pairwise update of Chan et al., so the
+    result matches a single pass over all values without float32 sums
+    losing precision.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean_before = 0.0
+        self.mean_after = 0.0
+        self.min_before = math.inf
+        self.max_before = -math.inf
+        # 與平均值差的平方和及交叉乘積和
+        self._m2_before = 0.0
+        self._m2_after = 0.0
+        self._co_moment = 0.0
+
+    def update(self, before, after):
+        n = len(before)
+        if n == 0:
+            return
+        before = before.astype(np.float64)
+        after = after.astype(np.float64)
+        mean_before = before.mean()
+        mean_after = after.mean()
+        d_before = before - mean_before
+        d_after = after - mean_after
+
+        total = self.count + n
+        delta_before = mean_before - self.mean_before
+        delta_after = mean_after - self.mean_after
+        weight = self.count * n / total
+        self._m2_before += float(d_before @ d_before) + delta_before * delta_before * weight
+        self._m2_after += float(d_after @ d_after) + delta_after * delta_after * weight
+        self._co_moment += float(d_before @ d_after) + delta_before * delta_after * weight
+        self.mean_before += delta_before * n / total
+        self.mean_after += delta_after * n / total
+        self.count = total
+
+        self.min_before = min(self.min_before, float(before.min()))
+        self.max_before = max(self.max_before, float(before.max()))
+
+    @property
+    def std_before(self):
+        return math.sqrt(self._m2_before / self.count) if self.count else math.nan
+
+    @property
+    def std_after(self):
+        return math.sqrt(self._m2_after / self.count) if self.count else math.nan
+
+    @property
+    def correlation(self):
+        spread = math.sqrt(self._m2_before * self._m2_after)
+        return self._co_moment / spread if spread > 0 else math.nan
+
+    @property
+    def slope(self):
+        return self._co_moment / self._m2_before if self._m2_before > 0 else math.nan
+
+    @property
+    def intercept(self):
+        return self.mean_after - self.slope * self.mean_before
+
+    def as_dict(self):
+        return {'count': self.count,
+                'mean_before': self.mean_before, 'mean_after': self.mean_after,
+                'std_before': self.std_before, 'std_after': self.std_after,
+                'min_before': self.min_before, 'max_before': self.max_before,
+                'correlation': self.correlation,
+                'slope': self.slope, 'intercept': self.intercept}
+
+
+def read_coherence(coherence_file, chunk_lines=CHUNK_LINES):
+    """
+    Returns (before, after, stats): the two coherence columns as float32
+    arrays and their CoherenceStats, in one pass over the file. Only one
+    chunk of text is held in memory at a time.
+    """
+    stats = CoherenceStats()
+    befores = []
+    afters = []
+    for before, after in iter_chunks(coherence_file, chunk_lines):
+        stats.update(before, after)
+        befores.append(before)
+        afters.append(after)
+    if not befores:
+        return np.empty(0, np.float32), np.empty(0, np.float32), stats
+    return np.concatenate(befores), np.concatenate(afters), stats
+
+
+def density_grid(before, after, bins):
+    """
+    Counts the pairs on a bins x bins grid over [0, 1] x [0, 1]. The result
+    is indexed [after, before], ready for imshow(origin='lower').
+    """
+    counts, _, _ = np.histogram2d(after, before, bins=bins, range=[[0, 1], [0, 1]])
+    return counts
+
+
+def decimate(before, after, max_points, seed=0):
+    """
+    Returns at most max_points pairs chosen at random with a fixed seed, in
+    file order, so the same input always gives the same chart.
+    """
+    if len(before) <= max_points:
+        return before, after
+    keep = np.sort(np.random.default_rng(seed).choice(len(before), max_points, replace=False))
+    return before[keep], after[keep]
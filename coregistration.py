@@ -1,25 +1,14 @@
-import pathlib
-
-from docx import Document
-from docx.shared import Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 
 import os
-import numpy as np
-import cv2
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-import matplotlib.patches as patches
+
+# numpy、matplotlib、PIL 及 docx 都到用到時才載入，讓程式盡快啟動
+import plotting
 
 import warnings
 warnings.filterwarnings("ignore")
 
-#以下設定Times New Roman字體
-#plt.rcParams["font.family"] = "Times New Roman"
-#以下處理標楷體字體
-#plt.rcParams["font.family"] = 'sans-serif'
-#plt.rcParams['font.sans-serif'] = ['DFKai-SB', 'Times New Roman']#['Microsoft JhengHei'] 
-plt.rcParams['axes.unicode_minus'] = False
+# 裁掉圖片上方標題以上的空白 (吋)
+CROP_TOP = 0.4
 
 
 
@@ -40,10 +29,16 @@ def extract_data(coregistration_Error_file):
     return first_group, second_group
 
 
-def export_chart(coregistration_Error_file, policy_path, font):
+def export_chart(coregistration_Error_file, policy_path):
+    """
+    Draws <policy_path>\\coregistration.png in one pass: text is set in
+    Times New Roman, and the labels containing Chinese use
+    plotting.mixed_font.
+    """
+    import numpy as np
+    import matplotlib.patches as patches
+    from PIL import Image
 
-    plt.rcParams['font.sans-serif'] = font
-    
     def min_max_mean_std(data):
         return [str(round(x,2)) for x in [min(data), max(data), np.mean(data), np.std(data)]]
 
@@ -69,138 +64,87 @@ def export_chart(coregistration_Error_file, policy_path, font):
     correct_data('Range', G1_range, G2_range)
     correct_data('Azimuth', G1_azimuth, G2_azimuth)            
 
-    fig, axs = plt.subplots(2, 1)
+    #以下設定Times New Roman字體，含中文的文字另外指定混合字型
+    with plotting.rc(plotting.ENGLISH_FONT):
+        fig = plotting.new_figure()
+        axs = fig.subplots(2, 1)
 
-    plt.setp(axs, yticks=np.arange(0, 2.2, 0.2))
+        for ax in axs:
+            ax.set_yticks(np.arange(0, 2.2, 0.2))
 
     
-    def plot_something(index, G1, G2, title):
-        ax = axs[index]
-        ax.set_title(title, fontsize=20, fontweight="bold")
-        ax.plot(time_periods, G1, label="第一次配準誤差")
-        ax.plot(time_periods, G2, label="第二次配準誤差")
-        ax.legend(loc='upper left')
-        ax.set_xticklabels(time_periods, rotation=30, ha='right')
-        plt.setp(ax.get_yticklabels(), fontweight="bold")
-        #ax.set_yticklabels([0, 0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.8, 2.0])
-        ax.set_ylim(0, 2)
-        ax.set_ylabel('誤差值(Pixel)', fontsize=18, fontweight="bold")
-        ax.legend(fontsize=10)
-        x_max = time_periods[-1]
-        ax.set_xlim([0, x_max])
-        # 加入偽表格
-        chart_items = [
-            ['', 'min', 'max', 'mean', 'std'],
-            ['第一次配準誤差            '] + min_max_mean_std(G1),
-            ['第二次配準誤差            '] + min_max_mean_std(G2)
-        ]
-
-        # 底色
-        ax.add_patch(
-         patches.Rectangle(
-            (0.285, 0.64),
-            0.34,
-            0.32,
-            transform=ax.transAxes,
-            facecolor = '#F0F0F0',
-            fill=True
-         ) )
-        # 格線
-        ax.hlines([0.76, 0.86], 0.2, 0.7, transform=ax.transAxes, linewidth=1, color='white')
-        ax.vlines([0.42,0.475, 0.525, 0.575], 0.61, 0.99, transform=ax.transAxes, linewidth=1, color='white')
-        for row in range(3):
-            for col in range(5):
-                txt = chart_items[row][col]
-                ax.text(0.4 + 0.05 * col, 0.9 - 0.1 * row, txt, transform=ax.transAxes, fontsize=14, horizontalalignment='center', verticalalignment='center')
-
-    plot_something(0, G1_range, G2_range, 'Range')
-    plot_something(1, G1_azimuth, G2_azimuth, 'Azimuth')
+        def plot_something(index, G1, G2, title):
+            ax = axs[index]
+            ax.set_title(title, fontsize=20, fontweight="bold")
+            ax.plot(time_periods, G1, label="第一次配準誤差")
+            ax.plot(time_periods, G2, label="第二次配準誤差")
+            ax.legend(loc='upper left', prop=plotting.mixed_font())
+            ax.set_xticklabels(time_periods, rotation=30, ha='right')
+            for label in ax.get_yticklabels():
+                label.set_fontweight("bold")
+            #ax.set_yticklabels([0, 0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.8, 2.0])
+            ax.set_ylim(0, 2)
+            ax.set_ylabel('誤差值(Pixel)', fontproperties=plotting.mixed_font(size=18, weight="bold"))
+            ax.legend(prop=plotting.mixed_font(size=10))
+            x_max = time_periods[-1]
+            ax.set_xlim([0, x_max])
+            # 加入偽表格
+            chart_items = [
+                ['', 'min', 'max', 'mean', 'std'],
+                ['第一次配準誤差            '] + min_max_mean_std(G1),
+                ['第二次配準誤差            '] + min_max_mean_std(G2)
+            ]
+
+            # 底色
+            ax.add_patch(
+             patches.Rectangle(
+                (0.285, 0.64),
+                0.34,
+                0.32,
+                transform=ax.transAxes,
+                facecolor = '#F0F0F0',
+                fill=True
+             ) )
+            # 格線
+            ax.hlines([0.76, 0.86], 0.2, 0.7, transform=ax.transAxes, linewidth=1, color='white')
+            ax.vlines([0.42,0.475, 0.525, 0.575], 0.61, 0.99, transform=ax.transAxes, linewidth=1, color='white')
+            for row in range(3):
+                for col in range(5):
+                    txt = chart_items[row][col]
+                    font = plotting.mixed_font(size=14) if col == 0 else None
+                    ax.text(0.4 + 0.05 * col, 0.9 - 0.1 * row, txt, transform=ax.transAxes, fontsize=14, fontproperties=font, horizontalalignment='center', verticalalignment='center')
+
+        plot_something(0, G1_range, G2_range, 'Range')
+        plot_something(1, G1_azimuth, G2_azimuth, 'Azimuth')
     
 
-    plt.subplots_adjust(hspace=0.5)
-    #fig.set_size_inches(11.7, 8.3)
-    fig.set_size_inches(15, 10.6)
-    #plt.show()
-    tmp_path = policy_path + '\\tmp'
-    pathlib.Path(tmp_path).mkdir(parents=True, exist_ok=True)
-    img_path = tmp_path + '\\coregistration' + font.replace(' ', '-') + '.png'
-    plt.savefig(img_path)
+        fig.subplots_adjust(hspace=0.5)
+        #fig.set_size_inches(11.7, 8.3)
+        fig.set_size_inches(15, 10.6)
+        #plt.show()
+        img_path = policy_path + '\\coregistration.png'
+
+        # 直接從 canvas 的像素裁切後存檔，不必先存成 PNG 再讀回來
+        fig.canvas.draw()
+        pixels = np.asarray(fig.canvas.buffer_rgba())
+        top = int(round(CROP_TOP * fig.dpi))
+        Image.fromarray(np.ascontiguousarray(pixels[top:-1, :-1, :3])).save(img_path)
     
     #os.system('start ' + img_path)
     return img_path
 
 
 
-
-if __name__ == '__main__':
-
-    import sys
-    policy_path = sys.argv[1]
-    print('=== 匹配誤差報表產生器 ===')
-    print('啟動中...')
-    print('正在 ' + policy_path + ' 位置下尋找 Policy 資料夾... ', end='')
-    
-    import glob
-    policies = glob.glob(policy_path + '\Policy*')
-    print('共找到 ', len(policies), ' 組資料如下')
-
-    policies = [p.split('\\')[-1] for p in policies]
-    for p in policies:
-        print(p)
-
-    print('開始處理:')
-
-    import os
-    pic_groups = [[]]
-    for index, policy_dir in enumerate(policies):
-        # 如果沒有 Report_3coregistration_Error 檔案的話，這筆 Policy 會被跳過
-
-        coregistration_Error_file = policy_path + '\\' + policy_dir + '\\Report_3coregistration_Error.txt'
-        if not os.path.isfile(coregistration_Error_file):
-            print('找不到 Report_3coregistration_Error.txt, 跳過', policy_dir)
-            continue
-        
-        print('開始處理', policy_dir, '...')#, end = '')
-
-        ch_img_path, en_img_path = [export_chart(coregistration_Error_file, policy_path + '\\' + policy_dir, font=font) for font in ['DFKai-SB', 'Times New Roman']]
-        ch_img, en_img = [cv2.imread(p) for p in [ch_img_path, en_img_path]]
-
-        # 剪貼兩個表格前的中文
-        en_img[173:250, 517:676] = ch_img[173:250, 517:676]
-        en_img[665:734, 517:676] = ch_img[665:734, 517:676]
-
-        # 剪貼兩個表格的 Legend
-        en_img[132:181, 1193:1345] = ch_img[132:181, 1193:1345]
-        en_img[621:680, 1193:1345] = ch_img[621:680, 1193:1345]
-
-        # 移動 Pixel 標題位置並剪貼 '誤差值' 過來
-        pixel_text_img = en_img[230:301, 132:157].copy()
-        en_img[230:360, 132:157] = (255, 255, 255)
-        en_img[210:281, 113:138] = pixel_text_img
-        en_img[286:358, 112:140] = ch_img[286:358, 112:140]
-
-        en_img[717:849, 132:157] = (255, 255, 255)
-        en_img[700:771, 113:138] = pixel_text_img
-        en_img[775:849, 112:140] = ch_img[775:849, 112:140]
-
-        img_path = policy_path + '\\' + policy_dir + '\\coregistration.png'
-        cv2.imwrite(img_path, en_img[40:-1,0:-1])
-        #os.system('start ' + img_path)
-        
-        # 將輸出的圖片兩張一組分開
-        if len(pic_groups[-1]) == 2:
-            pic_groups.append([img_path])
-        else:
-            pic_groups[-1].append(img_path)
-
-    # 產生暫存資料夾
-    tmp_path = policy_path + '\\tmp'
-    pathlib.Path(tmp_path).mkdir(parents=True, exist_ok=True)
-
-    # 將圖片一張一張貼進表格
-    doc_paths = []
+def build_documents(pic_groups):
+    """
+    Yields one Document per pair of charts, filled into the coregistration
+    template.
+    """
+    from docx.shared import Cm
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from utils import load_template
     for doc_index, pic_group in enumerate(pic_groups):
-        doc = Document('templates\\coregistration.docx')
+        doc = load_template('templates\\coregistration.docx')
         table = doc.tables[0]
         # 改編號
         for img_index, img_path in enumerate(pic_group):
@@ -224,15 +168,108 @@ if __name__ == '__main__':
                 tbl.remove(tr)
 
             # delete empty rows
-            remove_row(table, table.row[2])
-            remove_row(table, table.row[3])
+            for row in table.rows[2:4]:
+                remove_row(table, row)
+
+        yield doc
+
+
+def render_policy_chart(policy_path, policy_dir, incremental=False):
+    """
+    Renders <policy_dir>\\coregistration.png for one Policy folder under
+    policy_path and returns its path, or None when the folder has no
+    Report_3coregistration_Error.txt. Module level so the delivery scheduler
+    can run it in a worker process.
+    """
+    import manifest
+    import profiling
+
+    # 如果沒有 Report_3coregistration_Error 檔案的話，這筆 Policy 會被跳過
+    coregistration_Error_file = policy_path + '\\' + policy_dir + '\\Report_3coregistration_Error.txt'
+    if not os.path.isfile(coregistration_Error_file):
+        print('找不到 Report_3coregistration_Error.txt, 跳過', policy_dir)
+        return None
+
+    print('開始處理', policy_dir, '...')#, end = '')
+
+    img_path = policy_path + '\\' + policy_dir + '\\coregistration.png'
+    settings = {'generator': 'coregistration', 'renderer': 'mixed-font'}
+    if incremental and manifest.is_up_to_date(img_path, [coregistration_Error_file], settings):
+        print('輸入未變更，沿用', img_path)
+        return img_path
+
+    with profiling.stage('render_chart', policy=policy_dir):
+        img_path = export_chart(coregistration_Error_file, policy_path + '\\' + policy_dir)
+        if incremental:
+            manifest.write_manifest(img_path, [coregistration_Error_file], settings)
+    return img_path
 
-        doc_path = tmp_path + '\\coregistration-' + str(doc_index) + '.docx'
-        doc_paths.append(doc_path)
-        doc.save(doc_path)
 
-    # 組合全部的 docx
-    from utils import concatenate_docx
+def export_report(img_paths, output_path, engine='composer', partials_dir=None):
+    """
+    Pastes the charts (None entries are skipped) two per page and writes the
+    report to output_path. With partials_dir set, every page group is also
+    saved there as coregistration-N.docx for debugging.
+    """
+    import utils
+
+    # 將輸出的圖片兩張一組分開
+    documents = build_documents(utils.group_items([p for p in img_paths if p is not None], 2))
+    if partials_dir is not None:
+        documents = utils.save_partials(documents, partials_dir, 'coregistration')
+    utils.concatenate_docx(documents, output_path, engine=engine)
+    return output_path
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='匹配誤差報表產生器')
+    parser.add_argument('policy_path', help='包含 Policy* 資料夾的路徑')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='同時繪製圖表的 process 數量，0 代表使用全部 CPU (預設 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='輸入檔與設定都沒變的 Policy 沿用上次的 coregistration.png')
+    parser.add_argument('--keep-partials', action='store_true',
+                        help='除錯用：仍輸出 tmp\\coregistration-N.docx')
+    parser.add_argument('--no-open', action='store_true',
+                        help='完成後不要自動打開輸出的 docx (批次或效能測試用)')
+    parser.add_argument('--profile', action='store_true',
+                        help='記錄各階段的時間與記憶體，輸出到 tmp\\profile-coregistration.json 及 .trace.json')
+    parser.add_argument('--concat-engine', choices=['composer', 'package'], default='composer',
+                        help='合併 docx 的方式：docxcompose 或較快的套件層級合併 (utils.PackageComposer)')
+    args = parser.parse_args()
+
+    import profiling
+    if args.profile:
+        profiling.enable()
+    policy_path = args.policy_path
+    print('=== 匹配誤差報表產生器 ===')
+    print('啟動中...')
+    print('正在 ' + policy_path + ' 位置下尋找 Policy 資料夾... ', end='')
+    
+    import glob
+    policies = glob.glob(policy_path + '\Policy*')
+    print('共找到 ', len(policies), ' 組資料如下')
+
+    policies = [p.split('\\')[-1] for p in policies]
+    for p in policies:
+        print(p)
+
+    print('開始處理:')
+
+    import os
+    import utils
+    # 各 Policy 的圖可以平行繪製，結果依資料夾順序排好再兩張一頁
+    img_paths = utils.map_in_order(render_policy_chart,
+                                   [(policy_path, policy_dir, args.incremental) for policy_dir in policies],
+                                   args.workers or os.cpu_count())
+
+    # 將圖片一張一張貼進表格，每組頁面直接併入輸出文件
     output_path = policy_path + "\\doc\\coregistration.docx"
-    concatenate_docx(doc_paths, output_path)
-    os.system('start ' + output_path)
\ No newline at end of file
+    export_report(img_paths, output_path, engine=args.concat_engine,
+                  partials_dir=policy_path + '\\tmp' if args.keep_partials else None)
+    if args.profile:
+        print('效能紀錄:', *profiling.write_report(policy_path + '\\tmp\\profile-coregistration'))
+    if not args.no_open:
+        os.system('start ' + output_path)
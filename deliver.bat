@@ -0,0 +1,2 @@
+CALL vars.bat
+CALL %CondaPath%\Scripts\activate %envpath% & python .\deliver.py %PolicyPath% & pause
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+Builds any subset of the baseline, coherence and coregistration reports in
+one run. Policy folders are discovered once and every step becomes a task
+of one graph (see scheduler.py) running on a shared process pool:
+
+    baseline        eps:<policy>, convert:<policy>:<n> -> thumbnails:<policy>
+                    -> baseline:<policy> -> report:baseline
+    coherence       coherence:<policy> -> report:coherence
+    coregistration  coregistration:<policy> -> report:coregistration
+
+Thumbnail conversion is split into chunks across all policies; the
+converted thumbnails and the rasterized EPS go into each policy's caches,
+where the per-policy docx assembly finds them as cache hits.
+
+    python deliver.py D:\\Policies-ALOS
+    python deliver.py D:\\Policies-ALOS --reports coherence coregistration --workers 4
+"""
+import argparse
+import glob
+import os
+import time
+
+import baseline
+import coherence
+import coregistration
+import eps_raster
+import profiling
+import utils
+from png_cache import ConversionCache
+from policy_files import PolicyFiles
+from scheduler import TaskGraph
+
+REPORTS = ['baseline', 'coherence', 'coregistration']
+
+# 各類工作的優先順序，數字大的先送進 pool
+PRIORITY_PREPARE = 3
+PRIORITY_ASSEMBLE = 2
+PRIORITY_CHART = 1
+
+
+def store_thumbnails(policy_dir, keys, cache_max_bytes, *chunks):
+    """
+    Writes the thumbnails converted by the pool into the policy's conversion
+    cache. Failed images are left out; the docx assembly converts them again
+    and reports the error.
+    """
+    cache = ConversionCache(baseline.conversion_cache_dir(policy_dir), max_bytes=cache_max_bytes)
+    results = [result for chunk in chunks for result in chunk]
+    for key, (encoded, error) in zip(keys, results):
+        if error is None:
+            cache.write(key, encoded.blob)
+    cache.save()
+    return len(results)
+
+
+def add_baseline_tasks(graph, policies, args):
+    cache_max_bytes = args.cache_size_mb * 1024 * 1024
+    memory_budget = args.memory_budget_mb * 1024 * 1024
+    partials = []
+    for index, policy_dir in enumerate(policies):
+        name = os.path.basename(policy_dir)
+        files = PolicyFiles(policy_dir)
+        deps = []
+
+        # 基線圖先轉好放進快取
+        if files.isfile('shortbaseline_plot.eps'):
+            deps.append(graph.add('eps:' + name, eps_raster.rasterize,
+                                  policy_dir + '\\shortbaseline_plot.eps',
+                                  policy_dir + '\\shortbaseline_plot.png',
+                                  3, os.path.join(policy_dir, 'tmp', 'eps_cache'),
+                                  priority=PRIORITY_PREPARE))
+
+        # 快取裡還沒有的縮圖分批轉檔
+        cache = ConversionCache(baseline.conversion_cache_dir(policy_dir), max_bytes=cache_max_bytes)
+        pending = [entry for pattern in baseline.IMAGE_PATTERNS
+                   for entry in files.glob('postprocessing/detrend_obs_file', pattern)
+                   if baseline.thumbnail_cache_key(entry, memory_budget) not in cache]
+        chunks = [pending[i:i + args.chunk_size] for i in range(0, len(pending), args.chunk_size)]
+        converted = [graph.add('convert:{}:{}'.format(name, n), baseline.convert_images,
+                               [entry.path for entry in chunk], memory_budget,
+                               priority=PRIORITY_PREPARE)
+                     for n, chunk in enumerate(chunks)]
+        if converted:
+            keys = [baseline.thumbnail_cache_key(entry, memory_budget) for entry in pending]
+            deps.append(graph.add('thumbnails:' + name, store_thumbnails, policy_dir, keys,
+                                  cache_max_bytes, *converted, local=True, priority=PRIORITY_PREPARE))
+
+        # 編號及最後一頁不換頁都由資料夾順序決定
+        doc_index = index + 1
+        partials.append(graph.add('baseline:' + name, baseline.build_partial_docx,
+                                  policy_dir, doc_index, doc_index != len(policies),
+                                  deps=[dep.name for dep in deps], priority=PRIORITY_ASSEMBLE,
+                                  incremental=args.incremental, keep_partial=args.keep_partials,
+                                  as_bytes=True, in_memory_images=True,
+                                  cache_max_bytes=cache_max_bytes, memory_budget=memory_budget))
+
+    output_path = args.policy_path + "\\doc\\基線.docx"
+    graph.add('report:baseline', utils.concatenate_docx, partials, output_path,
+              engine=args.concat_engine, local=True)
+    return output_path
+
+
+def add_chart_tasks(graph, module, report, policies, args):
+    names = [os.path.basename(policy_dir) for policy_dir in policies]
+    if module is coherence:
+        charts = [graph.add('coherence:' + name, coherence.render_policy_chart, args.policy_path, name,
+                            index + 1, args.incremental, args.density_threshold, args.max_markers,
+                            priority=PRIORITY_CHART)
+                  for index, name in enumerate(names)]
+    else:
+        charts = [graph.add('coregistration:' + name, coregistration.render_policy_chart, args.policy_path,
+                            name, args.incremental, priority=PRIORITY_CHART)
+                  for name in names]
+
+    output_path = args.policy_path + "\\doc\\" + report + '.docx'
+    partials_dir = args.policy_path + '\\tmp' if args.keep_partials else None
+    graph.add('report:' + report, module.export_report, charts, output_path,
+              engine=args.concat_engine, partials_dir=partials_dir, local=True)
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='一次產生基線、同調性及匹配誤差報表')
+    parser.add_argument('policy_path', help='包含 Policy* 資料夾的路徑')
+    parser.add_argument('--reports', nargs='+', choices=REPORTS, default=REPORTS,
+                        help='要產生的報表 (預設全部)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='共用 process pool 的大小，0 代表使用全部 CPU (預設 0)')
+    parser.add_argument('--chunk-size', type=int, default=8,
+                        help='每個轉檔工作處理的影像張數 (預設 8)')
+    parser.add_argument('--cache-size-mb', type=int, default=512,
+                        help='每個 Policy 轉檔快取的容量上限 (MB，預設 512)')
+    parser.add_argument('--memory-budget-mb', type=int, default=256,
+                        help='單張影像解碼的記憶體上限 (MB，預設 256)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='輸入檔與設定都沒變的部分沿用上次的結果')
+    parser.add_argument('--keep-partials', action='store_true',
+                        help='除錯用：仍輸出各報表的中間 docx')
+    parser.add_argument('--concat-engine', choices=['composer', 'package'], default='composer',
+                        help='合併 docx 的方式：docxcompose 或較快的套件層級合併 (utils.PackageComposer)')
+    parser.add_argument('--density-threshold', type=int, default=coherence.DENSITY_THRESHOLD,
+                        help='同調性圖點數超過此值時改畫密度圖 (預設 {})'.format(coherence.DENSITY_THRESHOLD))
+    parser.add_argument('--max-markers', type=int, default=None,
+                        help='同調性圖逐點畫圈時最多畫幾個點，超過時以固定的亂數種子抽樣 (預設全部)')
+    parser.add_argument('--no-open', action='store_true',
+                        help='完成後不要自動打開輸出的 docx')
+    parser.add_argument('--profile', action='store_true',
+                        help='記錄各階段的時間與記憶體，輸出到 tmp\\profile-deliver.json 及 .trace.json')
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    print('=== 雷達影像報表產生器 ===')
+    print('正在 ' + args.policy_path + ' 位置下尋找 Policy 資料夾... ', end='')
+    policies = glob.glob(args.policy_path + '\\Policy*')
+    print('共找到 ', len(policies), ' 組資料如下')
+    for p in policies:
+        print(p.split('\\')[-1])
+
+    graph = TaskGraph()
+    outputs = {}
+    if 'baseline' in args.reports:
+        outputs['baseline'] = add_baseline_tasks(graph, policies, args)
+    if 'coherence' in args.reports:
+        outputs['coherence'] = add_chart_tasks(graph, coherence, 'coherence', policies, args)
+    if 'coregistration' in args.reports:
+        outputs['coregistration'] = add_chart_tasks(graph, coregistration, 'coregistration', policies, args)
+
+    workers = args.workers or os.cpu_count()
+    print('開始處理: {} 個工作，{} 個 process'.format(len(graph.tasks), workers))
+    start = time.perf_counter()
+    results, failures = graph.run(workers)
+    print('完成，耗時 {:.1f} 秒'.format(time.perf_counter() - start))
+
+    for name, error in sorted(failures.items()):
+        print('失敗:', name, error)
+    if args.profile:
+        print('效能紀錄:', *profiling.write_report(os.path.join(args.policy_path, 'tmp', 'profile-deliver')))
+    for report, output_path in outputs.items():
+        if 'report:' + report in results:
+            print('輸出', output_path)
+            if not args.no_open:
+                os.system('start ' + output_path)
+    if failures:
+        raise SystemExit(1)
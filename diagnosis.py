@@ -12,16 +12,20 @@ for p in policies:
 print('開始檢查:')
 
 
-from baseline import Policy
+# baseline (docx、PIL) 到真的要檢查影像時才載入，前面的檔案檢查不必等它
+from policy_files import PolicyFiles
 
 
 for index, policy_dir in enumerate(policies):
     print('第', index+1, '組資料:' , policy_dir)
 
+    # 每個資料夾只掃描一次，之後的檢查都查詢這份索引
+    files = PolicyFiles(policy_dir)
+
     # --- Check 1: coregistration_Error_file ---
     coregistration_Error_file = os.path.join(policy_dir, 'Report_3coregistration_Error.txt')
     print('尋找', coregistration_Error_file, '...', end='')
-    if not os.path.isfile(coregistration_Error_file):
+    if not files.isfile('Report_3coregistration_Error.txt'):
         print(f'fail\n    在 {policy_dir} 中找不到 Report_3coregistration_Error.txt, 無法產生誤差分析')
         continue
     else:
@@ -30,7 +34,7 @@ for index, policy_dir in enumerate(policies):
     # --- Check 2: coherence_file ---
     coherence_file = os.path.join(policy_dir, 'coherence_phase', 'ifg_coh_filt_coh_compare')
     print('尋找', coherence_file, '...', end='')
-    if not os.path.isfile(coherence_file):
+    if not files.isfile('coherence_phase/ifg_coh_filt_coh_compare'):
         print(f'fail\n    在 {policy_dir} 中找不到 coherence_phase\\ifg_coh_filt_coh_compare, 無法產生同調性分析')
         continue
     else:
@@ -39,7 +43,7 @@ for index, policy_dir in enumerate(policies):
     # --- Check 3: postprocessing_file ---
     postprocessing_file = os.path.join(policy_dir, 'postprocessing', 'shortbaseline')
     print('尋找', postprocessing_file, '...', end='')
-    if not os.path.isfile(postprocessing_file):
+    if not files.isfile('postprocessing/shortbaseline'):
         print(f'fail\n    在 {policy_dir} 中找不到 postprocessing\\shortbaseline, 無法分析基線資訊')
         continue
     else:
@@ -48,14 +52,15 @@ for index, policy_dir in enumerate(policies):
     # --- Check 4: shortbaseline_plot_path ---
     shortbaseline_plot_path = os.path.join(policy_dir, 'shortbaseline_plot.eps')
     print('尋找', shortbaseline_plot_path, '...', end='')
-    if not os.path.isfile(shortbaseline_plot_path):
+    if not files.isfile('shortbaseline_plot.eps'):
         print(f'fail\n    在 {policy_dir} 中找不到 shortbaseline_plot.eps, 無法貼上大張基線圖')
         continue
     else:
         print('success')
     
     try:
-        policy = Policy(policy_dir=policy_dir, index=0)
+        from baseline import Policy
+        policy = Policy(policy_dir=policy_dir, index=0, files=files)
         missing_bmp = policy.check_bmp_path()
         if missing_bmp is not None:
             print('    找不到', missing_bmp, '無法產生基線圖檔')
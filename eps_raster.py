@@ -0,0 +1,83 @@
+"""
+Rasterizes shortbaseline_plot.eps through Ghostscript (via Pillow) with a
+cache keyed by the EPS content hash and the scale.
+
+Can run as a background process:
+    python eps_raster.py <eps_path> <png_path> <scale> <cache_dir>
+"""
+import filecmp
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+# 轉檔方式變更時遞增，讓舊的快取自動失效
+CACHE_VERSION = 1
+
+
+def cache_key(eps_path, scale):
+    sha1 = hashlib.sha1()
+    sha1.update('{}:{}:'.format(CACHE_VERSION, scale).encode('ascii'))
+    with open(eps_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _cached_png_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.png')
+
+
+def _copy_if_changed(src, dst):
+    # 內容沒變就不重寫，避免更新 png 的修改時間
+    if os.path.isfile(dst) and filecmp.cmp(src, dst, shallow=False):
+        return
+    shutil.copyfile(src, dst)
+
+
+def fetch_cached(eps_path, png_path, scale, cache_dir, key=None):
+    """
+    Puts the cached rasterization of eps_path at png_path. Returns False on a miss.
+    """
+    cached_path = _cached_png_path(cache_dir, key or cache_key(eps_path, scale))
+    if not os.path.isfile(cached_path):
+        return False
+    _copy_if_changed(cached_path, png_path)
+    return True
+
+
+def rasterize(eps_path, png_path, scale=3, cache_dir=None):
+    key = None
+    if cache_dir is not None:
+        key = cache_key(eps_path, scale)
+        if fetch_cached(eps_path, png_path, scale, cache_dir, key):
+            return png_path
+
+    from PIL import Image
+    with Image.open(eps_path) as eps_image:
+        eps_image.load(scale=scale)
+        eps_image.save(png_path)
+
+    if cache_dir is not None:
+        # 每個 Policy 只有一張基線圖，舊的快取直接清掉
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.copyfile(png_path, _cached_png_path(cache_dir, key))
+    return png_path
+
+
+def start_rasterize(eps_path, png_path, scale=3, cache_dir=None):
+    """
+    Starts rasterize in a background process and returns the Popen handle,
+    or None when the cache already holds the result (copied synchronously).
+    """
+    if cache_dir is not None and fetch_cached(eps_path, png_path, scale, cache_dir):
+        return None
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             eps_path, png_path, str(scale), cache_dir or ''])
+
+
+if __name__ == '__main__':
+    eps_path, png_path, scale, cache_dir = sys.argv[1:5]
+    rasterize(eps_path, png_path, int(scale), cache_dir or None)
@@ -0,0 +1,485 @@
+import io
+import json
+import logging
+import os
+import struct
+from collections import namedtuple
+from math import ceil, gcd
+
+from PIL import Image, ImageFile
+
+# 單張影像解碼時允許使用的記憶體上限 (bytes)
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# 先以整數倍率縮小，保留至少 3 倍目標尺寸再交給 LANCZOS，
+# 與 Pillow 的 reducing_gap 建議值相同，成品與直接 resize 看不出差別
+REDUCING_GAP = 3.0
+
+# Image.reduce 支援的模式，其他模式 (例如調色盤) 無法分段縮小
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'I', 'F')
+
+# TIFF NewSubfileType 標籤，bit 0 代表這個 IFD 是縮小版 (overview)
+NEW_SUBFILE_TYPE = 254
+
+# 可逐條 (strip) 解碼的 TIFF 壓縮方式：LZW、Deflate、PackBits
+_STRIP_COMPRESSIONS = (5, 8, 32946, 32773)
+
+# 逐條解碼時沿用原檔的標籤：寬、每像素位元數、壓縮、色彩、取樣數、
+# 平面設定、預測器、額外取樣、取樣格式
+_STRIP_TAGS = (256, 258, 259, 262, 277, 284, 317, 338, 339)
+
+# 寬、高、各條位置、每條列數、各條長度存成 LONG，其餘標籤都是 SHORT
+_LONG_TAGS = (256, 257, 273, 278, 279)
+
+logger = logging.getLogger(__name__)
+
+# Pillow 11 起 tile 是 namedtuple，較早的版本是一般的 tuple
+_Tile = getattr(ImageFile, '_Tile', lambda *fields: fields)
+
+
+class EncodedImage(namedtuple('EncodedImage', ['filename', 'blob', 'px_width', 'px_height', 'dpi'])):
+    """
+    A PNG encoded in memory together with the header facts python-docx
+    needs, so it can be inserted without being written or parsed again.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_png_blob(cls, filename, blob, dpi):
+        # IHDR 緊接在 8 bytes 的 PNG 簽章與 8 bytes 的 chunk 標頭之後
+        px_width, px_height = struct.unpack('>II', blob[16:24])
+        return cls(filename, blob, px_width, px_height, dpi)
+
+    @property
+    def stream(self):
+        return io.BytesIO(self.blob)
+
+
+ImageInfo = namedtuple('ImageInfo', ['format', 'width', 'height', 'bit_depth', 'dpi', 'palette'])
+
+# TIFF 欄位型態對應的 (struct 格式, bytes 數)
+_TIFF_TYPES = {
+    1: ('B', 1), 2: ('B', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8),
+    6: ('b', 1), 7: ('B', 1), 8: ('h', 2), 9: ('i', 4), 10: ('ii', 8),
+    11: ('f', 4), 12: ('d', 8), 16: ('Q', 8), 17: ('q', 8), 18: ('Q', 8),
+}
+
+
+def _dpi_from_ppm(x_ppm, y_ppm):
+    if x_ppm <= 0 or y_ppm <= 0:
+        return None
+    return (int(round(x_ppm * 0.0254)), int(round(y_ppm * 0.0254)))
+
+
+def _probe_bmp(f):
+    header = f.read(54)
+    dib_size = struct.unpack('<I', header[14:18])[0]
+    if dib_size == 12:
+        width, height, _, bit_count = struct.unpack('<HHHH', header[18:26])
+        dpi = None
+    else:
+        width, height, _, bit_count = struct.unpack('<iiHH', header[18:30])
+        x_ppm, y_ppm = struct.unpack('<ii', header[38:46])
+        dpi = _dpi_from_ppm(x_ppm, y_ppm)
+    return ImageInfo('BMP', width, abs(height), bit_count, dpi, bit_count <= 8)
+
+
+def _probe_png(f):
+    f.seek(8)
+    width = height = bit_depth = 0
+    dpi = None
+    palette = False
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+        length, chunk_type = struct.unpack('>I4s', chunk_header)
+        if chunk_type == b'IHDR':
+            width, height, sample_depth, color_type = struct.unpack('>IIBB', f.read(10))
+            channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color_type, 1)
+            bit_depth = sample_depth * channels
+            palette = color_type == 3
+            f.seek(length - 10 + 4, os.SEEK_CUR)
+        elif chunk_type == b'pHYs':
+            x_ppu, y_ppu, unit = struct.unpack('>IIB', f.read(9))
+            if unit == 1:
+                dpi = _dpi_from_ppm(x_ppu, y_ppu)
+            f.seek(4, os.SEEK_CUR)
+        elif chunk_type in (b'IDAT', b'IEND'):
+            # 之後都是像素資料，標頭到此為止
+            break
+        else:
+            f.seek(length + 4, os.SEEK_CUR)
+    return ImageInfo('PNG', width, height, bit_depth, dpi, palette)
+
+
+def _probe_tiff(f):
+    byte_order = '<' if f.read(2) == b'II' else '>'
+    magic = struct.unpack(byte_order + 'H', f.read(2))[0]
+    if magic == 43:
+        # BigTIFF: 8 bytes 的位移量與數量
+        f.read(4)
+        count_format, entry_format, inline_size = 'Q', 'HHQ', 8
+        ifd_offset = struct.unpack(byte_order + 'Q', f.read(8))[0]
+    else:
+        count_format, entry_format, inline_size = 'H', 'HHI', 4
+        ifd_offset = struct.unpack(byte_order + 'I', f.read(4))[0]
+    offset_format = 'Q' if inline_size == 8 else 'I'
+
+    f.seek(ifd_offset)
+    count_size = struct.calcsize(count_format)
+    entry_count = struct.unpack(byte_order + count_format, f.read(count_size))[0]
+    entry_size = struct.calcsize('=' + entry_format) + inline_size
+    entries = f.read(entry_count * entry_size)
+
+    tags = {}
+    for i in range(entry_count):
+        entry = entries[i * entry_size:(i + 1) * entry_size]
+        tag, field_type, count = struct.unpack(byte_order + entry_format, entry[:-inline_size])
+        if tag not in (256, 257, 258, 262, 277, 282, 283, 296) or field_type not in _TIFF_TYPES:
+            continue
+        value_format, value_size = _TIFF_TYPES[field_type]
+        data = entry[-inline_size:]
+        if count * value_size > inline_size:
+            position = f.tell()
+            f.seek(struct.unpack(byte_order + offset_format, data)[0])
+            data = f.read(count * value_size)
+            f.seek(position)
+        values = struct.unpack(byte_order + value_format * count, data[:count * value_size])
+        if field_type in (5, 10):
+            values = tuple(values[j] / values[j + 1] if values[j + 1] else 0
+                           for j in range(0, len(values), 2))
+        tags[tag] = values
+
+    bits = tags.get(258, (1,))
+    samples = tags.get(277, (len(bits),))[0]
+    bit_depth = sum(bits) if len(bits) > 1 else bits[0] * samples
+    dpi = None
+    if 282 in tags and 283 in tags:
+        unit = tags.get(296, (2,))[0]
+        scale = 2.54 if unit == 3 else 1.0
+        if unit in (2, 3) and tags[282][0] > 0 and tags[283][0] > 0:
+            dpi = (int(round(tags[282][0] * scale)), int(round(tags[283][0] * scale)))
+    return ImageInfo('TIFF', tags.get(256, (0,))[0], tags.get(257, (0,))[0],
+                     bit_depth, dpi, tags.get(262, (None,))[0] == 3)
+
+
+def probe_image_header(source):
+    """
+    Reads only the header of a BMP, PNG or TIFF file (a path or a binary
+    file object) and returns an ImageInfo. No pixel data is decoded.
+    Returns None for other formats or truncated headers.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return probe_image_header(f)
+
+    signature = source.read(8)
+    source.seek(0)
+    try:
+        if signature[:2] == b'BM':
+            return _probe_bmp(source)
+        if signature == b'\x89PNG\r\n\x1a\n':
+            return _probe_png(source)
+        if signature[:4] in (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+'):
+            return _probe_tiff(source)
+    except struct.error:
+        return None
+    return None
+
+
+class ImageMetadataIndex:
+    """
+    Header facts of the images of one policy, persisted as JSON and keyed by
+    path, size and mtime so unchanged files are never probed again.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._entries = {}
+        self._dirty = False
+        if os.path.isfile(index_path):
+            try:
+                with open(index_path, encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def lookup(self, path, size, mtime_ns):
+        """
+        Returns the ImageInfo of path, probing the header only when the
+        recorded size or mtime no longer match. Returns None for unreadable
+        headers.
+        """
+        key = os.path.normcase(os.path.abspath(path))
+        record = self._entries.get(key)
+        if record is None or record['size'] != size or record['mtime_ns'] != mtime_ns:
+            info = probe_image_header(path)
+            record = {'size': size, 'mtime_ns': mtime_ns,
+                      'info': info._asdict() if info is not None else None}
+            self._entries[key] = record
+            self._dirty = True
+        if record['info'] is None:
+            return None
+        info = dict(record['info'])
+        if info['dpi'] is not None:
+            info['dpi'] = tuple(info['dpi'])
+        return ImageInfo(**info)
+
+    def lookup_entry(self, entry):
+        """
+        Same as lookup for a policy_files.FileEntry.
+        """
+        return self.lookup(entry.path, entry.size, entry.mtime_ns)
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_index_path = self.index_path + '.tmp'
+        with open(tmp_index_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_index_path, self.index_path)
+        self._dirty = False
+
+
+def open_image(path):
+    """
+    Opens an image lazily without Pillow's decompression bomb check.
+    Large GeoTIFFs are legitimate input here; memory is bounded by
+    resize_within_budget instead.
+    """
+    max_pixels = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+def decoded_size(img):
+    """
+    Returns how many bytes the pixel data of img takes once decoded.
+    """
+    if img.mode in ('I', 'F'):
+        bytes_per_band = 4
+    elif img.mode.startswith('I;16'):
+        bytes_per_band = 2
+    else:
+        bytes_per_band = 1
+    w, h = img.size
+    return w * h * len(img.getbands()) * bytes_per_band
+
+
+def _reduce_factor(size, target_size):
+    w, h = size
+    target_w, target_h = target_size
+    return max(1, int(min(w / (target_w * REDUCING_GAP), h / (target_h * REDUCING_GAP))))
+
+
+def _select_overview(img, target_size):
+    """
+    Seeks img to the smallest reduced-resolution IFD that is still at least
+    REDUCING_GAP times the target size. Returns the selected frame number.
+    """
+    frame = img.tell()
+    best_frame, best_size = frame, img.size
+    min_w = target_size[0] * REDUCING_GAP
+    min_h = target_size[1] * REDUCING_GAP
+    for i in range(1, getattr(img, 'n_frames', 1)):
+        img.seek(i)
+        w, h = img.size
+        if not img.tag_v2.get(NEW_SUBFILE_TYPE, 0) & 1:
+            continue
+        if min_w <= w < best_size[0] and min_h <= h:
+            best_frame, best_size = i, (w, h)
+    img.seek(best_frame)
+    return best_frame
+
+
+def _compressed_strips(img):
+    """
+    Returns (tags, strips) for a striped TIFF compressed with LZW, Deflate
+    or PackBits: the tags describing the pixel layout and the strips as
+    (y0, y1, offset, byte count). Returns None for tiled or planar files
+    and other codecs.
+    """
+    tags = img.tag_v2
+    if (tags.get(259, 1) not in _STRIP_COMPRESSIONS or 273 not in tags or 279 not in tags
+            or tags.get(284, 1) != 1):
+        return None
+    w, h = img.size
+    rows_per_strip = min(tags.get(278, h), h)
+    strips = [(y0, min(y0 + rows_per_strip, h), offset, byte_count)
+              for y0, offset, byte_count in zip(range(0, h, rows_per_strip), tags[273], tags[279])]
+    if len(strips) * rows_per_strip < h:
+        return None
+    return {tag: tags[tag] for tag in _STRIP_TAGS if tag in tags}, strips
+
+
+def _single_strip_row_bytes(img):
+    """
+    Returns the bytes per row of an uncompressed TIFF stored as one strip
+    of full-width rows, which can be cut into bands at any row. Returns None
+    for other layouts.
+    """
+    if len(img.tile) != 1:
+        return None
+    codec, (x0, _, x1, _), _, args = img.tile[0]
+    if codec != 'raw' or (x0, x1) != (0, img.size[0]) or tuple(args[1:]) != (0, 1):
+        return None
+    bits = img.tag_v2.get(258, (1,))
+    samples = img.tag_v2.get(277, len(bits))
+    bits_per_pixel = sum(bits) if len(bits) > 1 else bits[0] * samples
+    return (img.size[0] * bits_per_pixel + 7) // 8
+
+
+def _can_decode_windowed(img):
+    if img.format != 'TIFF' or img.mode not in REDUCIBLE_MODES or not img.tile:
+        return False
+    return all(tile[0] == 'raw' for tile in img.tile) or _compressed_strips(img) is not None
+
+
+def _pack_tag(tag, value):
+    values = value if isinstance(value, tuple) else (value,)
+    return struct.pack('<' + ('I' if tag in _LONG_TAGS else 'H') * len(values), *values)
+
+
+def _strip_tiff(tags, height, rows_per_strip, data):
+    """
+    Returns a little-endian TIFF holding the compressed strips in data,
+    with the pixel layout of tags. The directory is written here because
+    Pillow before 9.x cannot save a StripOffsets table that does not fit
+    in the entry itself.
+    """
+    entries = dict(tags)
+    entries[257] = height
+    entries[278] = rows_per_strip
+    entries[279] = tuple(len(chunk) for chunk in data)
+    entries[273] = (0,) * len(data)
+
+    pack = _pack_tag
+    # 標頭 8 bytes、IFD、放不進欄位的數值，最後是各條資料
+    ifd_size = 2 + 12 * len(entries) + 4
+    extra_size = sum((len(pack(tag, value)) + 1) // 2 * 2 for tag, value in entries.items()
+                     if len(pack(tag, value)) > 4)
+    offsets = []
+    position = 8 + ifd_size + extra_size
+    for chunk in data:
+        offsets.append(position)
+        position += len(chunk)
+    entries[273] = tuple(offsets)
+
+    ifd = [struct.pack('<H', len(entries))]
+    extra = []
+    extra_offset = 8 + ifd_size
+    for tag in sorted(entries):
+        value = pack(tag, entries[tag])
+        count = len(value) // (4 if tag in _LONG_TAGS else 2)
+        field_type = 4 if tag in _LONG_TAGS else 3
+        if len(value) <= 4:
+            ifd.append(struct.pack('<HHI', tag, field_type, count) + value.ljust(4, b'\x00'))
+        else:
+            ifd.append(struct.pack('<HHII', tag, field_type, count, extra_offset))
+            value = value.ljust((len(value) + 1) // 2 * 2, b'\x00')
+            extra.append(value)
+            extra_offset += len(value)
+    ifd.append(struct.pack('<I', 0))
+    return b''.join([b'II*\x00', struct.pack('<I', 8)] + ifd + extra + data)
+
+
+def _decode_strips(path, tags, strips):
+    """
+    Decodes consecutive compressed strips of path: their bytes are copied
+    into a small in-memory TIFF with the same pixel layout, which Pillow
+    then decodes like any other file.
+    """
+    data = []
+    with open(path, 'rb') as f:
+        for _, _, offset, byte_count in strips:
+            f.seek(offset)
+            data.append(f.read(byte_count))
+
+    band = Image.open(io.BytesIO(_strip_tiff(tags, strips[-1][1] - strips[0][0],
+                                             strips[0][1] - strips[0][0], data)))
+    band.load()
+    return band
+
+
+def _decode_windowed(path, frame, factor, memory_budget):
+    """
+    Decodes a striped or tiled TIFF (uncompressed, or striped with LZW,
+    Deflate or PackBits) one band of strips at a time, reducing each band by
+    factor before the next one is read. Band heights are multiples of
+    factor (and of the strip height) so the bands join without seams; an
+    uncompressed TIFF stored as a single strip is cut at band boundaries.
+    """
+    with open_image(path) as img:
+        img.seek(frame)
+        w, h = img.size
+        mode = img.mode
+        bytes_per_row = max(1, decoded_size(img) // h)
+        compressed = _compressed_strips(img) if img.tile[0][0] != 'raw' else None
+        row_bytes = _single_strip_row_bytes(img)
+        tiles = sorted(img.tile, key=lambda tile: (tile[1][1], tile[1][0]))
+
+    if compressed is not None:
+        tags, strips = compressed
+        strip_h = strips[0][1] - strips[0][0]
+    elif row_bytes is not None:
+        # 整張只有一條時 (Pillow 存檔的預設)，可以在任何一列切開
+        strip_h = 1
+    else:
+        strip_h = tiles[0][1][3] - tiles[0][1][1]
+    step = strip_h * factor // gcd(strip_h, factor)
+    band_h = max(step, (memory_budget // bytes_per_row) // step * step)
+    if row_bytes is not None:
+        codec, _, offset, args = tiles[0]
+        tiles = [_Tile(codec, (0, y0, w, min(y0 + band_h, h)), offset + y0 * row_bytes, args)
+                 for y0 in range(0, h, band_h)]
+
+    reduced = Image.new(mode, (ceil(w / factor), ceil(h / factor)))
+    for band_y0 in range(0, h, band_h):
+        band_y1 = min(band_y0 + band_h, h)
+        if compressed is not None:
+            band = _decode_strips(path, tags, [strip for strip in strips if band_y0 <= strip[0] < band_y1])
+            reduced.paste(band.reduce(factor), (0, band_y0 // factor))
+            continue
+
+        band_tiles = [
+            _Tile(codec, (x0, y0 - band_y0, x1, y1 - band_y0), offset, args)
+            for codec, (x0, y0, x1, y1), offset, args in tiles
+            if band_y0 <= y0 < band_y1
+        ]
+        with open_image(path) as band:
+            band.seek(frame)
+            band.tile = band_tiles
+            band._size = (w, band_y1 - band_y0)
+            band.load()
+            reduced.paste(band.reduce(factor), (0, band_y0 // factor))
+    return reduced
+
+
+def resize_within_budget(img, path, target_size, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Resizes img to target_size with LANCZOS while keeping the decoded pixel
+    data under memory_budget. Images that fit the budget are resized exactly
+    as before; larger TIFFs are read from an overview or in reduced bands.
+    Anything else is decoded in full, with a logged warning.
+    """
+    if decoded_size(img) <= memory_budget:
+        return img.resize(target_size, Image.LANCZOS)
+
+    frame = 0
+    if img.format == 'TIFF':
+        frame = _select_overview(img, target_size)
+        if decoded_size(img) <= memory_budget:
+            return img.resize(target_size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+
+    if _can_decode_windowed(img):
+        factor = _reduce_factor(img.size, target_size)
+        reduced = _decode_windowed(path, frame, factor, memory_budget)
+        return reduced.resize(target_size, Image.LANCZOS)
+
+    logger.warning('%s 無法分段讀取，將完整解碼 %d MB', path, decoded_size(img) // (1024 * 1024))
+    return img.resize(target_size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
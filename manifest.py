@@ -0,0 +1,111 @@
+"""
+Input manifests for incremental rebuilds.
+
+Every partial output (tmp\\baseline-N.docx, coherence.png, coregistration.png)
+can get a <output>.manifest.json next to it recording the size, mtime and,
+for small files, the SHA1 of each input plus the generator settings. A rerun
+reuses the output when none of these changed.
+"""
+import hashlib
+import json
+import os
+
+# 格式或產生器邏輯變更時遞增，讓舊的 manifest 全部失效
+MANIFEST_VERSION = 1
+
+# 小於這個大小的輸入檔另外記錄 SHA1，只改 mtime 不改內容時仍可重用
+HASH_LIMIT = 16 * 1024 * 1024
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _stat(path, known_stats):
+    entry = known_stats.get(_key(path)) if known_stats else None
+    if entry is not None:
+        return entry.size, entry.mtime_ns
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def known_stats(entries):
+    """
+    Maps policy_files.FileEntry objects by path for the known_stats arguments.
+    """
+    return {_key(entry.path): entry for entry in entries}
+
+
+def manifest_path(output_path):
+    return output_path + '.manifest.json'
+
+
+def build_manifest(inputs, settings, known_stats=None):
+    """
+    inputs is a list of file paths; settings a JSON-serializable dict.
+    known_stats optionally maps normalized paths to policy_files.FileEntry
+    objects whose size and mtime are already known.
+    """
+    records = {}
+    for path in inputs:
+        size, mtime_ns = _stat(path, known_stats)
+        record = {'size': size, 'mtime_ns': mtime_ns}
+        if size <= HASH_LIMIT:
+            record['sha1'] = _sha1(path)
+        records[_key(path)] = record
+    return {'version': MANIFEST_VERSION, 'settings': settings, 'inputs': records}
+
+
+def write_manifest(output_path, inputs, settings, known_stats=None):
+    manifest = build_manifest(inputs, settings, known_stats)
+    tmp_path = manifest_path(output_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path(output_path))
+
+
+def is_up_to_date(output_path, inputs, settings, known_stats=None):
+    """
+    Returns True when output_path exists and its manifest matches the
+    current inputs and settings.
+    """
+    if not os.path.isfile(output_path) or not os.path.isfile(manifest_path(output_path)):
+        return False
+    try:
+        with open(manifest_path(output_path), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return False
+    # 經過 JSON 來回一次，讓 tuple 與 list 之類的差異不影響比較
+    if manifest.get('settings') != json.loads(json.dumps(settings)):
+        return False
+
+    records = manifest.get('inputs', {})
+    if set(records) != {_key(path) for path in inputs}:
+        return False
+
+    for path in inputs:
+        record = records[_key(path)]
+        try:
+            size, mtime_ns = _stat(path, known_stats)
+        except FileNotFoundError:
+            return False
+        if size != record['size']:
+            return False
+        if mtime_ns == record['mtime_ns']:
+            continue
+        # mtime 變了但內容可能相同 (例如重新複製檔案)
+        if 'sha1' not in record or _sha1(path) != record['sha1']:
+            return False
+    return True
@@ -0,0 +1,102 @@
+"""
+Matplotlib setup shared by coherence.py and coregistration.py.
+
+Charts are drawn on their own Figure with a FigureCanvasAgg (new_figure),
+never through pyplot, so nothing is left in global state between charts
+and policies can be rendered in parallel processes. Font settings only
+apply inside `with rc(...)` while a chart is drawn and saved.
+
+matplotlib is only imported when the first chart is drawn, with
+MPLCONFIGDIR pointing to .mplconfig next to the scripts, so the font
+cache is built once per installation instead of again whenever the
+default folder is missing or not writable.
+
+    python plotting.py
+
+builds the font cache ahead of time and shows where the report fonts were
+found (setup.bat runs it after creating the environment).
+"""
+import os
+import sys
+
+# 報表使用的字型
+CHINESE_FONT = 'DFKai-SB'
+ENGLISH_FONT = 'Times New Roman'
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mplconfig')
+
+
+def _matplotlib():
+    # 使用者自己設定的 MPLCONFIGDIR 優先
+    if 'matplotlib' not in sys.modules:
+        os.environ.setdefault('MPLCONFIGDIR', CONFIG_DIR)
+        os.makedirs(os.environ['MPLCONFIGDIR'], exist_ok=True)
+    import matplotlib
+    return matplotlib
+
+
+def new_figure(figsize=None):
+    """
+    Returns a Figure of figsize inches (default from rcParams) attached to
+    its own Agg canvas.
+    """
+    _matplotlib()
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def rc(*fonts):
+    """
+    Context manager applying the report settings with fonts as the
+    sans-serif list while a chart is drawn and saved.
+    """
+    return _matplotlib().rc_context({'font.sans-serif': list(fonts), 'axes.unicode_minus': False})
+
+
+def font_fallback_supported():
+    """
+    True when matplotlib can take missing glyphs from the next font of a
+    family list (matplotlib 3.6 and later).
+    """
+    version = tuple(int(part) for part in _matplotlib().__version__.split('.')[:2])
+    return version >= (3, 6)
+
+
+def mixed_font(size=None, weight=None):
+    """
+    FontProperties for text mixing Chinese and Latin characters: Latin
+    glyphs in Times New Roman, Chinese ones from DFKai-SB. Without font
+    fallback the whole text is drawn in DFKai-SB.
+    """
+    from matplotlib.font_manager import FontProperties
+    families = [ENGLISH_FONT, CHINESE_FONT] if font_fallback_supported() else [CHINESE_FONT]
+    return FontProperties(family=families, size=size, weight=weight)
+
+
+def warm_font_cache(fonts=(CHINESE_FONT, ENGLISH_FONT)):
+    """
+    Loads (building it if needed) the matplotlib font cache and looks up the
+    report fonts. Returns {font: file path or None when not installed}.
+    """
+    _matplotlib()
+    from matplotlib import font_manager
+    found = {}
+    for font in fonts:
+        try:
+            found[font] = font_manager.findfont(font_manager.FontProperties(family=font),
+                                                fallback_to_default=False)
+        except ValueError:
+            found[font] = None
+    return found
+
+
+if __name__ == '__main__':
+    import time
+    start = time.perf_counter()
+    found = warm_font_cache()
+    print('matplotlib 字型快取:', os.environ['MPLCONFIGDIR'], '({:.1f} 秒)'.format(time.perf_counter() - start))
+    for font, path in found.items():
+        print('   ', font, path or '找不到，圖表會改用預設字型')
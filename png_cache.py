@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# 轉檔邏輯或輸出格式變更時遞增，讓舊的快取自動失效
+CACHE_VERSION = 2
+
+
+class ConversionCache:
+    """
+    Persistent cache of converted thumbnails.
+    Entries are keyed by the source path, size, mtime and the conversion
+    parameters, so an unchanged source image is never converted twice.
+    The cache is bounded in bytes and evicts least recently used entries.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+        if os.path.isfile(self.index_path):
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+                if index.get('version') == CACHE_VERSION:
+                    self._entries = index.get('entries', {})
+            except (OSError, ValueError):
+                # 索引損毀時當作空的快取，之後會被覆寫
+                self._entries = {}
+
+    @staticmethod
+    def make_key(source_path, source_stat=None, **params):
+        """
+        source_stat may be a policy_files.FileEntry already holding the size
+        and mtime, which saves a stat call per image.
+        """
+        if source_stat is None:
+            stat = os.stat(source_path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        else:
+            size, mtime_ns = source_stat.size, source_stat.mtime_ns
+        raw = json.dumps([CACHE_VERSION, os.path.abspath(source_path),
+                          size, mtime_ns, sorted(params.items())])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.png')
+
+    def __contains__(self, key):
+        return key in self._entries and os.path.isfile(self._entry_path(key))
+
+    def read(self, key):
+        """
+        Returns the cached thumbnail bytes, or None on a miss.
+        """
+        entry_path = self._entry_path(key)
+        if key not in self._entries or not os.path.isfile(entry_path):
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        with open(entry_path, 'rb') as f:
+            blob = f.read()
+        self._entries[key]['last_used'] = time.time()
+        self.hits += 1
+        return blob
+
+    def write(self, key, blob):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._entry_path(key), 'wb') as f:
+            f.write(blob)
+        self._entries[key] = {'size': len(blob), 'last_used': time.time()}
+
+    def evict(self):
+        total = sum(entry['size'] for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries.pop(key)['size']
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        self.evict()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_index_path = self.index_path + '.tmp'
+        with open(tmp_index_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self._entries}, f)
+        os.replace(tmp_index_path, self.index_path)
+
+    def purge(self):
+        self._entries = {}
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,114 @@
+import fnmatch
+import os
+import re
+from collections import namedtuple
+
+FileEntry = namedtuple('FileEntry', ['name', 'path', 'size', 'mtime_ns', 'is_dir'])
+
+
+class DirectoryIndex:
+    """
+    Snapshot of one directory listing taken with a single os.scandir pass.
+    On Windows the size and mtime come with the listing itself, so lookups
+    never stat files one by one (each stat is a round trip on SMB shares).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.exists = True
+        self._entries = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # 列出之後才被刪除 (或是斷掉的連結) 的項目略過
+                        continue
+                    self._entries[os.path.normcase(entry.name)] = FileEntry(
+                        entry.name, entry.path, stat.st_size, stat.st_mtime_ns, entry.is_dir())
+        except (FileNotFoundError, NotADirectoryError):
+            self.exists = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(sorted(self._entries.values(), key=lambda entry: entry.name))
+
+    def get(self, name):
+        return self._entries.get(os.path.normcase(name))
+
+    def isfile(self, name):
+        entry = self.get(name)
+        return entry is not None and not entry.is_dir
+
+    def isdir(self, name):
+        entry = self.get(name)
+        return entry is not None and entry.is_dir
+
+    def glob(self, pattern):
+        """
+        Returns the sorted entries whose names match pattern, with the same
+        rules as glob.glob in this directory (hidden files are skipped
+        unless the pattern starts with a dot).
+        """
+        matches = []
+        for entry in self._entries.values():
+            if entry.name.startswith('.') and not pattern.startswith('.'):
+                continue
+            if fnmatch.fnmatch(entry.name, pattern):
+                matches.append(entry)
+        matches.sort(key=lambda entry: entry.path)
+        return matches
+
+
+class PolicyFiles:
+    """
+    Lazily built DirectoryIndex per sub-directory of one Policy folder,
+    shared by report generation and diagnosis. Relative paths may use either
+    slash style, e.g. 'postprocessing\\detrend_obs_file'.
+    """
+
+    def __init__(self, policy_dir):
+        self.policy_dir = policy_dir
+        self._directories = {}
+
+    @staticmethod
+    def _split(relative_path):
+        return [part for part in re.split(r'[\\/]', relative_path) if part]
+
+    def directory(self, relative_dir=''):
+        parts = self._split(relative_dir)
+        key = os.path.normcase('/'.join(parts))
+        index = self._directories.get(key)
+        if index is None:
+            index = self._directories[key] = DirectoryIndex(os.path.join(self.policy_dir, *parts))
+        return index
+
+    def get(self, relative_path):
+        parts = self._split(relative_path)
+        if not parts:
+            return None
+        return self.directory('/'.join(parts[:-1])).get(parts[-1])
+
+    def isfile(self, relative_path):
+        entry = self.get(relative_path)
+        return entry is not None and not entry.is_dir
+
+    def isdir(self, relative_path):
+        entry = self.get(relative_path)
+        return entry is not None and entry.is_dir
+
+    def glob(self, relative_dir, pattern):
+        return self.directory(relative_dir).glob(pattern)
+
+    def refresh(self, relative_dir=None):
+        """
+        Drops the cached listing of relative_dir (or of every directory) so
+        the next lookup scans it again.
+        """
+        if relative_dir is None:
+            self._directories.clear()
+        else:
+            self._directories.pop(os.path.normcase('/'.join(self._split(relative_dir))), None)
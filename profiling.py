@@ -0,0 +1,249 @@
+"""
+Optional per-stage instrumentation for the report scripts (--profile).
+
+Stages are marked with `with profiling.stage(name, policy=...)` or the
+@profiled decorator and cost nothing until enable() is called. Each stage
+records wall time, CPU time of the process and the peak process RSS seen
+while it ran (sampled by a background thread). Nested stages inherit the
+policy of the stage around them, so the summary can be broken down per
+policy.
+
+Worker processes run their task through run_profiled, which returns the
+events along with the result; the parent passes them to add_events.
+write_report then writes a JSON summary and a Chrome trace
+(chrome://tracing or https://ui.perfetto.dev).
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# RSS 取樣間隔 (秒)
+SAMPLE_INTERVAL = 0.02
+
+_profiler = None
+
+
+def current_rss():
+    """
+    Returns the resident memory of this process in bytes, or None when the
+    platform offers no way to read it.
+    """
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD),
+                        ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # 沒有 /proc 時 (macOS) 只能拿到整個 process 的最高用量
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _OpenStage:
+    __slots__ = ('name', 'args', 'ts', 'wall', 'cpu', 'peak')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.ts = time.time_ns() // 1000
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.peak = current_rss() or 0
+
+
+class Profiler:
+    """
+    Collects the stages of one process as Chrome trace 'X' events.
+    """
+
+    def __init__(self, process_name=None):
+        self.pid = os.getpid()
+        self.process_name = process_name or os.path.basename(sys.argv[0]) or 'python'
+        self.events = []
+        # 每個 process (包括 worker) 一筆 process_name，供 trace 顯示
+        self.process_names = {self.pid: {'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                                         'args': {'name': self.process_name}}}
+        self._open = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            rss = current_rss()
+            if rss is None:
+                return
+            with self._lock:
+                for open_stage in self._open:
+                    if rss > open_stage.peak:
+                        open_stage.peak = rss
+
+    @contextmanager
+    def stage(self, name, **args):
+        with self._lock:
+            if 'policy' not in args:
+                for outer in reversed(self._open):
+                    if 'policy' in outer.args:
+                        args['policy'] = outer.args['policy']
+                        break
+            open_stage = _OpenStage(name, args)
+            self._open.append(open_stage)
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - open_stage.wall
+            cpu = time.process_time() - open_stage.cpu
+            with self._lock:
+                self._open.remove(open_stage)
+                peak = max(open_stage.peak, current_rss() or 0)
+            event_args = dict(open_stage.args)
+            event_args.update(cpu_ms=round(cpu * 1000, 3), peak_rss_mb=round(peak / 2 ** 20, 1))
+            self.events.append({'name': name, 'cat': 'stage', 'ph': 'X',
+                                'ts': open_stage.ts, 'dur': round(wall * 1e6),
+                                'pid': self.pid, 'tid': threading.get_ident(),
+                                'args': event_args})
+
+    def take_events(self):
+        """
+        Returns the events recorded so far (with the process name) and
+        clears them, so a reused worker process reports each task once.
+        """
+        events, self.events = [self.process_names[self.pid]] + self.events, []
+        return events
+
+    def close(self):
+        self._stop.set()
+
+
+def enable(process_name=None):
+    global _profiler
+    # fork 出來的 worker 會繼承父行程的 profiler (但沒有取樣執行緒)，要重建
+    if _profiler is None or _profiler.pid != os.getpid():
+        _profiler = Profiler(process_name)
+    return _profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+@contextmanager
+def stage(name, **args):
+    if _profiler is None:
+        yield
+        return
+    with _profiler.stage(name, **args):
+        yield
+
+
+def profiled(name=None):
+    """
+    Decorator marking a whole function as one stage.
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_profiled(func, *args, **kwargs):
+    """
+    Runs func in a worker process with profiling enabled and returns
+    (result, events).
+    """
+    profiler = enable('worker')
+    result = func(*args, **kwargs)
+    return result, profiler.take_events()
+
+
+def add_events(events):
+    if _profiler is None:
+        return
+    for event in events:
+        if event['ph'] == 'M':
+            _profiler.process_names[event['pid']] = event
+        else:
+            _profiler.events.append(event)
+
+
+def summarize(events):
+    """
+    Aggregates 'X' events per stage name, overall and per policy.
+    """
+    def add(table, event):
+        entry = table.setdefault(event['name'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': 0.0})
+        entry['count'] += 1
+        entry['wall_s'] += event['dur'] / 1e6
+        entry['cpu_s'] += event['args']['cpu_ms'] / 1000
+        entry['peak_rss_mb'] = max(entry['peak_rss_mb'], event['args']['peak_rss_mb'])
+
+    stages = {}
+    policies = {}
+    for event in events:
+        if event['ph'] != 'X':
+            continue
+        add(stages, event)
+        if 'policy' in event['args']:
+            add(policies.setdefault(event['args']['policy'], {}), event)
+
+    for table in [stages] + list(policies.values()):
+        for entry in table.values():
+            entry['wall_s'] = round(entry['wall_s'], 3)
+            entry['cpu_s'] = round(entry['cpu_s'], 3)
+
+    spans = [(event['ts'], event['ts'] + event['dur']) for event in events if event['ph'] == 'X']
+    total = (max(end for _, end in spans) - min(start for start, _ in spans)) / 1e6 if spans else 0.0
+    return {'total_wall_s': round(total, 3), 'stages': stages, 'policies': policies}
+
+
+def write_report(path_prefix):
+    """
+    Writes <path_prefix>.json (summary) and <path_prefix>.trace.json (Chrome
+    trace) and returns both paths. Does nothing when profiling is off.
+    """
+    if _profiler is None:
+        return None
+    _profiler.close()
+    events = list(_profiler.process_names.values()) + _profiler.events
+    os.makedirs(os.path.dirname(os.path.abspath(path_prefix)), exist_ok=True)
+
+    summary_path = path_prefix + '.json'
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summarize(events), f, ensure_ascii=False, indent=1)
+    trace_path = path_prefix + '.trace.json'
+    with open(trace_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    return summary_path, trace_path
@@ -0,0 +1,179 @@
+"""
+Small task-graph scheduler used by deliver.py.
+
+Tasks name the tasks they depend on; arguments given as Result('name')
+are replaced by that task's return value before the task starts. Ready
+tasks go to a shared process pool (at most one per worker, highest
+priority first, so a late high-priority task is not stuck behind a long
+queue), or to a single local thread for tasks that must stay in this
+process. A failed task is reported and its dependents are skipped; the
+rest of the graph keeps running. When a worker process dies (e.g. out of
+memory) the tasks of its pool fail and a new pool takes the remaining
+ones. The result of a task that others depend on is dropped once all of
+them have started or been skipped, so converted images do not stay in
+memory until the end.
+"""
+import traceback
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import profiling
+
+Result = namedtuple('Result', ['name'])
+
+
+class Task:
+    __slots__ = ('name', 'func', 'args', 'kwargs', 'deps', 'local', 'priority', 'order')
+
+    def __init__(self, name, func, args, kwargs, deps, local, priority, order):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.deps = deps
+        self.local = local
+        self.priority = priority
+        self.order = order
+
+
+def _resolve(value, results):
+    if isinstance(value, Result):
+        return results[value.name]
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    return value
+
+
+class TaskGraph:
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, func, *args, deps=(), local=False, priority=0, **kwargs):
+        """
+        Adds a task. Results referenced in args/kwargs (also inside lists)
+        are added to deps automatically.
+        """
+        if name in self.tasks:
+            raise ValueError('重複的工作名稱: {}'.format(name))
+        deps = set(deps)
+        for value in list(args) + list(kwargs.values()):
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, Result):
+                    deps.add(item.name)
+        self.tasks[name] = Task(name, func, args, kwargs, deps, local, priority, len(self.tasks))
+        return Result(name)
+
+    def run(self, workers):
+        """
+        Runs every task and returns (results, failures) where failures maps
+        task names to an error message. results only holds the tasks nothing
+        depends on.
+        """
+        for task in self.tasks.values():
+            missing = task.deps - set(self.tasks)
+            if missing:
+                raise ValueError('{} 依賴不存在的工作: {}'.format(task.name, ', '.join(sorted(missing))))
+
+        results = {}
+        failures = {}
+        waiting = dict(self.tasks)
+        running = {}
+        # 還沒開始的下游工作數量，歸零後就釋放結果
+        dependents = {name: 0 for name in self.tasks}
+        for task in self.tasks.values():
+            for dep in task.deps:
+                dependents[dep] += 1
+        sinks = {name for name, count in dependents.items() if count == 0}
+        finished = set()
+
+        def release(name):
+            # 下游工作開始或被略過都算用掉一次，沒有人再需要時就釋放
+            dependents[name] -= 1
+            if dependents[name] == 0:
+                results.pop(name, None)
+
+        # worker 被系統結束 (例如記憶體不足) 時整個 pool 會壞掉，改用新的 pool 繼續
+        pool = ProcessPoolExecutor(max_workers=workers)
+        pool_futures = set()
+        try:
+            with ThreadPoolExecutor(max_workers=1) as local:
+                while waiting or running:
+                    # 依賴失敗的工作直接略過
+                    for task in list(waiting.values()):
+                        failed = [dep for dep in task.deps if dep in failures]
+                        if failed:
+                            failures[task.name] = '略過，因為 {} 失敗'.format(', '.join(sorted(failed)))
+                            del waiting[task.name]
+                            for dep in task.deps:
+                                release(dep)
+
+                    ready = sorted((task for task in waiting.values() if task.deps <= finished),
+                                   key=lambda task: (-task.priority, task.order))
+                    pool_slots = workers - sum(1 for task in running.values() if not task.local)
+                    for task in ready:
+                        if not task.local and pool_slots <= 0:
+                            continue
+                        args = [_resolve(arg, results) for arg in task.args]
+                        kwargs = {key: _resolve(value, results) for key, value in task.kwargs.items()}
+                        if task.local:
+                            future = local.submit(self._run_local, task, args, kwargs)
+                        else:
+                            pool_slots -= 1
+                            try:
+                                future = self._submit(pool, task, args, kwargs)
+                            except BrokenProcessPool:
+                                pool.shutdown(wait=False)
+                                pool = ProcessPoolExecutor(max_workers=workers)
+                                pool_futures = set()
+                                future = self._submit(pool, task, args, kwargs)
+                            pool_futures.add(future)
+                        running[future] = task
+                        del waiting[task.name]
+                        for dep in task.deps:
+                            release(dep)
+
+                    if not running:
+                        if waiting:
+                            raise ValueError('工作之間有循環依賴: {}'.format(', '.join(sorted(waiting))))
+                        break
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    broken = False
+                    for future in done:
+                        task = running.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            print('工作失敗:', task.name)
+                            traceback.print_exception(type(e), e, e.__traceback__)
+                            failures[task.name] = '{}: {}'.format(type(e).__name__, e)
+                            # 舊 pool 上其他工作的 BrokenProcessPool 不必再換一次 pool
+                            broken = broken or (isinstance(e, BrokenProcessPool) and future in pool_futures)
+                            continue
+                        if not task.local and profiling.enabled():
+                            result, events = result
+                            profiling.add_events(events)
+                        # 下游工作都已被略過時不必保留結果
+                        if dependents[task.name] or task.name in sinks:
+                            results[task.name] = result
+                        finished.add(task.name)
+                    if broken:
+                        pool.shutdown(wait=False)
+                        pool = ProcessPoolExecutor(max_workers=workers)
+                        pool_futures = set()
+        finally:
+            pool.shutdown()
+        return results, failures
+
+    @staticmethod
+    def _submit(pool, task, args, kwargs):
+        if profiling.enabled():
+            return pool.submit(profiling.run_profiled, task.func, *args, **kwargs)
+        return pool.submit(task.func, *args, **kwargs)
+
+    @staticmethod
+    def _run_local(task, args, kwargs):
+        with profiling.stage(task.name):
+            return task.func(*args, **kwargs)
@@ -3,4 +3,5 @@ CALL vars.bat
 CALL %CondaPath%\Scripts\activate
 CALL conda env create -f environment.yml -p %envpath% --force
 CALL conda clean --all -y
+CALL %CondaPath%\Scripts\activate %envpath% & python .\plotting.py
 PAUSE
@@ -0,0 +1,72 @@
+import datetime
+
+
+class BaselinePair:
+    """
+    One line of postprocessing/shortbaseline: an interferogram pair with its
+    spatial baseline (m) and temporal baseline (days).
+    """
+    __slots__ = ('day1', 'day2', 'date1', 'date2', 'distance', 'period')
+
+    def __init__(self, day1, day2, distance, period):
+        self.day1 = day1
+        self.day2 = day2
+        self.date1 = datetime.datetime.strptime(day1, '%Y%m%d').date()
+        self.date2 = datetime.datetime.strptime(day2, '%Y%m%d').date()
+        self.distance = float(distance)
+        self.period = period
+
+    @property
+    def name(self):
+        """
+        The 'day1-day2' prefix used by the interferogram file names.
+        """
+        return self.day1 + '-' + self.day2
+
+    def __repr__(self):
+        return 'BaselinePair({!r}, {!r}, {!r}, {!r})'.format(self.day1, self.day2, self.distance, self.period)
+
+
+class ShortBaseline:
+    """
+    Parsed and validated content of postprocessing/shortbaseline, with the
+    unique sorted acquisition dates precomputed.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.dates = sorted({day for pair in pairs for day in (pair.day1, pair.day2)})
+        self.date_range = (self.dates[0], self.dates[-1]) if self.dates else None
+
+    @classmethod
+    def from_lines(cls, lines, source='shortbaseline'):
+        """
+        Parses tab separated 'day1 day2 distance period' lines. Blank lines
+        are skipped; any other malformed line raises ValueError naming the
+        line number.
+        """
+        pairs = []
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            fields = line.split('\t')
+            try:
+                day1, day2, distance, period = fields
+                pairs.append(BaselinePair(day1.strip(), day2.strip(), distance, period.strip()))
+            except ValueError as e:
+                raise ValueError('{} 第 {} 行格式錯誤: {!r} ({})'.format(source, line_number, line.rstrip('\n'), e)) from e
+        return cls(pairs)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_lines(f, source=path)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+    def __getitem__(self, index):
+        return self.pairs[index]
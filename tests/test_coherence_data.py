@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+import pytest
+
+import coherence_data
+from coherence_data import CoherenceStats, read_coherence
+
+
+def write_pairs(path, before, after):
+    with open(path, 'w') as f:
+        for i, (b, a) in enumerate(zip(before, after)):
+            f.write('{}\t{}\t{:.6f}\t{:.6f}\n'.format(i % 97, i // 97, b, a))
+
+
+def random_pairs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    before = rng.uniform(0.05, 0.95, n).astype(np.float32)
+    after = np.clip(0.8 * before + 0.1 + rng.normal(0, 0.05, n), 0, 1).astype(np.float32)
+    return before, after
+
+
+@pytest.mark.parametrize('chunk_sizes', [[1000], [1, 999], [300, 300, 400], [7] * 142 + [6]])
+def test_stats_match_numpy(chunk_sizes):
+    before, after = random_pairs(sum(chunk_sizes))
+    stats = CoherenceStats()
+    start = 0
+    for size in chunk_sizes:
+        stats.update(before[start:start + size], after[start:start + size])
+        start += size
+
+    before64 = before.astype(np.float64)
+    after64 = after.astype(np.float64)
+    slope, intercept = np.polyfit(before64, after64, 1)
+    assert stats.count == len(before)
+    assert stats.mean_before == pytest.approx(before64.mean(), abs=1e-12)
+    assert stats.mean_after == pytest.approx(after64.mean(), abs=1e-12)
+    assert stats.std_before == pytest.approx(before64.std(), rel=1e-9)
+    assert stats.std_after == pytest.approx(after64.std(), rel=1e-9)
+    assert stats.correlation == pytest.approx(np.corrcoef(before64, after64)[0, 1], rel=1e-9)
+    assert stats.slope == pytest.approx(slope, rel=1e-9)
+    assert stats.intercept == pytest.approx(intercept, rel=1e-9)
+    assert stats.min_before == before.min()
+    assert stats.max_before == before.max()
+
+
+def test_empty_stats():
+    stats = CoherenceStats()
+    stats.update(np.empty(0, np.float32), np.empty(0, np.float32))
+    assert stats.count == 0
+    assert math.isnan(stats.std_before)
+    assert math.isnan(stats.correlation)
+
+
+def test_read_coherence_in_chunks(tmp_path):
+    before, after = random_pairs(1000, seed=1)
+    path = tmp_path / 'ifg_coh_filt_coh_compare'
+    write_pairs(path, before, after)
+
+    read_before, read_after, stats = read_coherence(str(path), chunk_lines=64)
+    np.testing.assert_allclose(read_before, before, atol=1e-6)
+    np.testing.assert_allclose(read_after, after, atol=1e-6)
+    assert stats.count == 1000
+    assert stats.slope == pytest.approx(np.polyfit(read_before.astype(np.float64),
+                                                   read_after.astype(np.float64), 1)[0], rel=1e-9)
+
+
+def test_blank_lines_and_mixed_separators(tmp_path):
+    path = tmp_path / 'ifg_coh_filt_coh_compare'
+    path.write_text('1 2 0.5\t0.6\n\n3 4 0.7 0.8\n5\t6\t0.1 0.2\n')
+    before, after, _ = read_coherence(str(path), chunk_lines=2)
+    assert before.tolist() == pytest.approx([0.5, 0.7, 0.1])
+    assert after.tolist() == pytest.approx([0.6, 0.8, 0.2])
+
+
+@pytest.mark.parametrize('bad_line, line_number', [('7\n', 4), ('7 8 x 0.5\n', 4)])
+def test_bad_line_names_file_and_line(tmp_path, bad_line, line_number):
+    path = tmp_path / 'ifg_coh_filt_coh_compare'
+    path.write_text('1 2 0.5 0.6\n3 4 0.7 0.8\n5 6 0.1 0.2\n' + bad_line + '8 9 1 1\n')
+    with pytest.raises(ValueError, match='第 {} 行'.format(line_number)) as excinfo:
+        list(coherence_data.iter_chunks(str(path), chunk_lines=2))
+    assert str(path) in str(excinfo.value)
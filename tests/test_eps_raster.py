@@ -0,0 +1,164 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+import eps_raster
+from baseline import Policy
+
+
+class FakeEps:
+    """
+    Stands in for Pillow's EpsImageFile so the tests do not need Ghostscript.
+    """
+    opened = []
+
+    def __init__(self, path):
+        self.path = path
+        self.scale = None
+        FakeEps.opened.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def load(self, scale=1):
+        self.scale = scale
+
+    def save(self, path):
+        Image.new('RGB', (4 * self.scale, 3 * self.scale), 'white').save(path, format='PNG')
+
+
+@pytest.fixture
+def fake_ghostscript(monkeypatch):
+    FakeEps.opened = []
+    monkeypatch.setattr(Image, 'open', FakeEps)
+    return FakeEps
+
+
+@pytest.fixture
+def eps(tmp_path):
+    path = tmp_path / 'shortbaseline_plot.eps'
+    path.write_bytes(b'%!PS-Adobe-3.0 EPSF-3.0\n%%BoundingBox: 0 0 4 3\n')
+    return str(path)
+
+
+def test_cache_key_depends_on_content_and_scale(tmp_path, eps):
+    key = eps_raster.cache_key(eps, 3)
+    assert eps_raster.cache_key(eps, 3) == key
+    assert eps_raster.cache_key(eps, 2) != key
+    with open(eps, 'ab') as f:
+        f.write(b'%%EOF\n')
+    assert eps_raster.cache_key(eps, 3) != key
+
+
+def test_miss_rasterizes_and_fills_cache(tmp_path, eps, fake_ghostscript):
+    cache_dir = str(tmp_path / 'eps_cache')
+    png = str(tmp_path / 'shortbaseline_plot.png')
+    assert not eps_raster.fetch_cached(eps, png, 3, cache_dir)
+
+    assert eps_raster.rasterize(eps, png, scale=3, cache_dir=cache_dir) == png
+    assert [opened.scale for opened in fake_ghostscript.opened] == [3]
+    with open(png, 'rb') as f:
+        assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+    assert os.listdir(cache_dir) == [eps_raster.cache_key(eps, 3) + '.png']
+
+
+def test_hit_skips_ghostscript_and_keeps_png_mtime(tmp_path, eps, fake_ghostscript):
+    cache_dir = str(tmp_path / 'eps_cache')
+    png = str(tmp_path / 'shortbaseline_plot.png')
+    eps_raster.rasterize(eps, png, scale=3, cache_dir=cache_dir)
+    os.utime(png, ns=(0, 10 ** 9))
+
+    assert eps_raster.rasterize(eps, png, scale=3, cache_dir=cache_dir) == png
+    assert len(fake_ghostscript.opened) == 1
+    # 內容相同時不重寫
+    assert os.stat(png).st_mtime_ns == 10 ** 9
+
+    os.remove(png)
+    assert eps_raster.fetch_cached(eps, png, 3, cache_dir)
+    assert os.path.isfile(png)
+
+
+def test_new_content_replaces_old_cache_entry(tmp_path, eps, fake_ghostscript):
+    cache_dir = str(tmp_path / 'eps_cache')
+    png = str(tmp_path / 'shortbaseline_plot.png')
+    eps_raster.rasterize(eps, png, scale=3, cache_dir=cache_dir)
+    with open(eps, 'ab') as f:
+        f.write(b'%%EOF\n')
+    eps_raster.rasterize(eps, png, scale=3, cache_dir=cache_dir)
+    assert len(fake_ghostscript.opened) == 2
+    assert os.listdir(cache_dir) == [eps_raster.cache_key(eps, 3) + '.png']
+
+
+def test_start_rasterize_hit_runs_no_process(tmp_path, eps, fake_ghostscript, monkeypatch):
+    cache_dir = str(tmp_path / 'eps_cache')
+    png = str(tmp_path / 'shortbaseline_plot.png')
+    eps_raster.rasterize(eps, png, scale=3, cache_dir=cache_dir)
+    os.remove(png)
+
+    def no_popen(*args, **kwargs):
+        raise AssertionError('快取命中時不應啟動程序')
+    monkeypatch.setattr(subprocess, 'Popen', no_popen)
+    assert eps_raster.start_rasterize(eps, png, scale=3, cache_dir=cache_dir) is None
+    assert os.path.isfile(png)
+
+
+def sleeper():
+    return subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+
+
+def make_policy(tmp_path):
+    policy = Policy.__new__(Policy)
+    policy.policy_dir = str(tmp_path)
+    policy.eps_cache_dir = str(tmp_path / 'eps_cache')
+    policy._eps_process = None
+    policy._eps_started = False
+    return policy
+
+
+def test_stop_terminates_running_process(tmp_path):
+    policy = make_policy(tmp_path)
+    process = sleeper()
+    policy._eps_process = process
+    policy._eps_started = True
+
+    policy.stop_eps_rasterization()
+    assert process.poll() is not None
+    assert policy._eps_process is None
+    assert not policy._eps_started
+    # 再呼叫一次不會出錯
+    policy.stop_eps_rasterization()
+
+
+def test_failed_build_stops_background_rasterization(tmp_path, monkeypatch):
+    policy = make_policy(tmp_path)
+    started = []
+
+    def start_rasterize(*args, **kwargs):
+        started.append(sleeper())
+        return started[-1]
+
+    def fail(*args, **kwargs):
+        raise OSError('影像轉檔失敗')
+
+    monkeypatch.setattr(eps_raster, 'start_rasterize', start_rasterize)
+    monkeypatch.setattr(policy, '_preprocess_image_batches', fail, raising=False)
+    with pytest.raises(OSError):
+        policy.build_document()
+    assert len(started) == 1
+    assert started[0].poll() is not None
+    assert policy._eps_process is None
+
+
+def test_export_reports_failed_background_process(tmp_path):
+    policy = make_policy(tmp_path)
+    policy._eps_process = subprocess.Popen([sys.executable, '-c', 'import sys; sys.exit(1)'])
+    policy._eps_started = True
+    with pytest.raises(RuntimeError):
+        policy.export_eps_to_png()
+    assert policy._eps_process is None
@@ -0,0 +1,73 @@
+import os
+from copy import deepcopy
+
+import pytest
+from docx.oxml.ns import qn
+from lxml import etree
+
+import utils
+from baseline import Policy
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'baseline.docx')
+ANCHOR = 'years之干涉圖'
+
+
+def duplicate_required_tables_previous(document, table_num, anchor_text):
+    """
+    The implementation duplicate_required_tables used before the prototype
+    generator.
+    """
+    all_body_elements = document.element.body[:]
+    start_index = -1
+    for p in document.paragraphs:
+        if anchor_text in p.text:
+            start_index = all_body_elements.index(p._p)
+            break
+    elements_to_duplicate = all_body_elements[start_index:]
+    for _ in range(table_num):
+        for element in elements_to_duplicate:
+            document.element.body.append(deepcopy(element))
+
+
+def make_policy():
+    policy = Policy.__new__(Policy)
+    policy.document = utils.load_template(TEMPLATE)
+    return policy
+
+
+@pytest.mark.parametrize('table_num', [1, 2, 16])
+def test_same_xml_as_previous_implementation(table_num):
+    policy = make_policy()
+    policy.duplicate_required_tables(table_num, ANCHOR)
+    policy.document.add_page_break()
+
+    previous = utils.load_template(TEMPLATE)
+    duplicate_required_tables_previous(previous, table_num, ANCHOR)
+    previous.add_page_break()
+
+    assert etree.tostring(policy.document.element.body) == etree.tostring(previous.element.body)
+    assert len(policy.document.tables) == 3 + table_num
+
+
+def test_copies_are_independent():
+    policy = make_policy()
+    policy.duplicate_required_tables(2, ANCHOR)
+    tables = policy.document.tables
+    tables[3].cell(0, 0).text = 'changed'
+    assert tables[4].cell(0, 0).text != 'changed'
+
+
+def test_missing_anchor_leaves_document_unchanged(capsys):
+    policy = make_policy()
+    before = etree.tostring(policy.document.element.body)
+    policy.duplicate_required_tables(3, '不存在的標題')
+    assert etree.tostring(policy.document.element.body) == before
+    assert '不存在的標題' in capsys.readouterr().out
+
+
+def test_zero_tables():
+    policy = make_policy()
+    before = etree.tostring(policy.document.element.body)
+    policy.duplicate_required_tables(0, ANCHOR)
+    assert etree.tostring(policy.document.element.body) == before
+    assert policy.document.element.body[-1].tag == qn('w:sectPr')
@@ -0,0 +1,144 @@
+import io
+
+import pytest
+from PIL import Image
+
+import imaging
+
+BIT_DEPTHS = {'1': 1, 'L': 8, 'P': 8, 'RGB': 24, 'RGBA': 32}
+
+
+def make_image(mode, size=(37, 21)):
+    gradient = Image.linear_gradient('L').resize(size)
+    if mode in ('1', 'L'):
+        return gradient.convert(mode)
+    if mode == 'P':
+        return Image.merge('RGB', [gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), gradient]).quantize(16)
+    return Image.merge(mode, [gradient] * len(mode))
+
+
+def saved(img, fmt, **params):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **params)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize('fmt, mode, params', [
+    ('BMP', 'RGB', {}),
+    ('BMP', 'P', {}),
+    ('BMP', 'L', {'dpi': (150, 150)}),
+    ('PNG', 'RGB', {}),
+    ('PNG', 'RGBA', {'dpi': (300, 300)}),
+    ('PNG', 'P', {'dpi': (72, 96)}),
+    ('PNG', 'L', {}),
+    ('TIFF', 'RGB', {}),
+    ('TIFF', 'RGB', {'compression': 'tiff_lzw', 'dpi': (150, 150)}),
+    ('TIFF', 'L', {'compression': 'tiff_adobe_deflate'}),
+    ('TIFF', 'P', {'dpi': (200, 100)}),
+    ('TIFF', '1', {}),
+])
+def test_probe_matches_pillow(fmt, mode, params):
+    buffer = saved(make_image(mode), fmt, **params)
+    info = imaging.probe_image_header(buffer)
+
+    with Image.open(saved(make_image(mode), fmt, **params)) as img:
+        assert info.format == img.format
+        assert (info.width, info.height) == img.size
+        if img.mode == 'P':
+            # 調色盤影像 Pillow 可能存成 1、2、4 或 8 位元
+            assert info.bit_depth <= 8
+        else:
+            assert info.bit_depth == BIT_DEPTHS[img.mode]
+        # BMP 8 位元以下一律帶色盤，灰階的 Pillow 會開成 L
+        assert info.palette == (img.mode == 'P' or (fmt == 'BMP' and info.bit_depth <= 8))
+        dpi = img.info.get('dpi')
+        if dpi is None or (fmt == 'TIFF' and 'dpi' not in params):
+            # 沒有解析度標籤的 TIFF，Pillow 會回報 (1, 1)
+            assert info.dpi is None
+        else:
+            assert info.dpi == tuple(int(round(value)) for value in dpi)
+
+
+def test_probe_reads_only_the_header():
+    data = saved(make_image('RGB', (4000, 3000)), 'PNG').getvalue()
+    # 像素資料截掉一半，標頭仍然讀得到
+    info = imaging.probe_image_header(io.BytesIO(data[:len(data) // 2]))
+    assert (info.width, info.height) == (4000, 3000)
+
+
+@pytest.mark.parametrize('data', [b'', b'GIF89a', b'BM\x00\x00', b'\x89PNG\r\n\x1a\n'])
+def test_probe_unknown_or_truncated(data):
+    info = imaging.probe_image_header(io.BytesIO(data))
+    assert info is None or (info.width, info.height) == (0, 0)
+
+
+def test_metadata_index_probes_once(tmp_path):
+    path = tmp_path / 'a.png'
+    make_image('RGB').save(path)
+    stat = path.stat()
+    index_path = tmp_path / 'tmp' / 'image_metadata.json'
+
+    index = imaging.ImageMetadataIndex(str(index_path))
+    info = index.lookup(str(path), stat.st_size, stat.st_mtime_ns)
+    index.save()
+    assert (info.width, info.height) == (37, 21)
+
+    # 同樣的大小與 mtime 直接用索引裡的紀錄，不再讀檔
+    path.write_bytes(b'')
+    reloaded = imaging.ImageMetadataIndex(str(index_path))
+    assert reloaded.lookup(str(path), stat.st_size, stat.st_mtime_ns) == info
+
+
+@pytest.mark.parametrize('compression, params', [
+    ('raw', {}),
+    ('raw', {'tiffinfo': {278: 50}}),
+    ('tiff_lzw', {}),
+    ('tiff_lzw', {'tiffinfo': {317: 2}}),
+    ('tiff_adobe_deflate', {}),
+    ('packbits', {}),
+])
+@pytest.mark.parametrize('mode', ['L', 'RGB'])
+def test_windowed_decode_matches_full_decode(tmp_path, compression, params, mode):
+    img = make_image(mode, (611, 1237))
+    path = str(tmp_path / 'big.tif')
+    img.save(path, compression=compression, **params)
+
+    with imaging.open_image(path) as opened:
+        assert imaging._can_decode_windowed(opened)
+    # 記憶體上限只夠幾十列，一定會分成很多段
+    reduced = imaging._decode_windowed(path, 0, 3, 50000)
+    expected = img.reduce(3)
+    assert reduced.size == expected.size
+    assert reduced.tobytes() == expected.tobytes()
+
+
+def test_resize_within_budget_logs_full_decode(tmp_path, caplog):
+    path = str(tmp_path / 'big.png')
+    make_image('RGB', (600, 300)).save(path)
+    with imaging.open_image(path) as img:
+        resized = imaging.resize_within_budget(img, path, (60, 30), memory_budget=1000)
+    assert resized.size == (60, 30)
+    assert path in caplog.text
+
+
+def test_single_strip_raw_tiff_is_cut_into_bands(tmp_path):
+    path = str(tmp_path / 'one-strip.tif')
+    make_image('RGB', (611, 1237)).save(path)
+    with imaging.open_image(path) as img:
+        assert len(img.tile) == 1
+        assert imaging._single_strip_row_bytes(img) == 611 * 3
+
+
+def test_strip_tiff_offsets_point_at_strips():
+    # 不經過 Pillow 存檔，各版 Pillow 讀到的都是同一個檔案
+    data = [bytes([i]) * (10 + i) for i in range(40)]
+    blob = imaging._strip_tiff({256: 7, 258: (8,), 259: 5, 262: 1, 277: 1}, 80, 2, data)
+    f = io.BytesIO(blob)
+    info = imaging.probe_image_header(f)
+    assert (info.width, info.height, info.bit_depth) == (7, 80, 8)
+    with Image.open(io.BytesIO(blob)) as img:
+        offsets = img.tag_v2[273]
+        byte_counts = img.tag_v2[279]
+        assert img.tag_v2[278] == 2
+    assert [blob[offset:offset + count] for offset, count in zip(offsets, byte_counts)] == data
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+import baseline
+import manifest
+from policy_files import PolicyFiles
+
+SETTINGS = {'dpi': 150, 'patterns': ('*.bmp', '*.tif')}
+
+
+@pytest.fixture
+def built(tmp_path):
+    inputs = []
+    for name, content in (('shortbaseline', b'20200101 20200113\n'), ('a.bmp', b'BM' + b'x' * 100)):
+        path = tmp_path / name
+        path.write_bytes(content)
+        inputs.append(str(path))
+    output = tmp_path / 'baseline-1.docx'
+    output.write_bytes(b'docx')
+    manifest.write_manifest(str(output), inputs, SETTINGS)
+    return str(output), inputs
+
+
+def touch(path, delta_ns=10 ** 9):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + delta_ns))
+
+
+def test_unchanged_is_up_to_date(built):
+    output, inputs = built
+    assert manifest.is_up_to_date(output, inputs, SETTINGS)
+    # tuple 與 list 經過 JSON 後相同
+    assert manifest.is_up_to_date(output, inputs, dict(SETTINGS, patterns=['*.bmp', '*.tif']))
+
+
+def test_missing_output_or_manifest(built):
+    output, inputs = built
+    os.remove(manifest.manifest_path(output))
+    assert not manifest.is_up_to_date(output, inputs, SETTINGS)
+    manifest.write_manifest(output, inputs, SETTINGS)
+    os.remove(output)
+    assert not manifest.is_up_to_date(output, inputs, SETTINGS)
+
+
+def test_settings_or_input_list_changed(built):
+    output, inputs = built
+    assert not manifest.is_up_to_date(output, inputs, dict(SETTINGS, dpi=300))
+    assert not manifest.is_up_to_date(output, inputs[:1], SETTINGS)
+
+
+def test_content_changed(built):
+    output, inputs = built
+    with open(inputs[1], 'r+b') as f:
+        f.write(b'MB')
+    touch(inputs[1])
+    assert not manifest.is_up_to_date(output, inputs, SETTINGS)
+
+
+def test_size_changed(built):
+    output, inputs = built
+    with open(inputs[0], 'ab') as f:
+        f.write(b'20200125\n')
+    assert not manifest.is_up_to_date(output, inputs, SETTINGS)
+
+
+def test_input_removed(built):
+    output, inputs = built
+    os.remove(inputs[0])
+    assert not manifest.is_up_to_date(output, inputs, SETTINGS)
+
+
+def test_only_mtime_changed_is_up_to_date(built):
+    output, inputs = built
+    touch(inputs[1])
+    assert manifest.is_up_to_date(output, inputs, SETTINGS)
+
+
+def test_only_mtime_changed_above_hash_limit(built, monkeypatch):
+    output, inputs = built
+    monkeypatch.setattr(manifest, 'HASH_LIMIT', 10)
+    manifest.write_manifest(output, inputs, SETTINGS)
+    # 大檔沒有 SHA1 可比，只能當作改過
+    touch(inputs[1])
+    assert not manifest.is_up_to_date(output, inputs, SETTINGS)
+
+
+def test_version_change(built, monkeypatch):
+    output, inputs = built
+    monkeypatch.setattr(manifest, 'MANIFEST_VERSION', manifest.MANIFEST_VERSION + 1)
+    assert not manifest.is_up_to_date(output, inputs, SETTINGS)
+
+
+def test_known_stats_from_policy_files(built, tmp_path):
+    output, inputs = built
+    files = PolicyFiles(str(tmp_path))
+    stats = manifest.known_stats([files.get('shortbaseline'), files.get('a.bmp')])
+    assert manifest.is_up_to_date(output, inputs, SETTINGS, stats)
+
+
+def test_baseline_partial_rebuilt_when_memory_budget_changes(tmp_path, monkeypatch):
+    policy_dir = tmp_path / 'Policy1'
+    policy_dir.mkdir()
+    (policy_dir / 'shortbaseline').write_bytes(b'20200101\t20200113\t35.2\t12\n')
+    # 範本路徑是 Windows 的寫法，這裡只看 shortbaseline
+    monkeypatch.setattr(baseline, 'partial_docx_inputs',
+                        lambda files: ([str(policy_dir / 'shortbaseline')], {}))
+    built = []
+
+    class FakePolicy:
+        def __init__(self, **kwargs):
+            built.append(kwargs.get('memory_budget'))
+
+        def export_parital_docx(self, add_page_break=True):
+            path = os.path.join(str(policy_dir), 'tmp', 'baseline-1.docx')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'docx')
+            return path
+
+    monkeypatch.setattr(baseline, 'Policy', FakePolicy)
+    for memory_budget in (None, None, 64 * 1024 * 1024, 64 * 1024 * 1024):
+        kwargs = {} if memory_budget is None else {'memory_budget': memory_budget}
+        baseline.build_partial_docx(str(policy_dir), 1, False, incremental=True, **kwargs)
+    assert built == [None, 64 * 1024 * 1024]
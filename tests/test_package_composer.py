@@ -0,0 +1,92 @@
+import io
+import os
+import posixpath
+import zipfile
+
+from docx.shared import Cm
+from lxml import etree
+from PIL import Image
+
+import utils
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'baseline.docx')
+
+R_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NAMESPACES = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 10), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def make_partial(title, colors):
+    document = utils.load_template(TEMPLATE)
+    body = document.element.body
+    for element in list(body):
+        if element is not body.sectPr:
+            body.remove(element)
+    document.add_paragraph(title)
+    for color in colors:
+        document.add_paragraph().add_run().add_picture(io.BytesIO(png(color)), width=Cm(2))
+    return document
+
+
+def compose(tmp_path, partials):
+    composer = utils.PackageComposer(TEMPLATE)
+    for partial in partials:
+        composer.append(partial)
+    path = str(tmp_path / 'out.docx')
+    composer.save(path)
+    return path
+
+
+def read_package(path):
+    with zipfile.ZipFile(path) as package:
+        names = set(package.namelist())
+        document = etree.fromstring(package.read('word/document.xml'))
+        rels = etree.fromstring(package.read('word/_rels/document.xml.rels'))
+        media = [package.read(name) for name in names if name.startswith('word/media/')]
+    targets = {rel.get('Id'): rel for rel in rels.findall('rel:Relationship', NAMESPACES)}
+    return names, document, targets, media
+
+
+def test_every_reference_resolves(tmp_path):
+    partials = [make_partial('第 {} 組'.format(i), ['red', 'blue', 'red']) for i in range(3)]
+    path = compose(tmp_path, partials)
+    names, document, targets, _ = read_package(path)
+
+    references = [value for node in document.iter() for name, value in node.attrib.items()
+                  if name.startswith('{%s}' % R_NAMESPACE)]
+    assert len(references) >= 9
+    for rId in references:
+        rel = targets[rId]
+        if rel.get('TargetMode') != 'External':
+            assert posixpath.normpath(posixpath.join('word', rel.get('Target'))) in names
+
+
+def test_docpr_ids_unique(tmp_path):
+    partials = [make_partial('第 {} 組'.format(i), ['red', 'green']) for i in range(4)]
+    _, document, _, _ = read_package(compose(tmp_path, partials))
+    ids = document.xpath('//wp:docPr/@id', namespaces=NAMESPACES)
+    assert len(ids) == 8
+    assert len(set(ids)) == len(ids)
+
+
+def test_identical_media_stored_once(tmp_path):
+    partials = [make_partial('a', ['red', 'blue']), make_partial('b', ['blue', 'red', 'white'])]
+    _, _, _, media = read_package(compose(tmp_path, partials))
+    assert sorted(media) == sorted({png('red'), png('blue'), png('white')})
+
+
+def test_bodies_in_order_and_inputs_untouched(tmp_path):
+    partials = [make_partial('第 {} 組'.format(i), ['red']) for i in range(3)]
+    _, document, _, _ = read_package(compose(tmp_path, partials))
+    texts = [text for text in document.xpath('//w:t/text()', namespaces=NAMESPACES) if text.startswith('第')]
+    assert texts == ['第 0 組', '第 1 組', '第 2 組']
+    assert all(len(partial.inline_shapes) == 1 for partial in partials)
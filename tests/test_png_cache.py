@@ -0,0 +1,98 @@
+import itertools
+import os
+import types
+
+import pytest
+
+import baseline
+import png_cache
+from png_cache import ConversionCache
+from policy_files import PolicyFiles
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # 每次取時間都前進一秒，讓最近使用的順序固定
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(png_cache, 'time', types.SimpleNamespace(time=lambda: next(ticks)))
+
+
+def test_make_key_follows_source_and_params(tmp_path):
+    source = tmp_path / 'a.bmp'
+    source.write_bytes(b'x' * 10)
+    key = ConversionCache.make_key(str(source), height=3.8)
+    assert key == ConversionCache.make_key(str(source), height=3.8)
+    assert key != ConversionCache.make_key(str(source), height=4.0)
+
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert key != ConversionCache.make_key(str(source), height=3.8)
+
+
+def test_thumbnail_key_follows_memory_budget(tmp_path):
+    (tmp_path / 'a.bmp').write_bytes(b'x' * 10)
+    entry = PolicyFiles(str(tmp_path)).get('a.bmp')
+    key = baseline.thumbnail_cache_key(entry)
+    assert key == baseline.thumbnail_cache_key(entry, baseline.imaging.DEFAULT_MEMORY_BUDGET)
+    # 預算不同時大圖會以不同的縮小倍率讀取
+    assert key != baseline.thumbnail_cache_key(entry, 64 * 1024 * 1024)
+
+def test_read_write_and_persist(tmp_path, clock):
+    cache_dir = str(tmp_path / 'cache')
+    cache = ConversionCache(cache_dir)
+    assert cache.read('a') is None
+    cache.write('a', b'png-a')
+    assert 'a' in cache
+    assert cache.read('a') == b'png-a'
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.save()
+
+    reopened = ConversionCache(cache_dir)
+    assert reopened.read('a') == b'png-a'
+
+
+def test_missing_file_is_a_miss(tmp_path, clock):
+    cache = ConversionCache(str(tmp_path))
+    cache.write('a', b'png-a')
+    os.remove(cache._entry_path('a'))
+    assert 'a' not in cache
+    assert cache.read('a') is None
+
+
+def test_evicts_least_recently_used(tmp_path, clock):
+    cache = ConversionCache(str(tmp_path), max_bytes=20)
+    for key in 'abc':
+        cache.write(key, b'x' * 8)
+    # 讀過的 a 變成最近使用，最久沒用的 b 先被移除
+    cache.read('a')
+    cache.save()
+    assert 'b' not in cache
+    assert not os.path.exists(cache._entry_path('b'))
+    assert 'a' in cache and 'c' in cache
+
+    reopened = ConversionCache(str(tmp_path), max_bytes=20)
+    assert 'b' not in reopened and 'a' in reopened and 'c' in reopened
+
+
+def test_purge(tmp_path, clock):
+    cache_dir = str(tmp_path / 'cache')
+    cache = ConversionCache(cache_dir)
+    cache.write('a', b'png-a')
+    cache.save()
+    cache.purge()
+    assert 'a' not in cache
+    assert not os.path.exists(cache_dir)
+
+
+def test_version_change_drops_entries(tmp_path, clock, monkeypatch):
+    cache = ConversionCache(str(tmp_path))
+    cache.write('a', b'png-a')
+    cache.save()
+    monkeypatch.setattr(png_cache, 'CACHE_VERSION', png_cache.CACHE_VERSION + 1)
+    assert 'a' not in ConversionCache(str(tmp_path))
+
+
+def test_corrupt_index_is_empty(tmp_path):
+    (tmp_path / 'index.json').write_text('{not json')
+    cache = ConversionCache(str(tmp_path))
+    assert 'a' not in cache
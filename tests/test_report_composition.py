@@ -0,0 +1,93 @@
+import importlib.util
+import os
+import zipfile
+
+import pytest
+from PIL import Image
+
+import coherence
+import coregistration
+import utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENGINES = ['package', pytest.param('composer', marks=pytest.mark.skipif(
+    importlib.util.find_spec('docxcompose') is None, reason='需要 docxcompose'))]
+
+
+@pytest.fixture(autouse=True)
+def templates(monkeypatch):
+    # 範本路徑寫成 Windows 的 templates\\*.docx
+    load_template = utils.load_template
+    monkeypatch.setattr(utils, 'load_template', lambda path: load_template(path.replace('\\', os.sep)))
+    monkeypatch.chdir(ROOT)
+
+
+def make_charts(tmp_path, count):
+    paths = []
+    for index in range(count):
+        path = str(tmp_path / 'chart-{}.png'.format(index))
+        Image.new('RGB', (30, 20), (index * 20 % 256, 80, 160)).save(path)
+        paths.append(path)
+    return paths
+
+
+def export_via_partials(module, prefix, img_paths, group_size, output_path, engine, tmp_dir):
+    """
+    The flow before the in-memory composition: every page group is saved to
+    tmp/<prefix>-N.docx and the files are concatenated.
+    """
+    os.makedirs(tmp_dir, exist_ok=True)
+    doc_paths = []
+    for doc_index, doc in enumerate(module.build_documents(utils.group_items(img_paths, group_size))):
+        doc_path = os.path.join(tmp_dir, '{}-{}.docx'.format(prefix, doc_index))
+        doc.save(doc_path)
+        doc_paths.append(doc_path)
+    utils.concatenate_docx(doc_paths, output_path, engine=engine)
+    return doc_paths
+
+
+def read_parts(path):
+    with zipfile.ZipFile(path) as package:
+        return {name: package.read(name) for name in package.namelist()}
+
+
+def assert_same_package(path, expected_path):
+    parts = read_parts(path)
+    expected = read_parts(expected_path)
+    assert sorted(parts) == sorted(expected)
+    for name in expected:
+        assert parts[name] == expected[name], name
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('count', [1, 5, 13])
+def test_coherence_matches_partials_output(tmp_path, engine, count):
+    img_paths = make_charts(tmp_path, count)
+    expected = str(tmp_path / 'expected.docx')
+    old_partials = export_via_partials(coherence, 'coherence', img_paths, 6, expected, engine, str(tmp_path / 'tmp'))
+
+    output = str(tmp_path / 'coherence.docx')
+    charts = [coherence.CoherenceChart(path, None) for path in img_paths] + [None]
+    coherence.export_report(charts, output, engine=engine, partials_dir=str(tmp_path / 'partials'))
+    assert_same_package(output, expected)
+
+    # --keep-partials 留下的檔案與以前的中間檔相同
+    partials = sorted(os.listdir(str(tmp_path / 'partials')))
+    assert partials == sorted(os.path.basename(path) for path in old_partials)
+    for name in partials:
+        new = read_parts(str(tmp_path / 'partials' / name))
+        old = read_parts(str(tmp_path / 'tmp' / name))
+        assert new['word/document.xml'] == old['word/document.xml']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('count', [1, 2, 5])
+def test_coregistration_matches_partials_output(tmp_path, engine, count):
+    img_paths = make_charts(tmp_path, count)
+    expected = str(tmp_path / 'expected.docx')
+    export_via_partials(coregistration, 'coregistration', img_paths, 2, expected, engine, str(tmp_path / 'tmp'))
+
+    output = str(tmp_path / 'coregistration.docx')
+    coregistration.export_report(img_paths + [None], output, engine=engine)
+    assert_same_package(output, expected)
@@ -0,0 +1,135 @@
+import os
+
+import pytest
+
+from scheduler import Result, TaskGraph
+
+
+def value(x):
+    return x
+
+
+def add(*values):
+    return sum(values)
+
+
+def total(values):
+    return sum(values)
+
+
+def fail(message):
+    raise RuntimeError(message)
+
+
+def die():
+    # 模擬 worker 因記憶體不足被系統結束
+    os._exit(1)
+
+
+def record(log_path, name):
+    with open(log_path, 'a') as f:
+        f.write(name + '\n')
+    return name
+
+
+def test_results_are_passed_to_dependents():
+    graph = TaskGraph()
+    a = graph.add('a', value, 1)
+    b = graph.add('b', value, 2)
+    graph.add('sum', add, a, b, 3)
+    graph.add('list', total, [a, b])
+    results, failures = graph.run(2)
+    assert failures == {}
+    assert results == {'sum': 6, 'list': 3}
+
+
+def test_explicit_deps_and_local_tasks():
+    graph = TaskGraph()
+    graph.add('a', value, 1)
+    graph.add('b', value, 2, deps=['a'], local=True)
+    results, failures = graph.run(1)
+    assert failures == {}
+    assert results == {'b': 2}
+
+
+def test_failure_skips_dependents_only(capsys):
+    graph = TaskGraph()
+    a = graph.add('a', value, 1)
+    b = graph.add('b', fail, 'boom')
+    c = graph.add('c', add, a, b)
+    graph.add('d', add, c)
+    graph.add('e', add, a)
+    results, failures = graph.run(2)
+    assert results == {'e': 1}
+    assert failures['b'] == 'RuntimeError: boom'
+    assert failures['c'] == '略過，因為 b 失敗'
+    assert failures['d'] == '略過，因為 c 失敗'
+    assert '工作失敗: b' in capsys.readouterr().out
+
+
+def test_results_used_only_by_skipped_tasks_are_released():
+    graph = TaskGraph()
+    a = graph.add('a', value, 1)
+    b = graph.add('b', fail, 'boom')
+    graph.add('c', add, a, b)
+    results, failures = graph.run(2)
+    assert results == {}
+    assert set(failures) == {'b', 'c'}
+
+
+def test_dead_worker_fails_its_task_and_the_rest_keeps_running():
+    graph = TaskGraph()
+    dead = graph.add('dead', die)
+    graph.add('after_dead', value, dead)
+    a = graph.add('a', value, 1, priority=-1)
+    graph.add('b', add, a, 1, priority=-1)
+    results, failures = graph.run(1)
+    assert results == {'b': 2}
+    assert failures['dead'].startswith('BrokenProcessPool')
+    assert failures['after_dead'] == '略過，因為 dead 失敗'
+
+
+def test_cycle_is_reported():
+    graph = TaskGraph()
+    graph.add('a', value, Result('b'))
+    graph.add('b', value, Result('a'))
+    with pytest.raises(ValueError, match='循環依賴'):
+        graph.run(1)
+
+
+def test_unknown_and_duplicate_tasks():
+    graph = TaskGraph()
+    graph.add('a', value, Result('missing'))
+    with pytest.raises(ValueError, match='不存在的工作'):
+        graph.run(1)
+    with pytest.raises(ValueError, match='重複的工作名稱'):
+        graph.add('a', value, 1)
+
+
+def test_priority_then_insertion_order(tmp_path):
+    log_path = str(tmp_path / 'order.txt')
+    graph = TaskGraph()
+    graph.add('low', record, log_path, 'low', priority=1)
+    graph.add('high', record, log_path, 'high', priority=3)
+    graph.add('middle-1', record, log_path, 'middle-1', priority=2)
+    graph.add('middle-2', record, log_path, 'middle-2', priority=2)
+    graph.run(1)
+    with open(log_path) as f:
+        assert f.read().split() == ['high', 'middle-1', 'middle-2', 'low']
+
+
+def test_store_thumbnails_skips_failed_images(tmp_path):
+    import baseline
+    import deliver
+    from imaging import EncodedImage
+    from png_cache import ConversionCache
+
+    policy_dir = str(tmp_path)
+    chunks = [[(EncodedImage('a.png', b'png-a', 1, 1, 150), None), (None, 'OSError: 壞檔')],
+              [(EncodedImage('c.png', b'png-c', 1, 1, 150), None)]]
+    assert deliver.store_thumbnails(policy_dir, ['a', 'b', 'c'], 1024 * 1024, *chunks) == 3
+
+    cache = ConversionCache(baseline.conversion_cache_dir(policy_dir))
+    assert cache.read('a') == b'png-a'
+    assert 'b' not in cache
+    assert cache.read('c') == b'png-c'
@@ -0,0 +1,60 @@
+import datetime
+
+import pytest
+
+from shortbaseline import ShortBaseline
+
+LINES = [
+    '20200113\t20200125\t35.2\t12\n',
+    '20200101\t20200113\t-12.5\t12\n',
+    '\n',
+    '20200101\t20200125\t22.7\t24\n',
+]
+
+
+def test_parses_pairs_in_file_order():
+    shortbaseline = ShortBaseline.from_lines(LINES)
+    assert len(shortbaseline) == 3
+    assert [pair.name for pair in shortbaseline] == ['20200113-20200125', '20200101-20200113', '20200101-20200125']
+    pair = shortbaseline[1]
+    assert (pair.day1, pair.day2, pair.distance, pair.period) == ('20200101', '20200113', -12.5, '12')
+    assert pair.date1 == datetime.date(2020, 1, 1)
+    assert pair.date2 == datetime.date(2020, 1, 13)
+
+
+def test_unique_sorted_dates_and_range():
+    shortbaseline = ShortBaseline.from_lines(LINES)
+    assert shortbaseline.dates == ['20200101', '20200113', '20200125']
+    assert shortbaseline.date_range == ('20200101', '20200125')
+
+
+def test_load_from_file(tmp_path):
+    path = tmp_path / 'shortbaseline'
+    path.write_text(''.join(LINES))
+    shortbaseline = ShortBaseline.load(str(path))
+    assert [pair.name for pair in shortbaseline] == [pair.name for pair in ShortBaseline.from_lines(LINES)]
+
+
+def test_empty_file():
+    shortbaseline = ShortBaseline.from_lines(['\n'])
+    assert len(shortbaseline) == 0
+    assert shortbaseline.dates == []
+    assert shortbaseline.date_range is None
+
+
+@pytest.mark.parametrize('line', [
+    '20200101\t20200113\t35.2\n',             # 欄位不足
+    '20200101\t20200113\t35.2\t12\textra\n',  # 欄位過多
+    '20200101 20200113 35.2 12\n',            # 不是 tab 分隔
+    '2020-01-01\t20200113\t35.2\t12\n',       # 日期格式
+    '20200101\t20200113\tfar\t12\n',          # 距離不是數字
+])
+def test_malformed_line_names_the_line(tmp_path, line):
+    path = tmp_path / 'shortbaseline'
+    path.write_text(LINES[0] + line)
+    with pytest.raises(ValueError) as excinfo:
+        ShortBaseline.load(str(path))
+    message = str(excinfo.value)
+    assert str(path) in message
+    assert '第 2 行' in message
+    assert repr(line.rstrip('\n')) in message
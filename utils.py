@@ -1,12 +1,411 @@
+import hashlib
+import io
+import os
 import pathlib
+import zipfile
+
+import profiling
+
+# 本身已壓縮過的影像，再 deflate 一次幾乎不會變小
+STORED_MEDIA_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# 每個 process 只讀一次範本，之後從記憶體中的內容產生新的 Document
+_template_blobs = {}
+
+
+def load_template(template_path):
+    """
+    Returns a new Document built from template_path. The file is read once
+    per process and every call returns an independent copy, so callers may
+    edit the result freely.
+    """
+    from docx import Document
+
+    key = os.path.normcase(os.path.abspath(template_path))
+    blob = _template_blobs.get(key)
+    if blob is None:
+        with open(template_path, 'rb') as f:
+            blob = f.read()
+        _template_blobs[key] = blob
+    return Document(io.BytesIO(blob))
+
+
+def add_encoded_picture(run, encoded, width=None, height=None):
+    """
+    Adds an in-memory PNG (imaging.EncodedImage) to run, like run.add_picture,
+    but builds the image part from the known pixel size and DPI instead of
+    parsing the image header again.
+    """
+    from docx.image.image import Image as DocxImage
+    from docx.image.png import Png
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+    from docx.oxml.shape import CT_Inline
+    from docx.shape import InlineShape
+
+    image = DocxImage(encoded.blob, encoded.filename,
+                      Png(encoded.px_width, encoded.px_height, encoded.dpi, encoded.dpi))
+
+    # 與 python-docx 相同以 SHA1 去除重複的影像
+    story_part = run.part
+    image_parts = story_part.package.image_parts
+    image_part = image_parts._get_by_sha1(image.sha1)
+    if image_part is None:
+        image_part = image_parts._add_image_part(image)
+    rId = story_part.relate_to(image_part, RT.IMAGE)
+
+    cx, cy = image.scaled_dimensions(width, height)
+    inline = CT_Inline.new_pic_inline(story_part.next_id, rId, image.filename, cx, cy)
+    run._r.add_drawing(inline)
+    return InlineShape(inline)
+
+
+class _DocxZipWriter:
+    """
+    Stand-in for python-docx's zip package writer that picks the compression
+    per part according to a save_docx profile.
+    """
+
+    def __init__(self, pkg_file, profile):
+        if profile not in ('deflate', 'media', 'fast'):
+            raise ValueError('未知的存檔設定: {}'.format(profile))
+        compression = zipfile.ZIP_STORED if profile == 'fast' else zipfile.ZIP_DEFLATED
+        self._zipf = zipfile.ZipFile(pkg_file, 'w', compression=compression)
+        self._store_media = profile == 'media'
+
+    def write(self, pack_uri, blob):
+        compress_type = None
+        if self._store_media and pack_uri.ext.lower() in STORED_MEDIA_EXTENSIONS:
+            compress_type = zipfile.ZIP_STORED
+        self._zipf.writestr(pack_uri.membername, blob, compress_type=compress_type)
+
+    def close(self):
+        self._zipf.close()
+
+
+@profiling.profiled()
+def save_docx(document, pkg_file, profile='media'):
+    """
+    Saves document to pkg_file (a path or a file-like object) like
+    document.save, with a choice of compression:
+
+    - 'deflate': every part deflated, same as document.save
+    - 'media': PNG/JPEG/GIF media stored as they are, XML parts deflated
+    - 'fast': nothing compressed, for intermediate files that are read back
+      right away
+    """
+    from docx.opc.pkgwriter import PackageWriter
+
+    # PackageWriter 的私有靜態方法，依 environment.yml 鎖定的 python-docx 0.8.11 確認過，
+    # 升級 python-docx 時要重新確認
+    package = document.part.package
+    parts = list(package.parts)
+    for part in parts:
+        part.before_marshal()
+    writer = _DocxZipWriter(pkg_file, profile)
+    try:
+        PackageWriter._write_content_types_stream(writer, parts)
+        PackageWriter._write_pkg_rels(writer, package.rels)
+        PackageWriter._write_parts(writer, parts)
+    finally:
+        writer.close()
+
+
+class PackageComposer:
+    """
+    Concatenates documents made from the same templates at the OPC package
+    level, as a faster alternative to docxcompose.Composer for many
+    image-heavy partials.
+
+    The master is a fresh copy of template_path with an empty body, so its
+    styles, numbering and page layout are used as they are. Each appended
+    body is moved over as XML; relationship IDs are renumbered into the
+    master part, identical media parts are stored once (by SHA1), missing
+    styles and numbering definitions are copied, and drawing/bookmark IDs are
+    renumbered to stay unique. Headers and footers are dropped, matching the
+    output of the Composer path.
+    """
+
+    def __init__(self, template_path='templates/baseline.docx'):
+        from docx.opc.constants import RELATIONSHIP_TYPE as RT
+        from docx.oxml.ns import qn
+
+        self.document = load_template(template_path)
+        self.part = self.document.part
+        body = self.document.element.body
+        self._sectPr = body.sectPr
+        for element in list(body):
+            if element is not self._sectPr:
+                body.remove(element)
+
+        # 原本的流程以空白文件為主文件，沒有頁首頁尾，這裡保持一致
+        for reference in self._sectPr.findall(qn('w:headerReference')) + self._sectPr.findall(qn('w:footerReference')):
+            rId = reference.get(qn('r:id'))
+            self._sectPr.remove(reference)
+            self.part.drop_rel(rId)
+        title_pg = self._sectPr.find(qn('w:titlePg'))
+        if title_pg is not None:
+            self._sectPr.remove(title_pg)
+
+        # 範本內文的圖片已隨內文清掉，解除關聯後才不會留在輸出中
+        for rId, rel in list(self.part.rels.items()):
+            if rel.reltype == RT.IMAGE:
+                self.part.drop_rel(rId)
+        self._media = {}
+        self._next_image_number = 1
+
+        styles = self.document.styles.element
+        self._styles = styles
+        self._style_ids = {style.get(qn('w:styleId')) for style in styles.findall(qn('w:style'))}
+        self._numbering = None
+        self._next_docPr_id = 1
+        self._next_bookmark_id = 0
+
+    def append(self, doc, consume=False):
+        """
+        Appends the body of doc (see open_docx for the accepted types). A
+        Document passed in is left untouched unless consume is set, in which
+        case its body elements are moved instead of copied.
+        """
+        from copy import deepcopy
+        from docx.oxml.ns import qn
+
+        doc, owned = open_docx(doc)
+        copy_element = (lambda element: element) if owned or consume else deepcopy
+
+        elements = [copy_element(element) for element in doc.element.body
+                    if element.tag != qn('w:sectPr')]
+        rId_map = {}
+        for element in elements:
+            self._strip_section_references(element)
+            self._remap_relationships(element, doc.part, rId_map)
+            self._copy_missing_styles(element, doc)
+            self._copy_missing_numbering(element, doc)
+            self._renumber_ids(element)
+            self._sectPr.addprevious(element)
+
+    def save(self, path, profile='media'):
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        save_docx(self.document, path, profile)
+
+    @staticmethod
+    def _strip_section_references(element):
+        # 段落內的分節設定也可能指向頁首頁尾
+        for reference in element.xpath('.//w:sectPr/w:headerReference | .//w:sectPr/w:footerReference'):
+            reference.getparent().remove(reference)
+
+    def _remap_relationships(self, element, source_part, rId_map):
+        from docx.oxml.ns import nsmap
+
+        r_namespace = '{%s}' % nsmap['r']
+        for node in element.xpath('descendant-or-self::*[@r:*]'):
+            for name, rId in node.attrib.items():
+                if not name.startswith(r_namespace):
+                    continue
+                new_rId = rId_map.get(rId)
+                if new_rId is None:
+                    new_rId = rId_map[rId] = self._relate(source_part.rels[rId])
+                node.set(name, new_rId)
+
+    def _relate(self, rel):
+        from docx.opc.constants import RELATIONSHIP_TYPE as RT
+        from docx.opc.packuri import PackURI
+        from docx.parts.image import ImagePart
+
+        if rel.is_external:
+            return self.part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+        if rel.reltype != RT.IMAGE:
+            raise ValueError('PackageComposer 不支援的關聯類型 {}，請改用 engine="composer"'.format(rel.reltype))
+
+        source = rel.target_part
+        sha1 = hashlib.sha1(source.blob).hexdigest()
+        image_part = self._media.get(sha1)
+        if image_part is None:
+            partname = PackURI('/word/media/image%d.%s' % (self._next_image_number, source.partname.ext))
+            self._next_image_number += 1
+            image_part = self._media[sha1] = ImagePart(partname, source.content_type, source.blob)
+        return self.part.relate_to(image_part, RT.IMAGE)
+
+    def _copy_missing_styles(self, element, doc):
+        from copy import deepcopy
+
+        pending = set(element.xpath('.//w:pStyle/@w:val | .//w:rStyle/@w:val | .//w:tblStyle/@w:val'))
+        source_styles = None
+        while pending:
+            style_id = pending.pop()
+            if style_id in self._style_ids:
+                continue
+            if source_styles is None:
+                source_styles = doc.styles.element
+            style = source_styles.get_by_id(style_id)
+            if style is None:
+                continue
+            self._styles.append(deepcopy(style))
+            self._style_ids.add(style_id)
+            # 連同所依據的樣式一起複製
+            pending.update(style.xpath('w:basedOn/@w:val | w:link/@w:val | w:next/@w:val'))
+
+    def _copy_missing_numbering(self, element, doc):
+        """
+        Partials made from the same template share their numbering
+        definitions, so only numIds unknown to the master are copied (with
+        new ids).
+        """
+        from copy import deepcopy
+        from docx.oxml.ns import qn
+
+        num_ids = set(element.xpath('.//w:numPr/w:numId/@w:val'))
+        if not num_ids:
+            return
+        if self._numbering is None:
+            self._numbering = self.part.numbering_part.element
+        numbering = self._numbering
+        known = set(numbering.xpath('w:num/@w:numId'))
+        missing = [num_id for num_id in num_ids if num_id not in known and num_id != '0']
+        if not missing:
+            return
+
+        source = doc.part.numbering_part.element
+        abstract_ids = [int(x) for x in numbering.xpath('w:abstractNum/@w:abstractNumId')]
+        next_abstract_id = max(abstract_ids, default=-1) + 1
+        new_num_ids = {}
+        for num_id in missing:
+            num = source.num_having_numId(int(num_id))
+            abstract_id = num.abstractNumId.val
+            abstract = deepcopy(source.xpath('w:abstractNum[@w:abstractNumId="%d"]' % abstract_id)[0])
+            abstract.set(qn('w:abstractNumId'), str(next_abstract_id))
+            # abstractNum 必須排在所有 num 之前
+            first_num = numbering.find(qn('w:num'))
+            if first_num is not None:
+                first_num.addprevious(abstract)
+            else:
+                numbering.append(abstract)
+            new_num = numbering.add_num(next_abstract_id)
+            new_num_ids[num_id] = str(new_num.numId)
+            next_abstract_id += 1
+
+        for node in element.xpath('.//w:numPr/w:numId'):
+            val = node.get(qn('w:val'))
+            if val in new_num_ids:
+                node.set(qn('w:val'), new_num_ids[val])
+
+    def _renumber_ids(self, element):
+        from docx.oxml.ns import qn
+
+        for docPr in element.xpath('.//wp:docPr'):
+            docPr.set('id', str(self._next_docPr_id))
+            self._next_docPr_id += 1
+
+        bookmark_ids = {}
+        for node in element.xpath('.//w:bookmarkStart | .//w:bookmarkEnd'):
+            old_id = node.get(qn('w:id'))
+            new_id = bookmark_ids.get(old_id)
+            if new_id is None:
+                new_id = bookmark_ids[old_id] = str(self._next_bookmark_id)
+                self._next_bookmark_id += 1
+            node.set(qn('w:id'), new_id)
+
+
+def group_items(items, group_size):
+    """
+    Splits items into consecutive groups of group_size, e.g. charts per
+    report page. Always returns at least one (possibly empty) group.
+    """
+    groups = [[]]
+    for item in items:
+        if len(groups[-1]) == group_size:
+            groups.append([item])
+        else:
+            groups[-1].append(item)
+    return groups
+
+
+def map_in_order(func, jobs, workers=1):
+    """
+    Returns [func(*job) for job in jobs], computed in a pool of `workers`
+    processes when more than one. Results keep the order of jobs whatever
+    order they finish in. func must be defined at module level.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [func(*job) for job in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        # 開啟 --profile 時，worker 的紀錄隨結果一起傳回
+        if profiling.enabled():
+            futures = [executor.submit(profiling.run_profiled, func, *job) for job in jobs]
+        else:
+            futures = [executor.submit(func, *job) for job in jobs]
+        for future in futures:
+            result = future.result()
+            if profiling.enabled():
+                result, events = result
+                profiling.add_events(events)
+            results.append(result)
+    return results
+
+
+def open_docx(doc):
+    """
+    Accepts a path, the bytes of a .docx file or a Document, and returns
+    (Document, owned) where owned tells whether the Document was opened here.
+    """
+    from docx import Document
+
+    if isinstance(doc, (str, os.PathLike)):
+        return Document(doc), True
+    if isinstance(doc, (bytes, bytearray)):
+        return Document(io.BytesIO(doc)), True
+    return doc, False
+
+
+def docx_bytes(document):
+    """
+    Serializes a Document to the bytes of a .docx file, e.g. to send it back
+    from a worker process.
+    """
+    stream = io.BytesIO()
+    save_docx(document, stream, profile='fast')
+    return stream.getvalue()
+
+
+def save_partials(documents, directory, prefix):
+    """
+    Saves each document as <directory>/<prefix>-N.docx for debugging while
+    passing it on unchanged, so it can wrap the iterable given to
+    concatenate_docx.
+    """
+    pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+    for doc_index, document in enumerate(documents):
+        save_docx(document, os.path.join(directory, '{}-{}.docx'.format(prefix, doc_index)), profile='fast')
+        yield document
+
+
+def concatenate_docx(docs, output_docx_path, engine='composer'):
+    """
+    Concatenates docs into output_docx_path with the styles and page layout
+    of the baseline template. docs is an iterable of paths, .docx bytes or
+    Document objects (see open_docx); it may be a generator, in which case
+    each document is appended as soon as it is produced. Document objects
+    may be emptied along the way. engine is 'composer' (docxcompose) or
+    'package' (PackageComposer).
+    """
+    if engine == 'package':
+        composer = PackageComposer('templates/baseline.docx')
+        for doc in docs:
+            with profiling.stage('concatenate_docx'):
+                composer.append(doc, consume=True)
+        composer.save(output_docx_path)
+        return
+    if engine != 'composer':
+        raise ValueError('未知的合併方式: {}'.format(engine))
 
-def concatenate_docx(doc_paths, output_docx_path):
     from docxcompose.composer import Composer
     from docx import Document as Document_compose
 
     # Create a new document to act as the master, then copy styles and page layout from the template.
     master = Document_compose()
-    template = Document_compose('templates/baseline.docx')
+    template = load_template('templates/baseline.docx')
 
     # Copy styles from template to master
     master_styles_element = master.styles.element
@@ -27,8 +426,9 @@ def concatenate_docx(doc_paths, output_docx_path):
 
     composer = Composer(master)
 
-    for doc_path in doc_paths:
-        composer.append(Document_compose(doc_path))
+    for doc in docs:
+        with profiling.stage('concatenate_docx'):
+            composer.append(open_docx(doc)[0])
 
     pathlib.Path(output_docx_path).parent.mkdir(parents=True, exist_ok=True)
-    composer.save(output_docx_path)
\ No newline at end of file
+    save_docx(composer.doc, output_docx_path)
\ No newline at end of file